@@ -0,0 +1,281 @@
+# backend/adherence.py
+
+from datetime import date, datetime, timedelta
+from pymongo import ReturnDocument
+
+import driver
+from analytics import calorie_goal
+from indexes import replace_collection
+
+# --- Materialized goal adherence ---
+# One `adherence` document per user per month holds every logged day's
+# calorie total and two 31-bit day bitmaps (bit d-1 = day d):
+#   {user_id, month: 'YYYY-MM', calories: {'DD': total}, logged, success,
+#    goal: <goal the bitmaps were computed with>, rev: <write counter>}
+# and one `adherence_streaks` document per user (_id = user_id) holds the
+# current and longest run of consecutive on-goal days. The food log routes
+# pass the day's updated daily_totals document to `record_days`; a goal
+# change in update_profile calls `reclassify`. The month calendar, progress
+# check and /api/streaks then read one or two small documents. The
+# `_async` functions are shared with the Motor routes; see driver.py.
+# `python db.py rebuild-totals` backfills both collections.
+
+DATE_FORMAT = '%Y-%m-%d'
+MONTH_FORMAT = '%Y-%m'
+RECLASSIFY_RETRIES = 10
+
+
+def day_update(day):
+    """The `adherence` update storing one daily_totals document's day."""
+    field = f"calories.{day['date'][8:10]}"
+    if (day.get('entry_count') or 0) > 0:
+        return {'$set': {field: day.get('total_calories') or 0}, '$inc': {'rev': 1}}
+    return {'$unset': {field: ''}, '$inc': {'rev': 1}}
+
+
+def bitmaps(calories, goal):
+    """(logged, success) day bitmaps for a month's {'DD': total} map."""
+    logged = success = 0
+    for dd, total in calories.items():
+        bit = 1 << (int(dd) - 1)
+        logged |= bit
+        if total <= goal:
+            success |= bit
+    return logged, success
+
+
+def status_update(doc, goal):
+    """
+    (filter, update) writing the bitmaps of `doc` for `goal`, or None if they
+    are already current. The filter only matches the `rev` they were computed
+    from; if a newer write got in between, its own status update wins.
+    """
+    logged, success = bitmaps(doc.get('calories') or {}, goal)
+    if (doc.get('logged'), doc.get('success'), doc.get('goal')) == (logged, success, goal):
+        return None
+    return (
+        {'_id': doc['_id'], 'rev': doc.get('rev')},
+        {'$set': {'logged': logged, 'success': success, 'goal': goal}},
+    )
+
+
+def _days(month, mask):
+    """Yields the date of every bit set in `mask`, in order."""
+    year, month_number = int(month[:4]), int(month[5:7])
+    while mask:
+        low = mask & -mask
+        yield date(year, month_number, low.bit_length())
+        mask ^= low
+
+
+def compute_streaks(months):
+    """The adherence_streaks fields, from every month document sorted by month."""
+    run = longest = 0
+    run_end = longest_end = last_failure = None
+    for doc in months:
+        success = doc.get('success') or 0
+        for day in _days(doc['month'], doc.get('logged') or 0):
+            if not success & (1 << (day.day - 1)):
+                last_failure = day
+                continue
+            run = run + 1 if run_end is not None and (day - run_end).days == 1 else 1
+            run_end = day
+            if run > longest:
+                longest, longest_end = run, day
+    as_str = lambda day: day.strftime(DATE_FORMAT) if day else None
+    return {
+        'current': run,
+        'current_end': as_str(run_end),
+        'longest': longest,
+        'longest_end': as_str(longest_end),
+        'last_failure': as_str(last_failure),
+    }
+
+
+# --- Writes ---
+async def refresh_streaks_async(db, user_id):
+    months = await driver.to_list(db.adherence.find(
+        {'user_id': user_id}, {'_id': 0, 'month': 1, 'logged': 1, 'success': 1}
+    ).sort('month', 1))
+    streaks = compute_streaks(months)
+    await driver.result(db.adherence_streaks.update_one({'_id': user_id}, {'$set': streaks}, upsert=True))
+    return streaks
+
+
+def refresh_streaks(db, user_id):
+    return driver.run(refresh_streaks_async(db, user_id))
+
+
+async def record_days_async(db, user_id, goal, days):
+    """
+    Stores the calorie totals of `days` (updated daily_totals documents) and
+    refreshes the streaks if any month's bitmaps changed: a day turning on or
+    off goal, but also an off-goal day logged or removed, which moves
+    `last_failure` and can end the current run.
+    """
+    streaks_changed = False
+    for day in days:
+        doc = await driver.result(db.adherence.find_one_and_update(
+            {'user_id': user_id, 'month': day['date'][:7]},
+            day_update(day),
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        ))
+        update = status_update(doc, goal)
+        if update:
+            await driver.result(db.adherence.update_one(*update))
+            streaks_changed = True
+    if streaks_changed:
+        await refresh_streaks_async(db, user_id)
+
+
+def record_days(db, user_id, goal, days):
+    driver.run(record_days_async(db, user_id, goal, days))
+
+
+def record_many_days(db, user_id, goal, days):
+    """
+    record_days for many days (a bulk import): one update per month instead
+    of per day, and the streaks refreshed at most once.
+    """
+    months = {}
+    for day in days:
+        update = months.setdefault(day['date'][:7], {'$inc': {'rev': 1}})
+        for operator, fields in day_update(day).items():
+            if operator != '$inc':
+                update.setdefault(operator, {}).update(fields)
+    streaks_changed = False
+    for month, update in months.items():
+        doc = db.adherence.find_one_and_update(
+            {'user_id': user_id, 'month': month},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        status = status_update(doc, goal)
+        if status:
+            db.adherence.update_one(*status)
+            streaks_changed = True
+    if streaks_changed:
+        refresh_streaks(db, user_id)
+
+
+def reclassify(db, user_id, goal):
+    """Recomputes every month's bitmaps for a new calorie goal."""
+    for doc in db.adherence.find({'user_id': user_id}):
+        for _ in range(RECLASSIFY_RETRIES):
+            update = status_update(doc, goal)
+            if update is None or db.adherence.update_one(*update).modified_count:
+                break
+            doc = db.adherence.find_one({'_id': doc['_id']})
+    refresh_streaks(db, user_id)
+
+
+def rebuild(db):
+    """
+    Recomputes both collections from daily_totals and each user's goal.
+    Used to backfill existing data and to repair drift.
+    """
+    goals = {user['_id']: calorie_goal(user) for user in db.users.find({}, {'profile': 1})}
+    months = {}
+    for day in db.daily_totals.find({'entry_count': {'$gt': 0}}):
+        key = (day['user_id'], day['date'][:7])
+        doc = months.setdefault(key, {'user_id': key[0], 'month': key[1], 'calories': {}, 'rev': 0})
+        doc['calories'][day['date'][8:10]] = day.get('total_calories') or 0
+
+    per_user = {}
+    for (user_id, _), doc in sorted(months.items(), key=lambda item: item[0][1]):
+        goal = goals.get(user_id, calorie_goal({}))
+        doc['logged'], doc['success'] = bitmaps(doc['calories'], goal)
+        doc['goal'] = goal
+        per_user.setdefault(user_id, []).append(doc)
+
+    count = replace_collection(db, 'adherence', months.values())
+    replace_collection(db, 'adherence_streaks', (
+        {'_id': user_id, **compute_streaks(user_months)} for user_id, user_months in per_user.items()
+    ))
+    return count
+
+
+# --- Reads ---
+def month_statuses(doc, goal):
+    """{date: 'success' | 'failure'} for every logged day of a month document."""
+    if not doc:
+        return {}
+    if doc.get('goal') == goal and 'logged' in doc:
+        logged, success = doc['logged'], doc.get('success') or 0
+    else:
+        # Written before the goal changed and not yet reclassified
+        logged, success = bitmaps(doc.get('calories') or {}, goal)
+    return {
+        day.strftime(DATE_FORMAT): "success" if success & (1 << (day.day - 1)) else "failure"
+        for day in _days(doc['month'], logged)
+    }
+
+
+async def get_month_async(db, user, year, month):
+    doc = await driver.result(db.adherence.find_one({'user_id': user['_id'], 'month': f"{year}-{month:02d}"}))
+    return month_statuses(doc, calorie_goal(user))
+
+
+def get_month(db, user, year, month):
+    return driver.run(get_month_async(db, user, year, month))
+
+
+def window_months(today, days):
+    start = today - timedelta(days=days)
+    return start, sorted({start.strftime(MONTH_FORMAT), today.strftime(MONTH_FORMAT)})
+
+
+def window_average(docs, start, today):
+    """Mean daily calories over the logged days from `start` to `today`, or None."""
+    totals = [
+        total
+        for doc in docs
+        for dd, total in (doc.get('calories') or {}).items()
+        if start <= datetime.strptime(f"{doc['month']}-{dd}", DATE_FORMAT).date() <= today
+    ]
+    return sum(totals) / len(totals) if totals else None
+
+
+async def get_week_average_async(db, user_id, today=None, days=7):
+    today = today or date.today()
+    start, months = window_months(today, days)
+    docs = await driver.to_list(
+        db.adherence.find({'user_id': user_id, 'month': {'$in': months}}, {'month': 1, 'calories': 1}))
+    return window_average(docs, start, today)
+
+
+def get_week_average(db, user_id, today=None, days=7):
+    return driver.run(get_week_average_async(db, user_id, today, days))
+
+
+def streaks_response(doc, today=None):
+    """The /api/streaks response; a current run only counts until a day is missed or failed."""
+    doc = doc or {}
+    today = today or date.today()
+    yesterday = (today - timedelta(days=1)).strftime(DATE_FORMAT)
+    current_end = doc.get('current_end')
+    active = (
+        current_end is not None and current_end >= yesterday
+        and (doc.get('last_failure') is None or doc['last_failure'] < current_end)
+    )
+    current = doc.get('current', 0) if active else 0
+    start_of = lambda end, length: (
+        (datetime.strptime(end, DATE_FORMAT) - timedelta(days=length - 1)).strftime(DATE_FORMAT) if length else None
+    )
+    return {
+        "current_streak": current,
+        "current_streak_start": start_of(current_end, current),
+        "longest_streak": doc.get('longest', 0),
+        "longest_streak_start": start_of(doc.get('longest_end'), doc.get('longest', 0)),
+        "longest_streak_end": doc.get('longest_end'),
+    }
+
+
+async def get_streaks_async(db, user_id):
+    return streaks_response(await driver.result(db.adherence_streaks.find_one({'_id': user_id})))
+
+
+def get_streaks(db, user_id):
+    return driver.run(get_streaks_async(db, user_id))
@@ -0,0 +1,281 @@
+# backend/analytics.py
+
+import importlib
+import threading
+from datetime import date, datetime, timedelta
+
+
+class _LazyModule:
+    """
+    Stands in for the module `name` and imports it on first attribute access.
+    The import runs to completion under a lock before any attribute is read,
+    so threads racing the first access never see a half-initialized module.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+
+# numpy takes longer to import than the rest of the app together, and only
+# the trends route needs it; see the startup notes in app.py
+np = _LazyModule('numpy')
+
+# --- Long-range trends (/api/analytics/trends) ---
+# Loads a user's weight logs and daily calorie totals for the whole range in
+# one bulk fetch per collection, lays them out on a daily axis as NumPy
+# arrays (NaN = nothing logged that day) and computes:
+#   * rolling averages of weight and net calories over `window` days
+#   * trend weight: an exponential moving average of the weigh-ins
+#   * per-week net calories vs. the calorie goal, and an estimated TDEE from
+#     intake and the change in trend weight (KCAL_PER_KG per kg)
+# Daily series longer than `points` are downsampled server-side by averaging
+# equal-width buckets, so a multi-year chart stays a few hundred points.
+
+DATE_FORMAT = '%Y-%m-%d'
+DEFAULT_RANGE_DAYS = 365
+MAX_RANGE_DAYS = 3660
+DEFAULT_POINTS = 200
+MAX_POINTS = 2000
+DEFAULT_WINDOW = 7
+MAX_WINDOW = 90
+DEFAULT_ALPHA = 0.1
+DEFAULT_CALORIE_GOAL = 2000
+KCAL_PER_KG = 7700
+# Weeks with fewer logged days give no TDEE estimate
+MIN_LOGGED_DAYS = 4
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+def preload():
+    """Imports numpy now instead of in the first trends request."""
+    return np.ndarray
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, DATE_FORMAT).date()
+    except ValueError:
+        raise AnalyticsError(f"'{name}' must be a date (YYYY-MM-DD)")
+
+
+def _parse_number(args, name, cast, default, low, high):
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        value = cast(value)
+    except ValueError:
+        raise AnalyticsError(f"'{name}' must be a number")
+    if not low <= value <= high:
+        raise AnalyticsError(f"'{name}' must be between {low} and {high}")
+    return value
+
+
+def parse_params(args):
+    """Reads from/to/points/window/alpha from the query string."""
+    end = _parse_date(args['to'], 'to') if args.get('to') else date.today()
+    start = _parse_date(args['from'], 'from') if args.get('from') else end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    days = (end - start).days + 1
+    if days < 1:
+        raise AnalyticsError("'from' must not be after 'to'")
+    if days > MAX_RANGE_DAYS:
+        raise AnalyticsError(f"At most {MAX_RANGE_DAYS} days per request")
+    return {
+        'start': start,
+        'end': end,
+        'points': _parse_number(args, 'points', int, DEFAULT_POINTS, 2, MAX_POINTS),
+        'window': _parse_number(args, 'window', int, DEFAULT_WINDOW, 1, MAX_WINDOW),
+        'alpha': _parse_number(args, 'alpha', float, DEFAULT_ALPHA, 0.01, 1.0),
+    }
+
+
+def calorie_goal(user):
+    # Registration stores daily_calorie_goal; /api/profile edits daily_calories_goal
+    profile = user.get('profile') or {}
+    return profile.get('daily_calories_goal') or profile.get('daily_calorie_goal') or DEFAULT_CALORIE_GOAL
+
+
+# --- Loading ---
+def _day_index(docs, start):
+    return (np.array([doc['date'] for doc in docs], dtype='datetime64[D]') - np.datetime64(start, 'D')).astype(int)
+
+
+def load_series(db, user_id, start, end):
+    """Returns (weight, intake, burned) arrays with one element per day."""
+    n = (end - start).days + 1
+    date_range = {'$gte': start.strftime(DATE_FORMAT), '$lte': end.strftime(DATE_FORMAT)}
+    weights = list(db.weight_logs.find(
+        {'user_id': user_id, 'date': date_range}, {'_id': 0, 'date': 1, 'weight': 1}
+    ).batch_size(MAX_RANGE_DAYS))
+    totals = list(db.daily_totals.find(
+        {'user_id': user_id, 'date': date_range},
+        {'_id': 0, 'date': 1, 'total_calories': 1, 'calories_burned': 1, 'entry_count': 1}
+    ).batch_size(MAX_RANGE_DAYS))
+
+    weight = np.full(n, np.nan)
+    if weights:
+        weight[_day_index(weights, start)] = [doc.get('weight', np.nan) for doc in weights]
+
+    intake = np.full(n, np.nan)
+    burned = np.zeros(n)
+    if totals:
+        index = _day_index(totals, start)
+        logged = np.array([(doc.get('entry_count') or 0) > 0 for doc in totals])
+        intake[index[logged]] = [doc.get('total_calories') or 0 for doc, ok in zip(totals, logged) if ok]
+        burned[index] = [doc.get('calories_burned') or 0 for doc in totals]
+    return weight, intake, burned
+
+
+# --- Computations (all NaN-aware) ---
+def rolling_mean(values, window):
+    """Trailing mean over `window` days of the days that have a value."""
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    window_counts = counts[ends] - counts[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(window_counts > 0, (sums[ends] - sums[starts]) / window_counts, np.nan)
+
+
+def trend_weight(weight, alpha):
+    """
+    Exponential moving average of the weigh-ins, carried forward over days
+    without one (and NaN before the first).
+    """
+    observed = np.flatnonzero(~np.isnan(weight))
+    trend = np.full(len(weight), np.nan)
+    if not observed.size:
+        return trend
+    smoothed = np.empty(observed.size)
+    value = weight[observed[0]]
+    # The recurrence is sequential, but only runs once per weigh-in
+    for k, w in enumerate(weight[observed].tolist()):
+        value += alpha * (w - value)
+        smoothed[k] = value
+    last = np.searchsorted(observed, np.arange(len(weight)), side='right') - 1
+    return np.where(last >= 0, smoothed[np.maximum(last, 0)], np.nan)
+
+
+def weekly(start, intake, burned, trend, goal):
+    """Per Monday-based week: logged days, mean net calories, balance vs goal, TDEE."""
+    n = len(intake)
+    offset = start.weekday()
+    week = (np.arange(n) + offset) // 7
+    weeks = week[-1] + 1
+    logged = ~np.isnan(intake)
+    days_logged = np.bincount(week, weights=logged, minlength=weeks)
+    intake_sum = np.bincount(week, weights=np.where(logged, intake, 0.0), minlength=weeks)
+    burned_sum = np.bincount(week, weights=np.where(logged, burned, 0.0), minlength=weeks)
+
+    # Trend change from the day before each week to its last day
+    first_day = np.maximum(np.arange(weeks) * 7 - offset, 0)
+    last_day = np.minimum(np.arange(1, weeks + 1) * 7 - offset, n) - 1
+    before = trend[np.maximum(first_day - 1, 0)]
+    change = trend[last_day] - before
+    span = last_day - np.maximum(first_day - 1, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_intake = np.where(days_logged > 0, intake_sum / days_logged, np.nan)
+        avg_net = np.where(days_logged > 0, (intake_sum - burned_sum) / days_logged, np.nan)
+        tdee = np.where(
+            (days_logged >= MIN_LOGGED_DAYS) & (span > 0),
+            avg_intake - change * KCAL_PER_KG / np.maximum(span, 1), np.nan
+        )
+    return {
+        'week_start': [(start + timedelta(days=int(day))).strftime(DATE_FORMAT) for day in first_day],
+        'days_logged': days_logged.astype(int).tolist(),
+        'avg_net_calories': _to_list(avg_net),
+        # Positive: under the goal (a deficit)
+        'deficit': _to_list(goal * days_logged - (intake_sum - burned_sum)),
+        'trend_change': _to_list(change, 3),
+        'tdee': _to_list(tdee, 0),
+    }
+
+
+def downsample(values, points):
+    """Averages `values` into `points` equal-width buckets (NaN-aware)."""
+    if len(values) <= points:
+        return values
+    edges = np.linspace(0, len(values), points + 1).astype(int)[:-1]
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), edges)
+    counts = np.add.reduceat(valid.astype(int), edges)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _to_list(values, digits=2):
+    return [None if v != v else v for v in np.round(values, digits).tolist()]
+
+
+def _overall_tdee(intake, trend):
+    logged = ~np.isnan(intake)
+    observed = np.flatnonzero(~np.isnan(trend))
+    if logged.sum() < MIN_LOGGED_DAYS or observed.size < 2:
+        return None
+    first, last = observed[0], observed[-1]
+    change = trend[last] - trend[first]
+    return round(float(intake[logged].mean() - change * KCAL_PER_KG / (last - first)))
+
+
+def trends(db, user, params):
+    series = load_series(db, user['_id'], params['start'], params['end'])
+    return compute(series, user, params)
+
+
+def compute(series, user, params):
+    """Builds the /api/analytics/trends response from load_series arrays."""
+    start, end = params['start'], params['end']
+    weight, intake, burned = series
+    net = np.where(np.isnan(intake), np.nan, intake - burned)
+    trend = trend_weight(weight, params['alpha'])
+    goal = calorie_goal(user)
+
+    n = len(weight)
+    points = min(n, params['points'])
+    dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    labels = dates[np.linspace(0, n, points + 1).astype(int)[:-1]] if n > points else dates
+
+    observed = np.flatnonzero(~np.isnan(trend))
+    return {
+        'from': start.strftime(DATE_FORMAT),
+        'to': end.strftime(DATE_FORMAT),
+        'days': n,
+        'points': points,
+        'window': params['window'],
+        'alpha': params['alpha'],
+        'calorie_goal': goal,
+        'series': {
+            'date': labels.astype(str).tolist(),
+            'weight': _to_list(downsample(weight, points)),
+            'weight_avg': _to_list(downsample(rolling_mean(weight, params['window']), points)),
+            'trend_weight': _to_list(downsample(trend, points)),
+            'net_calories': _to_list(downsample(net, points), 0),
+            'net_calories_avg': _to_list(downsample(rolling_mean(net, params['window']), points), 0),
+        },
+        'weekly': weekly(start, intake, burned, trend, goal),
+        'summary': {
+            'days_logged': int((~np.isnan(intake)).sum()),
+            'weigh_ins': int((~np.isnan(weight)).sum()),
+            'trend_start': round(float(trend[observed[0]]), 2) if observed.size else None,
+            'trend_end': round(float(trend[observed[-1]]), 2) if observed.size else None,
+            'avg_net_calories': round(float(np.nanmean(net)), 0) if (~np.isnan(net)).any() else None,
+            'tdee': _overall_tdee(intake, trend),
+        },
+    }
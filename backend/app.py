@@ -1,68 +1,401 @@
 # backend/app.py
 
+import time
+
+# Taken before the other imports; see IMPORT_BUDGET_MS
+_import_started = time.perf_counter()
+
+import contextvars
+import logging
 import os
-from flask import Flask, request, jsonify
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pymongo
+from flask import Blueprint, Flask, Response, current_app, request, jsonify
 from flask_cors import CORS
-from pymongo import MongoClient
-from bson import ObjectId, json_util
-from flask_bcrypt import Bcrypt
-from datetime import datetime, timedelta
-import json
-import jwt
+from bson import ObjectId
+from bson.errors import InvalidId
 from functools import wraps
 from dotenv import load_dotenv
+import db as mongo
+from indexes import ensure_indexes
+from food_search import FoodSearchIndex
+from food_cache import FoodCache, popular_foods
+import log_store
+import pagination
+from json_provider import BSONJSONProvider
+from user_cache import UserCache
+import sync
+import etag
+import adherence
+import analytics
+import progress
+import metrics
+import tokens
+import write_behind
+import history
+import driver
+import handlers
+from hashing import HashingBusy, PasswordHasher
+
+logger = logging.getLogger(__name__)
+
+# --- Startup ---
+# Importing this module only defines the API: the routes live on the `api`
+# blueprint and create_app() builds a Flask app around it, along with the
+# services (caches, hasher, token service, write-behind queue) on its first
+# call in the process. `app` is the default app, created on first access
+# (gunicorn's app:app, asgi.py, scripts). None of this touches the network:
+# the Mongo client connects on first use (db.py), and the rest of the
+# startup work runs once per process, either from gunicorn's
+# post_worker_init hook before the worker takes requests (prewarm(), on
+# unless PREWARM=0; see gunicorn.conf.py) or in a background thread on the
+# process's first request:
+#   * mongo_pool: connects and opens PREWARM_CONNECTIONS pooled connections
+#   * indexes: ensure_indexes
+#   * revocations: loads the token revocation list, then keeps it synced
+#   * password_hashing: starts the bcrypt worker processes
+#   * analytics: imports numpy, which analytics.py otherwise loads on use
+# The cache steps read in proportion to the catalog, so they run in a
+# background thread once the worker serves, instead of holding up its boot:
+#   * food_index: loads food search (a search before then loads it itself)
+#   * food_cache: loads the most logged foods stored by rebuild-totals
+# Mongo steps share one PREWARM_TIMEOUT budget, kept under gunicorn's
+# worker timeout; a failing step is logged and left to first use.
+#
+# `startup_profile` records the import, create_app and per-step times
+# ("startup" in /api/cache/stats). Importing this module should take less
+# than IMPORT_BUDGET_MS; create_app logs a warning when it did not, and
+# benchmarks/startup.py shows where the time went.
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 1000))
+PREWARM_TIMEOUT = float(os.getenv("PREWARM_TIMEOUT", 20))
+PREWARM_CONNECTIONS = int(os.getenv("PREWARM_CONNECTIONS", os.getenv("GUNICORN_THREADS", 4)))
+startup_profile = {'import_ms': None, 'create_app_ms': None, 'prewarm_ms': {}, 'prewarmed': False}
+# Process that ran (or is running) the startup steps
+_started_pid = None
+_start_lock = threading.Lock()
 
-# Load environment variables
-load_dotenv()
-
-app = Flask(__name__)
-# Allow requests from your React app's origin
-# CORS(app, resources={r"/api/*": {"origins": "http://localhost:5173"}})
-CORS(app)
-# --- FIX: ADD THE SECRET KEY TO THE APP CONFIG ---
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-if not app.config['SECRET_KEY']:
-    raise ValueError("No SECRET_KEY set for Flask application")
 # --- Database Connection ---
 MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = "calorie_tracker_db"
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
+DB_NAME = os.getenv("DB_NAME", "calorie_tracker_db")
+# Mongo commands are attributed to requests for /metrics; see metrics.py.
+# The client is created per process on first use, with pool, timeout and
+# write concern settings from the environment; see db.py
+connections = mongo.Connections(MONGO_URI, event_listeners=[metrics.command_listener, metrics.pool_listener])
+db = connections.database(DB_NAME)
+# Read-only calendar, calorie and trend queries, served by secondaries
+analytics_db = connections.analytics_database(DB_NAME)
 users_collection = db['users']
-bcrypt = Bcrypt(app)
 
-# --- Helper to serialize MongoDB ObjectId ---
-def parse_json(data):
-    return json.loads(json_util.dumps(data))
+api = Blueprint('api', __name__)
+
+# --- Services ---
+# Built by init_services (through create_app)
+food_index = None
+food_cache = None
+# Food log entries are read and written through a LogStore; see log_store.py
+logs = None
+user_cache = None
+write_queue = None
+hasher = None
+token_service = None
+# Runs independent reads of one request in parallel (the progress bundle)
+fanout = None
+# What the routes shared with asgi.py run against; see handlers.py
+services = None
+FOOD_CACHE_WARM = int(os.getenv("FOOD_CACHE_WARM", 1000))
+# Weight and activity edits are coalesced and written in the background when
+# WRITE_BEHIND_MS is set; see write_behind.py
+WRITE_BEHIND_MS = int(os.getenv("WRITE_BEHIND_MS", 0))
+REVOCATION_SYNC_SECONDS = int(os.getenv("REVOCATION_SYNC_SECONDS", tokens.REVOCATION_SYNC_SECONDS))
+
+
+def invalidate_users(user_ids):
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+
+
+def init_services(config):
+    """Builds the services once per process; `config` supplies SECRET_KEY."""
+    global food_index, food_cache, logs, user_cache, write_queue, hasher, token_service, fanout, services
+    if token_service is not None:
+        return
+    food_index = FoodSearchIndex(db.foods)
+    food_cache = FoodCache(db.foods, maxsize=int(os.getenv("FOOD_CACHE_SIZE", 5000)))
+    logs = log_store.create(db, os.getenv("LOG_STORAGE", "documents"), food_cache)
+    user_cache = UserCache(
+        maxsize=int(os.getenv("USER_CACHE_SIZE", 10000)),
+        ttl=int(os.getenv("USER_CACHE_TTL", 60)),
+        redis_url=os.getenv("USER_CACHE_REDIS_URL"),
+    )
+    write_queue = write_behind.WriteBehind(
+        db,
+        window_ms=WRITE_BEHIND_MS,
+        max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", write_behind.MAX_PENDING)),
+        on_users_written=invalidate_users,
+    ) if WRITE_BEHIND_MS > 0 else None
+    # bcrypt runs in a small bounded process pool per worker; see hashing.py
+    hasher = PasswordHasher(
+        rounds=int(os.getenv("BCRYPT_LOG_ROUNDS", 12)),
+        workers=int(os.environ["HASH_WORKERS"]) if os.getenv("HASH_WORKERS") else None,
+        max_pending=int(os.getenv("HASH_QUEUE_SIZE", 0)) or None,
+        observer=metrics.observe_bcrypt,
+    )
+    # Short-lived access tokens plus refresh tokens; see tokens.py
+    token_service = tokens.TokenService(
+        db, config['SECRET_KEY'],
+        access_ttl=int(os.getenv("ACCESS_TOKEN_TTL", tokens.ACCESS_TOKEN_TTL)),
+        refresh_days=int(os.getenv("REFRESH_TOKEN_DAYS", tokens.REFRESH_TOKEN_DAYS)),
+    )
+    fanout = ThreadPoolExecutor(max_workers=int(os.getenv("FANOUT_WORKERS", 8)), thread_name_prefix='fanout')
+    services = handlers.Services(db, analytics_db, logs, food_cache, user_cache, token_service, write_queue,
+                                 load_user)
+
+
+def create_app(config=None):
+    """
+    A Flask app serving the API. `config` overrides settings read from the
+    environment (SECRET_KEY); the services are shared by every app of the
+    process.
+    """
+    began = time.perf_counter()
+    # Load environment variables
+    load_dotenv()
+    app = Flask(__name__)
+    # Encodes ObjectId/datetime natively, so routes can jsonify raw documents
+    app.json = BSONJSONProvider(app)
+    # Allow requests from your React app's origin
+    # CORS(app, resources={r"/api/*": {"origins": "http://localhost:5173"}})
+    CORS(app, expose_headers=[pagination.NEXT_CURSOR_HEADER, tokens.RENEWED_TOKEN_HEADER,
+                              tokens.RENEWED_REFRESH_TOKEN_HEADER])
+    # --- FIX: ADD THE SECRET KEY TO THE APP CONFIG ---
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config.update(config or {})
+    if not app.config['SECRET_KEY']:
+        raise ValueError("No SECRET_KEY set for Flask application")
+    init_services(app.config)
+    metrics.install(app)
+    app.register_blueprint(api)
+    startup_profile['create_app_ms'] = round((time.perf_counter() - began) * 1000, 1)
+    if startup_profile['import_ms'] > IMPORT_BUDGET_MS:
+        logger.warning("Importing app took %.0f ms, over the %.0f ms budget (IMPORT_BUDGET_MS); "
+                       "see python -m benchmarks.startup", startup_profile['import_ms'], IMPORT_BUDGET_MS)
+    return app
+
+
+def __getattr__(name):
+    # The default app is created on first access rather than on import
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _prewarm_steps():
+    return [
+        ('mongo_pool', lambda: connections.warm(PREWARM_CONNECTIONS)),
+        ('indexes', lambda: ensure_indexes(db)),
+        ('revocations', token_service.revocations.reload),
+        ('password_hashing', hasher.warm),
+        ('analytics', analytics.preload),
+    ]
+
+
+def _cache_steps():
+    return [
+        ('food_index', food_index.load),
+        ('food_cache', lambda: FOOD_CACHE_WARM > 0 and food_cache.warm(
+            lambda limit: popular_foods(db, limit), FOOD_CACHE_WARM)),
+    ]
+
+
+def _run_steps(steps, timeout, timings):
+    with pymongo.timeout(timeout):
+        for name, step in steps:
+            step_began = time.perf_counter()
+            try:
+                step()
+            except Exception:
+                logger.warning("Startup step %s failed; it will happen on first use", name, exc_info=True)
+            timings[f'{name}_ms'] = round((time.perf_counter() - step_began) * 1000, 1)
+
+
+def prewarm(timeout=PREWARM_TIMEOUT, background=True):
+    """
+    Runs the startup steps in this process now and returns their times, in
+    milliseconds; the cache steps are left running in a background thread
+    (their times are added when they finish) unless `background` is False.
+    Needs the services (create_app) to exist.
+    """
+    global _started_pid
+    with _start_lock:
+        _started_pid = os.getpid()
+    began = time.perf_counter()
+    timings = {}
+    _run_steps(_prewarm_steps(), timeout, timings)
+    token_service.revocations.start(REVOCATION_SYNC_SECONDS)
+    if background:
+        threading.Thread(target=_run_steps, args=(_cache_steps(), timeout, timings),
+                         name='prewarm-caches', daemon=True).start()
+    else:
+        _run_steps(_cache_steps(), timeout, timings)
+    timings['total_ms'] = round((time.perf_counter() - began) * 1000, 1)
+    startup_profile['prewarm_ms'] = timings
+    startup_profile['prewarmed'] = True
+    return timings
+
+
+@api.before_app_request
+def start_process():
+    # Without a prewarm, the process's first request starts the startup steps
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    threading.Thread(target=prewarm, name='prewarm', daemon=True).start()
+
+
+FOOD_FIELDS = ('name', 'type', 'serving_size', 'weight', 'calories', 'macros')
+WEIGHT_LOG_FIELDS = ('date', 'weight')
 
 # --- API Routes ---
 # 0. User Authentication
 # --- Authentication Decorator ---
+def load_user(user_id):
+    return user_cache.get_or_load(user_id, lambda user_id: users_collection.find_one({'_id': user_id}))
+
+
+def authenticate(claims_only=False, flush_writes=True):
+    """
+    (current_user, None) for the request's access token, or (None, error
+    response). With `claims_only` the user is built from the token's claims.
+    With `flush_writes` the user's queued write-behind edits are written
+    first, so the request sees them.
+    """
+    token = request.headers.get('x-access-token')
+    if not token:
+        return None, (jsonify({'message': 'Token is missing!'}), 401)
+
+    try:
+        claims = token_service.verify(token)
+        user_id = tokens.user_id_of(claims)
+        if flush_writes and write_queue is not None and write_queue.has_pending(user_id):
+            write_queue.flush_user(user_id)
+        current_user = tokens.claims_user(claims) if claims_only else None
+        if current_user is None:
+            current_user = load_user(user_id)
+    except tokens.ExpiredToken as e:
+        return None, (jsonify({'message': str(e)}), 401)
+    except tokens.InvalidToken as e:
+        return None, (jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401)
+
+    if not current_user:
+        return None, (jsonify({'message': 'User not found!'}), 401)
+    return current_user, None
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if 'x-access-token' in request.headers:
-            token = request.headers['x-access-token']
+        current_user, error = authenticate()
+        if error:
+            return error
+        return f(current_user, *args, **kwargs)
+    return decorated
 
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
 
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = users_collection.find_one({'_id': ObjectId(data['user_id'])})
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
+def claims_required(f):
+    """
+    token_required for read routes that only use the _id and the fields in
+    the access token (tokens.CLAIM_FIELDS): no user lookup.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        current_user, error = authenticate(claims_only=True)
+        if error:
+            return error
+        return f(current_user, *args, **kwargs)
+    return decorated
+
 
+def write_behind_required(f):
+    """
+    token_required for the routes that queue their writes: the user's
+    earlier queued edits are left in the queue to coalesce with this one.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        current_user, error = authenticate(flush_writes=False)
+        if error:
+            return error
         return f(current_user, *args, **kwargs)
     return decorated
 
 
+def access_token_for(user):
+    return driver.run(handlers.access_token(services, user))
+
+
+def token_response(user, refresh_token):
+    return {
+        'token': access_token_for(user),
+        'refresh_token': refresh_token,
+        'expires_in': token_service.access_ttl,
+    }
+
+
+def renew_access_token(response, user_id):
+    """Sends a token with fresh claims after a write that changed them."""
+    response.headers[tokens.RENEWED_TOKEN_HEADER] = access_token_for(load_user(user_id))
+    return response
+
+
+@api.app_errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = jsonify({'message': 'Server is busy, please try again shortly.'})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+def database_unavailable(e):
+    # An analytics budget ran out, the pool stayed full or no server answered
+    current_app.logger.warning("Database timeout on %s: %s", request.path, e)
+    response = jsonify({'message': 'The database is busy, please try again shortly.'})
+    response.headers['Retry-After'] = '2'
+    return response, 503
+
+for error in mongo.TIMEOUT_ERRORS:
+    api.app_errorhandler(error)(database_unavailable)
+
+def upgrade_password_hash(user, password):
+    """
+    Re-hashes a password stored with an outdated cost factor, in the
+    background, after a successful login. Skipped when the pool is busy;
+    it will be retried on a later login.
+    """
+    if not hasher.needs_rehash(user['password_hash']):
+        return
+    try:
+        future = hasher.hash_async(password)
+    except HashingBusy:
+        return
+
+    def store(done):
+        if done.exception() is None:
+            users_collection.update_one(
+                {'_id': user['_id'], 'password_hash': user['password_hash']},
+                {'$set': {'password_hash': done.result()}}
+            )
+            user_cache.invalidate(user['_id'])
+    future.add_done_callback(store)
+
+
 # --- Routes ---
 
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
     name = data.get('name')
@@ -82,7 +415,7 @@ def register():
     if users_collection.find_one({'email': email}):
         return jsonify({'message': 'User with this email already exists'}), 409
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    hashed_password = hasher.hash(password)
 
     # Create a basic profile on registration
     user_id = users_collection.insert_one({
@@ -104,7 +437,7 @@ def register():
 
     return jsonify({'message': 'User registered successfully!', 'user_id': str(user_id)}), 201
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     email = data.get('email')
@@ -115,19 +448,45 @@ def login():
 
     user = users_collection.find_one({'email': email})
 
-    if user and bcrypt.check_password_hash(user['password_hash'], password):
-        token = jwt.encode({
-            'user_id': str(user['_id']),
-            "exp": datetime.utcnow() + timedelta(hours=24) # Token expires in 24 hours
-        }, app.config['SECRET_KEY'], algorithm="HS256")
-
-        return jsonify({'token': token})
+    if user and hasher.check(user['password_hash'], password):
+        upgrade_password_hash(user, password)
+        return jsonify(token_response(user, token_service.refresh_token(user['_id'])))
 
     return jsonify({'message': 'Could not verify! Wrong email or password.'}), 401
 
+@api.route('/api/token/refresh', methods=['POST'])
+def refresh_access_token():
+    """Trades a refresh token for a new access and refresh token (no password check)."""
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if not refresh_token:
+        return jsonify({'message': 'Refresh token is missing!'}), 401
+    try:
+        user_id, replacement = token_service.rotate(refresh_token)
+    except tokens.InvalidToken as e:
+        return jsonify({'message': str(e)}), 401
+
+    user = load_user(user_id)
+    if not user:
+        return jsonify({'message': 'User not found!'}), 401
+    return jsonify(token_response(user, replacement))
+
+@api.route('/api/logout', methods=['POST'])
+def logout():
+    """Revokes the access token and ends the refresh token's session."""
+    token = request.headers.get('x-access-token')
+    if token:
+        try:
+            token_service.revoke_access(token_service.decode(token))
+        except tokens.TokenError:
+            pass  # Expired or invalid: nothing to revoke
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh_token:
+        token_service.revoke_refresh(refresh_token)
+    return jsonify({'message': 'Logged out'})
+
 # --- Profile Routes (Protected) ---
 
-@app.route('/api/profile', methods=['GET'])
+@api.route('/api/profile', methods=['GET'])
 @token_required
 def get_profile(current_user):
     # Don't send the password hash to the frontend
@@ -140,18 +499,25 @@ def get_profile(current_user):
     }
     return jsonify(user_data)
 
-@app.route('/api/profile', methods=['PUT'])
+@api.route('/api/profile', methods=['PUT'])
 @token_required
 def update_profile(current_user):
     data = request.get_json()
-    macro_goals = data.get('profile',{}).get('macro_goals',0) 
+    profile = data.get('profile', {})
+    macro_goals = profile.get('macro_goals')
+    current_profile = current_user.get('profile') or {}
+    # Registration and the profile page use daily_calorie_goal; older
+    # clients send daily_calories_goal. analytics.calorie_goal reads either.
+    goal = profile.get('daily_calories_goal', profile.get('daily_calorie_goal'))
+    goal = float(goal) if goal else analytics.calorie_goal(current_user)
     # Fields that can be updated
     update_data = {
         'name': data.get('name', current_user['name']),
-        'profile.height_cm': data.get('profile', {}).get('height_cm', current_user['profile']['height_cm']),
-        'profile.weight_kg': data.get('profile', {}).get('weight_kg', current_user['profile']['weight_kg']),
-        'profile.target_weight_kg': data.get('profile', {}).get('target_weight_kg', current_user['profile']['target_weight_kg']),
-        'profile.daily_calories_goal': data.get('profile', {}).get('daily_calories_goal', current_user['profile']['daily_calories_goal'])
+        'profile.height_cm': profile.get('height_cm', current_profile.get('height_cm')),
+        'profile.weight_kg': profile.get('weight_kg', current_profile.get('weight_kg')),
+        'profile.target_weight_kg': profile.get('target_weight_kg', current_profile.get('target_weight_kg')),
+        'profile.daily_calories_goal': goal,
+        'profile.daily_calorie_goal': goal,
     }
     
     if macro_goals is not None:
@@ -168,11 +534,15 @@ def update_profile(current_user):
         {'_id': current_user['_id']},
         {'$set': update_data}
     )
-    print(update_data)
+    user_cache.invalidate(current_user['_id'])
+    if goal != analytics.calorie_goal(current_user):
+        adherence.reclassify(db, current_user['_id'], goal)
+    etag.bump(db, current_user['_id'], 'users')
+    current_app.logger.debug("Profile updated for %s: %s", current_user['_id'], update_data)
 
-    return jsonify({'message': 'Profile updated successfully!'})
+    return renew_access_token(jsonify({'message': 'Profile updated successfully!'}), current_user['_id'])
 
-@app.route('/api/change-password', methods=['POST'])
+@api.route('/api/change-password', methods=['POST'])
 @token_required
 def change_password(current_user):
     data = request.get_json()
@@ -182,26 +552,48 @@ def change_password(current_user):
     if not old_password or not new_password:
         return jsonify({'message': 'Missing fields'}), 400
 
-    if not bcrypt.check_password_hash(current_user['password_hash'], old_password):
+    if not hasher.check(current_user['password_hash'], old_password):
         return jsonify({'message': 'Old password is not correct!'}), 401
 
-    new_hashed_password = bcrypt.generate_password_hash(new_password).decode('utf-8')
+    new_hashed_password = hasher.hash(new_password)
     users_collection.update_one(
         {'_id': current_user['_id']},
         {'$set': {'password_hash': new_hashed_password}}
     )
+    user_cache.invalidate(current_user['_id'])
+    # Signs out every other session; this one continues with a new refresh token
+    token_service.revoke_user(current_user['_id'])
 
-    return jsonify({'message': 'Password updated successfully!'})
+    response = jsonify({'message': 'Password updated successfully!'})
+    response.headers[tokens.RENEWED_REFRESH_TOKEN_HEADER] = token_service.refresh_token(current_user['_id'])
+    return response
 
 # 1. Food Management
-@app.route('/api/foods', methods=['GET'])
+@api.route('/api/foods', methods=['GET'])
 def search_foods():
     query = request.args.get('q', '')
-    # Case-insensitive search
-    foods = db.foods.find({"name": {"$regex": query, "$options": 'i'}})
-    return parse_json(list(foods))
-
-@app.route('/api/foods', methods=['POST'])
+    after = request.args.get('after')
+    try:
+        limit = pagination.parse_limit()
+        projection = pagination.parse_projection(FOOD_FIELDS)
+        after = ObjectId(after) if after else None
+    except pagination.PaginationError as e:
+        return pagination.error_response(e)
+    except InvalidId:
+        return pagination.error_response("'after' must be a food id")
+
+    if query.strip():
+        # Ranked, case-insensitive search served from the in-memory index.
+        # Ranked results are one page of `limit` (default DEFAULT_PAGE_SIZE);
+        # `after` applies to browsing.
+        foods = food_index.search(query, limit=limit or pagination.DEFAULT_PAGE_SIZE)
+        return pagination.stream_json_array(pagination.project(food, projection) for food in foods)
+
+    # Catalog browsing: keyset pages (or a stream) in _id order
+    foods = db.foods.find({"_id": {"$gt": after}} if after else {}, projection).sort("_id", 1)
+    return pagination.paged_response(foods, limit, "_id")
+
+@api.route('/api/foods', methods=['POST'])
 def add_food():
     data = request.json
     food = {
@@ -217,252 +609,264 @@ def add_food():
         }
     }
     result = db.foods.insert_one(food)
+    food_index.add(food)
+    food_cache.put(food)
     return jsonify({"message": "Food added successfully", "id": str(result.inserted_id)}), 201
 
 # 2. Daily Logging
-@app.route('/api/log/food', methods=['POST'])
+# The logging, summary and progress routes share their logic with the async
+# mode (asgi.py) through handlers.py
+def respond(handled):
+    """The Flask response for a handler's (body, status, headers)."""
+    body, status, headers = driver.run(handled)
+    return jsonify(body), status, headers
+
+@api.route('/api/log/food', methods=['POST'])
 @token_required # MODIFIED: Protect this route
 def log_food_entry(current_user): # MODIFIED: Get the current user
-    data = request.json
-    food_id = data['food_id']
-    servings = float(data['servings'])
-    log_date_str = data.get('date', datetime.now().strftime('%Y-%m-%d'))
-    
-    # MODIFIED: Ensure the food item belongs to the current user
-    food_item = db.foods.find_one({"_id": ObjectId(food_id)})
-    if not food_item:
-        return jsonify({"error": "Food not found or does not belong to user"}), 404
-        
-    log_entry = {
-        "user_id": current_user['_id'], # MODIFIED: Add the user's ID
-        "food_id": ObjectId(food_id),
-        "name": food_item['name'],
-        "servings": servings,
-        "date": log_date_str,
-        "total_calories": food_item['calories'] * servings,
-        "total_macros": {
-            "protein": food_item['macros']['protein'] * servings,
-            "carbs": food_item['macros']['carbs'] * servings,
-            "fat": food_item['macros']['fat'] * servings
-        }
-    }
-    db.daily_logs.insert_one(log_entry)
-    return jsonify({"message": "Food logged successfully"}), 201
+    return respond(handlers.log_food_entry(services, current_user, request.json))
+
+@api.route('/api/log/food/batch', methods=['POST'])
+@token_required
+def log_food_batch(current_user):
+    return respond(handlers.log_food_batch(services, current_user, request.json))
 
-@app.route('/api/log/food/<log_id>', methods=['DELETE'])
+@api.route('/api/log/food/<log_id>', methods=['DELETE'])
 @token_required
 def delete_food_log(current_user, log_id):
     """
-    Deletes a specific food log entry identified by its log_id.
-    Ensures that the log belongs to the currently authenticated user
-    before deleting.
+    Deletes a specific food log entry identified by its log_id. The query
+    matches both the log's _id and the current user's _id, so a user cannot
+    delete another user's data; both cases answer 404.
     """
     try:
-        # Step 1: Validate that the provided log_id is a valid MongoDB ObjectId format.
-        # This prevents errors if a malformed ID is sent.
-        try:
-            object_id_to_delete = ObjectId(log_id)
-        except Exception:
-            return jsonify({"error": "Invalid log ID format"}), 400
-
-        # Step 2: Perform the delete operation with a secure query.
-        # The query must match BOTH the log's _id AND the current_user's _id.
-        # This is the critical security step that prevents a user from deleting
-        # another user's data.
-        delete_result = db.daily_logs.delete_one({
-            "_id": object_id_to_delete,
-            "user_id": current_user['_id']
-        })
-
-        # Step 3: Check if a document was actually deleted.
-        if delete_result.deleted_count == 1:
-            # Success! The document was found and deleted.
-            return jsonify({"message": "Food log deleted successfully"}), 200
-        else:
-            # If deleted_count is 0, it means no document matched the query.
-            # This happens if the log_id doesn't exist OR it belongs to another user.
-            # In both cases, we return a 404 to not reveal information.
-            return jsonify({"error": "Log not found or you do not have permission"}), 404
-
-    except Exception as e:
+        return respond(handlers.delete_food_log(services, current_user, log_id))
+    except Exception:
         # Catch any other unexpected server errors.
-        print(f"Error in delete_food_log: {e}") # Log for debugging
+        current_app.logger.exception("Error in delete_food_log")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/log/weight', methods=['POST'])
-@token_required # MODIFIED: Protect this route
+@api.route('/api/log/weight', methods=['POST'])
+@write_behind_required # MODIFIED: Protect this route
 def log_weight_entry(current_user): # MODIFIED: Get the current user
-    data = request.json
-    weight = float(data['weight'])
-    log_date_str = data.get('date', datetime.now().strftime('%Y-%m-%d'))
-
-    db.weight_logs.update_one(
-        # MODIFIED: Find by user_id AND date
-        {"user_id": current_user['_id'], "date": log_date_str},
-        # MODIFIED: Set the user_id on creation
-        {"$set": {"user_id": current_user['_id'], "weight": weight, "date": log_date_str}},
-        upsert=True
-    )
-    db.users.update_one(
-        {"_id": current_user['_id']},
-        {"$set": {"current_weight": weight}}
-    )
-    return jsonify({"message": "Weight logged successfully"}), 201
+    return respond(handlers.log_weight(services, current_user, request.json))
 
-@app.route('/api/log/activity', methods=['POST'])
-@token_required # MODIFIED: Protect this route
+@api.route('/api/log/activity', methods=['POST'])
+@write_behind_required # MODIFIED: Protect this route
 def log_activity(current_user): # MODIFIED: Get the current user
-    data = request.json
-    calories_burned = float(data['calories_burned'])
-    log_date_str = data.get('date', datetime.now().strftime('%Y-%m-%d'))
-
-    db.activity_logs.update_one(
-        # MODIFIED: Find by user_id AND date
-        {"user_id": current_user['_id'], "date": log_date_str},
-        # MODIFIED: Set the user_id on creation
-        {"$set": {"user_id": current_user['_id'], "calories_burned": calories_burned, "date": log_date_str}},
-        upsert=True
-    )
-    return jsonify({"message": "Activity logged successfully"}), 201
+    return respond(handlers.log_activity(services, current_user, request.json))
 
 # 3. Progress and Summary
-@app.route('/api/summary/<date_str>', methods=['GET'])
-@token_required
+@api.route('/api/summary/<date_str>', methods=['GET'])
+@claims_required
+@etag.conditional(db, 'daily_logs', 'activity_logs', 'users')
 def get_daily_summary(current_user, date_str):
     try:
-        # --- 1. Fetch and process food logs for the day ---
-        logs = db.daily_logs.find({"user_id": current_user['_id'], "date": date_str})
-        
-        total_calories = 0
-        total_protein = 0
-        total_carbs = 0
-        total_fat = 0
-        logged_foods = []
-
-        # Assuming your daily_logs documents contain macro info
-        for log in logs:
-            total_calories += log.get('total_calories', 0)
-            total_protein += log.get('total_macros', 0).get('protein', 0)
-            total_carbs += log.get('total_macros',0).get('carbs', 0)
-            total_fat += log.get('total_macros',0).get('fat', 0)
-            logged_foods.append(parse_json(log))
-
-        # --- 2. Fetch activity log for the day ---
-        activity_log = db.activity_logs.find_one({"user_id": current_user['_id'], "date": date_str})
-        calories_burned = activity_log.get('calories_burned', 0) if activity_log else 0
-
-        # --- 3. Fetch the full user profile for goals and weight ---
-        # We fetch the full document to get the most up-to-date info
-        user_profile_doc = db.users.find_one({"_id": current_user['_id']})
-        user_profile = parse_json(user_profile_doc) if user_profile_doc else {}
-
-        # --- 4. Construct and return the comprehensive response ---
-        return jsonify({
-            "date": date_str,
-            "total_calories": round(total_calories, 2),
-            "calories_burned": round(calories_burned, 2),
-            "logged_foods": logged_foods,
-            "macros_consumed": {
-                "protein": round(total_protein, 2),
-                "carbs": round(total_carbs, 2),
-                "fat": round(total_fat, 2)
-            },
-            "user_profile": {
-                "current_weight": user_profile.get("current_weight"),
-                "calorie_goal": user_profile.get("profile").get("daily_calorie_goal"),
-                "macro_goals": user_profile.get("macro_goals") # Can be None/null
-            }
-        })
-
+        return respond(handlers.daily_summary(services, current_user, date_str))
     except Exception as e:
+        current_app.logger.exception("Error in get_daily_summary")
         return jsonify({"message": "An error occurred fetching summary", "error": str(e)}), 500
-@app.route('/api/progress/weight', methods=['GET'])
-@token_required # MODIFIED: Protect this route
+
+@api.route('/api/summary', methods=['GET'])
+@claims_required
+@etag.conditional(db, 'daily_logs', 'activity_logs', 'users')
+def get_summary_range(current_user):
+    return respond(handlers.summary_range(services, current_user, request.args))
+
+@api.route('/api/progress/weight', methods=['GET'])
+@claims_required # MODIFIED: Protect this route
+@etag.conditional(db, 'weight_logs')
 def get_weight_progress(current_user): # MODIFIED: Get the current user
-    # MODIFIED: Filter by user_id
-    logs = db.weight_logs.find({"user_id": current_user['_id']}).sort("date", 1)
-    return parse_json(list(logs))
+    try:
+        limit = pagination.parse_limit()
+        projection = pagination.parse_projection(WEIGHT_LOG_FIELDS, required=("date",))
+    except pagination.PaginationError as e:
+        return pagination.error_response(e)
 
-@app.route('/api/progress/calories', methods=['GET'])
-@token_required # MODIFIED: Protect this route
+    # MODIFIED: Filter by user_id
+    query = {"user_id": current_user['_id']}
+    after = request.args.get('after')
+    if after:
+        query["date"] = {"$gt": after}
+    logs = db.weight_logs.find(query, projection).sort("date", 1)
+    return pagination.paged_response(logs, limit, "date")
+
+@api.route('/api/progress/calories', methods=['GET'])
+@claims_required # MODIFIED: Protect this route
+@etag.conditional(analytics_db, 'daily_logs', vary_by_day=True)
 def get_calorie_progress(current_user): # MODIFIED: Get the current user
-    # MODIFIED: Add a $match stage for user_id at the beginning of the pipeline
-    thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    pipeline = [
-        {"$match": {
-            "user_id": current_user['_id'],
-            "date": {"$gte": thirty_days_ago}
-        }},
-        {"$group": {"_id": "$date", "total_calories": {"$sum": "$total_calories"}}},
-        {"$sort": {"_id": 1}}
-    ]
-    logs = db.daily_logs.aggregate(pipeline)
-    return parse_json(list(logs))
+    return respond(handlers.calorie_progress(services, current_user))
 
-@app.route('/api/month-summary/<int:year>/<int:month>', methods=['GET'])
-@token_required # MODIFIED: Protect this route
+@api.route('/api/month-summary/<int:year>/<int:month>', methods=['GET'])
+@claims_required # MODIFIED: Protect this route
+@etag.conditional(analytics_db, 'daily_logs', 'users')
 def get_month_summary(current_user, year, month): # MODIFIED: Get the current user
-    # MODIFIED: Use the user's specific calorie goal from their profile
-    TARGET_CALORIES = current_user.get('profile', {}).get('daily_calories_goal', 2000)
-
-    start_date_str = f"{year}-{month:02d}-01"
-    next_month = month + 1 if month < 12 else 1
-    next_year = year if month < 12 else year + 1
-    end_date = datetime(next_year, next_month, 1) - timedelta(days=1)
-    end_date_str = end_date.strftime('%Y-%m-%d')
-    
-    pipeline = [
-        # MODIFIED: Add a $match stage for user_id at the beginning
-        {"$match": {
-            "user_id": current_user['_id'],
-            "date": {"$gte": start_date_str, "$lte": end_date_str}
-        }},
-        {"$group": {"_id": "$date", "total_calories": {"$sum": "$total_calories"}}},
-        {"$project": {
-            "date": "$_id",
-            "total_calories": 1,
-            "status": {
-                "$cond": {
-                    "if": {"$lte": ["$total_calories", TARGET_CALORIES]},
-                    "then": "success", "else": "failure"
-                }
-            },
-            "_id": 0
-        }},
-        {"$sort": {"date": 1}}
-    ]
-    daily_summaries = list(db.daily_logs.aggregate(pipeline))
-    summary_map = {item['date']: item['status'] for item in daily_summaries}
-    return jsonify(summary_map)
+    return respond(handlers.month_summary(services, current_user, year, month))
 
 # 4. Progress Check Feature
-@app.route('/api/progress/check', methods=['GET'])
-@token_required # MODIFIED: Protect this route
+@api.route('/api/progress/check', methods=['GET'])
+@claims_required # MODIFIED: Protect this route
 def check_progress(current_user): # MODIFIED: Get the current user
-    # MODIFIED: Use the user's specific calorie goal
-    TARGET_CALORIES = current_user.get('profile', {}).get('daily_calories_goal', 2000)
-    
-    seven_days_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    pipeline = [
-        # MODIFIED: Match for user_id
-        {"$match": {
-            "user_id": current_user['_id'],
-            "date": {"$gte": seven_days_ago}
-        }},
-        {"$group": {"_id": None, "avg_calories": {"$avg": "$total_calories"}}}
-    ]
-    result = list(db.daily_logs.aggregate(pipeline))
-    
-    if not result or not result[0].get('avg_calories'):
-        return jsonify({"on_track": "unknown", "message": "Not enough data to check your progress. Keep logging!"})
-
-    avg_calories = result[0]['avg_calories']
-    
-    if avg_calories <= TARGET_CALORIES:
-        return jsonify({"on_track": True, "message": f"Great job! Your average intake of {int(avg_calories)} kcal is on track with your goal of {TARGET_CALORIES} kcal."})
+    return respond(handlers.progress_check(services, current_user))
+
+def timed(fn, *args):
+    """(fn(*args), seconds it took)."""
+    began = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - began
+
+@api.route('/api/progress/bundle', methods=['GET'])
+@claims_required
+@etag.conditional(analytics_db, 'weight_logs', 'daily_logs', 'users', vary_by_day=True)
+def get_progress_bundle(current_user):
+    """
+    /progress/weight, /progress/calories and /progress/check in one call;
+    the weight history is read in parallel with the calorie aggregation.
+    """
+    began = time.perf_counter()
+    query, sort = progress.weight_query(current_user['_id'])
+    with mongo.analytics_timeout():
+        # The copied context keeps the read attributed to this request
+        # (metrics.py) and inside its time budget
+        weights = fanout.submit(contextvars.copy_context().run, timed,
+                                lambda: list(analytics_db.weight_logs.find(query).sort(sort)))
+        facets, calories_seconds = timed(
+            lambda: next(analytics_db.adherence.aggregate(progress.calories_pipeline(current_user['_id'])), {})
+        )
+        weights, weight_seconds = weights.result()
+    return jsonify(progress.bundle(weights, facets, analytics.calorie_goal(current_user), {
+        'weight_ms': weight_seconds, 'calories_ms': calories_seconds, 'total_ms': time.perf_counter() - began,
+    }))
+
+@api.route('/api/streaks', methods=['GET'])
+@claims_required
+@etag.conditional(db, 'daily_logs', 'users', vary_by_day=True)
+def get_streaks(current_user):
+    """Current and longest run of consecutive days logged within the calorie goal."""
+    return respond(handlers.streaks(services, current_user))
+
+# 5. Long-range analytics
+@api.route('/api/analytics/trends', methods=['GET'])
+@claims_required
+@etag.conditional(analytics_db, 'weight_logs', 'daily_logs', 'activity_logs', 'users', vary_by_day=True)
+def get_trends(current_user):
+    """
+    Smoothed weight and calorie trends, weekly balance vs. the calorie goal
+    and estimated TDEE over ?from=&to= (default: the last year), downsampled
+    to ?points= (default 200). ?window= sets the rolling average in days and
+    ?alpha= the trend weight smoothing factor.
+    """
+    try:
+        params = analytics.parse_params(request.args)
+    except analytics.AnalyticsError as e:
+        return jsonify({"message": str(e)}), 400
+    with mongo.analytics_timeout():
+        return jsonify(analytics.trends(analytics_db, current_user, params))
+
+# 6. Offline sync
+@api.route('/api/sync', methods=['GET'])
+@claims_required
+def sync_changes(current_user):
+    """
+    Returns the daily, weight and activity log changes (and deletions) since
+    the `since` token from a previous call. Without a token, starts a full
+    snapshot (`full` is true on its first page). Follow up with the returned
+    token while `has_more` is true.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', sync.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"message": "'since' and 'limit' must be integers"}), 400
+    limit = max(1, min(limit, sync.MAX_PAGE_SIZE))
+    return jsonify(sync.changes_since(db, logs, current_user['_id'], since, limit))
+
+# 7. Export and import
+def _flag(name):
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+@api.route('/api/export', methods=['GET'])
+@claims_required
+def export_history(current_user):
+    """
+    Streams all of the user's food, weight and activity logs as NDJSON or
+    ?format=csv, gzipped with ?gzip=1. See history.py for the row format.
+    """
+    try:
+        fmt = history.parse_format(request.args.get('format'))
+    except history.HistoryError as e:
+        return jsonify({"message": str(e)}), 400
+    compress = _flag('gzip')
+    response = Response(history.export_stream(db, logs, current_user['_id'], fmt, compress),
+                        mimetype='application/gzip' if compress else history.MEDIA_TYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{history.export_filename(fmt, compress)}"'
+    return response
+
+@api.route('/api/import', methods=['POST'])
+@token_required
+def import_history(current_user):
+    """
+    Imports rows in the /api/export format, from the body or a multipart
+    `file` upload. The format is ?format=, else taken from the file name or
+    Content-Type (text/csv; NDJSON otherwise); gzip is detected from a .gz
+    file name, Content-Encoding: gzip, application/gzip or ?gzip=1. Days the
+    user already has are skipped; the response reports what was imported,
+    skipped and rejected.
+    """
+    upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    if upload is not None:
+        stream, name = upload.stream, (upload.filename or '').lower()
+        default_format = 'csv' if name.removesuffix('.gz').endswith('.csv') else 'ndjson'
+        compressed = name.endswith('.gz')
     else:
-        return jsonify({"on_track": False, "message": f"Heads up! Your average intake of {int(avg_calories)} kcal is a bit above your goal of {TARGET_CALORIES} kcal."})
+        stream = request.stream
+        default_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        compressed = request.content_encoding == 'gzip' or request.mimetype == 'application/gzip'
+    try:
+        fmt = history.parse_format(request.args.get('format'), default_format)
+    except history.HistoryError as e:
+        return jsonify({"message": str(e)}), 400
+
+    importer = history.Importer(db, logs, current_user, analytics.calorie_goal(current_user))
+    try:
+        for line_number, row in history.read_rows(stream, fmt, compressed or _flag('gzip')):
+            importer.add(line_number, row)
+    except history.READ_ERRORS as e:
+        # The rows read so far are still imported; importing the file again skips them
+        report = importer.finish()
+        return jsonify({"message": f"Could not read the file: {e}", **report}), 400
+    report = importer.finish()
+    response = jsonify({"message": f"Imported {sum(report['imported'].values())} entries", **report})
+    if report['current_weight_updated']:
+        user_cache.invalidate(current_user['_id'])
+        response = renew_access_token(response, current_user['_id'])
+    return response, 200
+
+# 8. Operational stats
+def operational_stats():
+    return {
+        "user_cache": user_cache.stats(),
+        "mongo_pool": metrics.pool_listener.stats(),
+        "conditional_get": etag.stats,
+        "password_hashing": hasher.stats(),
+        "food_cache": food_cache.stats(),
+        "tokens": token_service.cache_stats(),
+        "startup": startup_profile,
+        "write_behind": write_queue.cache_stats() if write_queue is not None else {},
+    }
+
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(operational_stats())
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Request, Mongo and bcrypt timings plus the stats above, for this worker
+    return Response(metrics.render(operational_stats()), content_type=metrics.CONTENT_TYPE)
+
+
+startup_profile['import_ms'] = round((time.perf_counter() - _import_started) * 1000, 1)
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    create_app().run(debug=True, port=5001)
\ No newline at end of file
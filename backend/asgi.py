@@ -0,0 +1,385 @@
+# backend/asgi.py
+
+import asyncio
+import os
+import time
+from functools import wraps
+
+from asgiref.wsgi import WsgiToAsgi
+import pymongo
+from quart import Quart, Response, g, jsonify, make_response, request
+from werkzeug.exceptions import HTTPException
+
+import analytics
+import app as sync_app
+import db as mongo
+import driver
+import etag
+import handlers
+import log_store
+import metrics
+import pagination
+import progress
+import tokens
+from json_provider import BSONJSONProvider
+
+# --- Async serving mode ---
+# Serves the read-heavy and logging routes (/api/summary*, /api/progress/*,
+# /api/month-summary, /api/streaks, /api/log/*) from a Quart app on Motor, so a worker
+# keeps handling requests while its Mongo round-trips are in flight. Every
+# other route (auth, foods, sync, stats) falls through to the Flask app,
+# which runs in a thread via WsgiToAsgi. Run with SERVER_MODE=async (see
+# gunicorn.conf.py); the responses are the same as in sync mode, because
+# both apps run the same route logic from handlers.py (checked by
+# python -m benchmarks.serving_parity).
+#
+# The user cache, hasher and food index are the Flask module's instances, so
+# both halves share one cache per worker process. The food log routes read
+# and write through a MotorDocumentLogStore; with LOG_STORAGE=buckets they
+# are served by Flask through its LogStore (see log_store.py).
+
+app = Quart(__name__)
+app.json = BSONJSONProvider(app)
+app.config['SECRET_KEY'] = sync_app.app.config['SECRET_KEY']
+
+# Motor client with the Flask module's pool settings, created on first use
+# in the worker (see db.py)
+connections = mongo.AsyncConnections(sync_app.MONGO_URI,
+                                     event_listeners=[metrics.command_listener, metrics.pool_listener])
+db = connections.database(sync_app.DB_NAME)
+analytics_db = connections.analytics_database(sync_app.DB_NAME)
+user_cache = sync_app.user_cache
+token_service = sync_app.token_service
+write_queue = sync_app.write_queue
+food_cache = sync_app.food_cache
+logs = sync_app.logs
+
+
+@app.before_request
+async def start_timer():
+    g.metrics_started = metrics.start_request()
+
+
+@app.before_serving
+async def warm_motor_pool():
+    # The Motor client belongs to the serving event loop, so its pool is
+    # opened here rather than by app.prewarm (see gunicorn.conf.py)
+    if os.getenv("PREWARM", "1") == "0":
+        return
+    began = time.perf_counter()
+    try:
+        with pymongo.timeout(sync_app.PREWARM_TIMEOUT):
+            await asyncio.gather(*(db.command('ping') for _ in range(max(sync_app.PREWARM_CONNECTIONS, 1))))
+    except Exception:
+        app.logger.warning("Could not open the Motor connection pool; it will connect on first use", exc_info=True)
+    sync_app.startup_profile['prewarm_ms']['motor_pool_ms'] = round((time.perf_counter() - began) * 1000, 1)
+
+
+@app.after_request
+async def stop_timer(response):
+    # Motor runs commands on executor threads, so in this half only the
+    # route timings (and sampled per-command timings) are recorded
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        rule = request.url_rule.rule if request.url_rule else None
+        metrics.finish_request(started, rule, request.method, response.status_code)
+    return response
+
+
+@app.after_request
+async def add_cors_headers(response):
+    # Same headers Flask-CORS adds on the sync side; preflights go to Flask
+    if 'Origin' in request.headers:
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Expose-Headers'] = ', '.join((
+            pagination.NEXT_CURSOR_HEADER, tokens.RENEWED_TOKEN_HEADER, tokens.RENEWED_REFRESH_TOKEN_HEADER
+        ))
+    return response
+
+
+async def database_unavailable(e):
+    # Same response as the Flask handler
+    app.logger.warning("Database timeout on %s: %s", request.path, e)
+    response = jsonify({'message': 'The database is busy, please try again shortly.'})
+    response.headers['Retry-After'] = '2'
+    return response, 503
+
+for error in mongo.TIMEOUT_ERRORS:
+    app.register_error_handler(error, database_unavailable)
+
+
+async def load_user(user_id):
+    current_user = user_cache.get(user_id)
+    if current_user is None:
+        current_user = await db.users.find_one({'_id': user_id})
+        if current_user is not None:
+            user_cache.put(user_id, current_user)
+    return current_user
+
+
+# What the routes shared with app.py run against; see handlers.py
+services = handlers.Services(
+    db, analytics_db, log_store.MotorDocumentLogStore(db), food_cache, user_cache, token_service, write_queue,
+    load_user,
+    flush_user=lambda user_id: asyncio.to_thread(write_queue.flush_user, user_id),
+    gather=driver.concurrent,
+)
+
+
+async def authenticate(claims_only=False, flush_writes=True):
+    """
+    Async counterpart of app.authenticate; confirms revocation filter hits
+    through Motor. Queued write-behind edits are written on a thread.
+    """
+    token = request.headers.get('x-access-token')
+    if not token:
+        return None, (jsonify({'message': 'Token is missing!'}), 401)
+
+    try:
+        claims = token_service.decode(token)
+        jti = claims.get('jti')
+        if jti is not None and token_service.revocations.might_contain(jti):
+            revoked = await db.revoked_tokens.find_one({'_id': jti}, {'_id': 1}) is not None
+            if token_service.revocations.confirmed(revoked):
+                raise tokens.InvalidToken("Token has been revoked")
+        user_id = tokens.user_id_of(claims)
+        if flush_writes and write_queue is not None and write_queue.has_pending(user_id):
+            await asyncio.to_thread(write_queue.flush_user, user_id)
+        current_user = tokens.claims_user(claims) if claims_only else None
+        if current_user is None:
+            current_user = await load_user(user_id)
+    except tokens.ExpiredToken as e:
+        return None, (jsonify({'message': str(e)}), 401)
+    except tokens.InvalidToken as e:
+        return None, (jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401)
+
+    if not current_user:
+        return None, (jsonify({'message': 'User not found!'}), 401)
+    return current_user, None
+
+
+def token_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        current_user, error = await authenticate()
+        if error:
+            return error
+        return await f(current_user, *args, **kwargs)
+    return decorated
+
+
+def claims_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        current_user, error = await authenticate(claims_only=True)
+        if error:
+            return error
+        return await f(current_user, *args, **kwargs)
+    return decorated
+
+
+def write_behind_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        current_user, error = await authenticate(flush_writes=False)
+        if error:
+            return error
+        return await f(current_user, *args, **kwargs)
+    return decorated
+
+
+def conditional(*resources, vary_by_day=False, database=None):
+    """Async counterpart of etag.conditional; versions are read from `database` (default db)."""
+    def decorator(f):
+        @wraps(f)
+        async def decorated(current_user, *args, **kwargs):
+            source = database or db
+            counter = await source.sync_counters.find_one({'_id': current_user['_id']}, {'versions': 1}) or {}
+            tag = etag.etag_for(current_user['_id'], request.full_path, counter.get('versions', {}),
+                                resources, vary_by_day, current_user.get('claims_version'))
+            if request.if_none_match.contains(tag):
+                etag.stats['not_modified'] += 1
+                response = await make_response('', 304)
+            else:
+                etag.stats['full_responses'] += 1
+                response = await make_response(await f(current_user, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = etag.CACHE_CONTROL
+            return response
+        return decorated
+    return decorator
+
+
+async def iter_json_array(cursor):
+    yield '['
+    first = True
+    async for doc in cursor:
+        yield pagination.encode(doc) if first else ',' + pagination.encode(doc)
+        first = False
+    yield ']\n'
+
+
+async def paged_response(cursor, limit, cursor_field):
+    """Async counterpart of pagination.paged_response."""
+    if limit is None:
+        return Response(iter_json_array(cursor), mimetype='application/json')
+
+    page = await cursor.limit(limit).to_list(None)
+    response = Response(''.join(pagination.iter_json_array(page)), mimetype='application/json')
+    if len(page) == limit:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = str(page[-1][cursor_field])
+    return response
+
+
+async def respond(handled):
+    """The Quart response for a handler's (body, status, headers)."""
+    body, status, headers = await handled
+    return jsonify(body), status, headers
+
+
+# 2. Daily Logging
+@app.route('/api/log/food', methods=['POST'])
+@token_required
+async def log_food_entry(current_user):
+    return await respond(handlers.log_food_entry(services, current_user, await request.get_json()))
+
+
+@app.route('/api/log/food/batch', methods=['POST'])
+@token_required
+async def log_food_batch(current_user):
+    return await respond(handlers.log_food_batch(services, current_user, await request.get_json()))
+
+
+@app.route('/api/log/food/<log_id>', methods=['DELETE'])
+@token_required
+async def delete_food_log(current_user, log_id):
+    try:
+        return await respond(handlers.delete_food_log(services, current_user, log_id))
+    except Exception:
+        app.logger.exception("Error in delete_food_log")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+
+@app.route('/api/log/weight', methods=['POST'])
+@write_behind_required
+async def log_weight_entry(current_user):
+    return await respond(handlers.log_weight(services, current_user, await request.get_json()))
+
+
+@app.route('/api/log/activity', methods=['POST'])
+@write_behind_required
+async def log_activity(current_user):
+    return await respond(handlers.log_activity(services, current_user, await request.get_json()))
+
+
+# 3. Progress and Summary
+@app.route('/api/summary/<date_str>', methods=['GET'])
+@claims_required
+@conditional('daily_logs', 'activity_logs', 'users')
+async def get_daily_summary(current_user, date_str):
+    try:
+        return await respond(handlers.daily_summary(services, current_user, date_str))
+    except Exception as e:
+        app.logger.exception("Error in get_daily_summary")
+        return jsonify({"message": "An error occurred fetching summary", "error": str(e)}), 500
+
+
+@app.route('/api/summary', methods=['GET'])
+@claims_required
+@conditional('daily_logs', 'activity_logs', 'users')
+async def get_summary_range(current_user):
+    return await respond(handlers.summary_range(services, current_user, request.args))
+
+
+@app.route('/api/progress/weight', methods=['GET'])
+@claims_required
+@conditional('weight_logs')
+async def get_weight_progress(current_user):
+    try:
+        limit = pagination.parse_limit(request.args)
+        projection = pagination.parse_projection(sync_app.WEIGHT_LOG_FIELDS, required=("date",),
+                                                 args=request.args)
+    except pagination.PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    query = {"user_id": current_user['_id']}
+    after = request.args.get('after')
+    if after:
+        query["date"] = {"$gt": after}
+    logs = db.weight_logs.find(query, projection).sort("date", 1)
+    return await paged_response(logs, limit, "date")
+
+
+@app.route('/api/progress/calories', methods=['GET'])
+@claims_required
+@conditional('daily_logs', vary_by_day=True, database=analytics_db)
+async def get_calorie_progress(current_user):
+    return await respond(handlers.calorie_progress(services, current_user))
+
+
+@app.route('/api/month-summary/<int:year>/<int:month>', methods=['GET'])
+@claims_required
+@conditional('daily_logs', 'users', database=analytics_db)
+async def get_month_summary(current_user, year, month):
+    return await respond(handlers.month_summary(services, current_user, year, month))
+
+
+@app.route('/api/progress/check', methods=['GET'])
+@claims_required
+async def check_progress(current_user):
+    return await respond(handlers.progress_check(services, current_user))
+
+
+async def timed(awaitable):
+    began = time.perf_counter()
+    result = await awaitable
+    return result, time.perf_counter() - began
+
+
+@app.route('/api/progress/bundle', methods=['GET'])
+@claims_required
+@conditional('weight_logs', 'daily_logs', 'users', vary_by_day=True, database=analytics_db)
+async def get_progress_bundle(current_user):
+    began = time.perf_counter()
+    query, sort = progress.weight_query(current_user['_id'])
+    with mongo.analytics_timeout():
+        (weights, weight_seconds), (facets, calories_seconds) = await asyncio.gather(
+            timed(analytics_db.weight_logs.find(query).sort(sort).to_list(None)),
+            timed(analytics_db.adherence.aggregate(progress.calories_pipeline(current_user['_id'])).to_list(1)),
+        )
+    return jsonify(progress.bundle(weights, facets[0] if facets else {}, analytics.calorie_goal(current_user), {
+        'weight_ms': weight_seconds, 'calories_ms': calories_seconds, 'total_ms': time.perf_counter() - began,
+    }))
+
+
+@app.route('/api/streaks', methods=['GET'])
+@claims_required
+@conditional('daily_logs', 'users', vary_by_day=True)
+async def get_streaks(current_user):
+    return await respond(handlers.streaks(services, current_user))
+
+
+# --- ASGI entry point ---
+wsgi_fallback = WsgiToAsgi(sync_app.app)
+_routes = app.url_map.bind('')
+# Routes whose food log entries go through the MotorDocumentLogStore
+LOG_ENDPOINTS = {'log_food_entry', 'log_food_batch', 'delete_food_log', 'get_daily_summary', 'get_summary_range'}
+
+
+def _is_async_route(scope):
+    if scope['method'] == 'OPTIONS':
+        return False  # CORS preflights are answered by Flask-CORS
+    try:
+        endpoint, _ = _routes.match(scope['path'], method=scope['method'])
+    except HTTPException:
+        return False
+    return logs.layout == 'documents' or endpoint not in LOG_ENDPOINTS
+
+
+async def application(scope, receive, send):
+    """Routes the async endpoints to Quart and everything else to Flask."""
+    if scope['type'] != 'http' or _is_async_route(scope):
+        return await app(scope, receive, send)
+    return await wsgi_fallback(scope, receive, send)
@@ -0,0 +1,4 @@
+# backend/benchmarks
+#
+# Offline benchmarks. Run from the backend/ directory, e.g.:
+#   python -m benchmarks.json_encoding
@@ -0,0 +1,118 @@
+# backend/benchmarks/analytics_trends.py
+#
+# Times /api/analytics/trends over 5 years of synthetic daily data per user:
+# the bulk fetch (load_series) and the NumPy computation (compute), with the
+# same rolling average / trend weight / weekly math done on plain Python
+# lists for comparison.
+#
+#   python -m benchmarks.analytics_trends [--users 20] [--years 5] [--points 200] [--repeat 5]
+#
+# Uses MONGO_URI when set and mongomock otherwise. Writes to a separate
+# `bitecount_benchmark` database.
+
+import argparse
+import math
+import os
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from bson import ObjectId
+
+import analytics
+from db import get_client
+from indexes import ensure_indexes
+
+DB_NAME = "bitecount_benchmark"
+
+
+def seed(db, users, days, start, seed=42):
+    rng = random.Random(seed)
+    for user_id in users:
+        weight = rng.uniform(70, 110)
+        weights, totals = [], []
+        for day in range(days):
+            date_str = (start + timedelta(days=day)).strftime('%Y-%m-%d')
+            weight += rng.gauss(-0.01, 0.05)
+            if rng.random() < 0.8:
+                weights.append({"user_id": user_id, "date": date_str, "weight": round(weight + rng.gauss(0, 0.4), 1)})
+            if rng.random() < 0.9:
+                totals.append({"user_id": user_id, "date": date_str, "total_calories": rng.gauss(2100, 300),
+                               "calories_burned": rng.choice([0, 0, 150, 300]), "entry_count": rng.randint(1, 8)})
+        db.weight_logs.insert_many(weights)
+        db.daily_totals.insert_many(totals)
+
+
+def python_baseline(weight, intake, burned, window, alpha):
+    """The same rolling means, trend weight and weekly sums on Python lists."""
+    weight = [None if math.isnan(w) else w for w in weight.tolist()]
+    net = [None if math.isnan(i) else i - b for i, b in zip(intake.tolist(), burned.tolist())]
+    rolling = {}
+    for name, values in (("weight", weight), ("net", net)):
+        out = []
+        for i in range(len(values)):
+            chunk = [v for v in values[max(0, i - window + 1):i + 1] if v is not None]
+            out.append(sum(chunk) / len(chunk) if chunk else None)
+        rolling[name] = out
+    trend, value = [], None
+    for w in weight:
+        if w is not None:
+            value = w if value is None else value + alpha * (w - value)
+        trend.append(value)
+    weeks = {}
+    for i, v in enumerate(net):
+        if v is not None:
+            week = weeks.setdefault(i // 7, [0, 0.0])
+            week[0] += 1
+            week[1] += v
+    return rolling, trend, weeks
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--points", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = get_client(os.getenv("MONGO_URI") or "mongomock://localhost")
+    client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+    ensure_indexes(db)
+    days = args.years * 365
+    start = date(2020, 1, 1)
+    users = [ObjectId() for _ in range(args.users)]
+    seed(db, users, days, start)
+    print(f"{args.users} users x {days} days")
+
+    params = {"start": start, "end": start + timedelta(days=days - 1), "points": args.points,
+              "window": analytics.DEFAULT_WINDOW, "alpha": analytics.DEFAULT_ALPHA}
+    fetch, numpy_compute, python_compute = [], [], []
+    for user_id in users:
+        user = {"_id": user_id, "profile": {"daily_calories_goal": 2000}}
+        fetch.append(timed(lambda: analytics.load_series(db, user_id, params["start"], params["end"]), args.repeat))
+        series = analytics.load_series(db, user_id, params["start"], params["end"])
+        numpy_compute.append(timed(lambda: analytics.compute(series, user, params), args.repeat))
+        python_compute.append(timed(lambda: python_baseline(*series, params["window"], params["alpha"]), args.repeat))
+
+    for name, samples in (("fetch (load_series)", fetch), ("NumPy compute", numpy_compute),
+                          ("Python-list compute", python_compute)):
+        print(f"  {name:<22} median {statistics.median(samples) * 1000:8.2f} ms   max {max(samples) * 1000:8.2f} ms")
+    print(f"  NumPy compute is {statistics.median(python_compute) / statistics.median(numpy_compute):.1f}x faster"
+          f" (and returns {args.points} points instead of {days})")
+    client.drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    main()
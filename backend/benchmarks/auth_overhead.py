@@ -0,0 +1,117 @@
+# backend/benchmarks/auth_overhead.py
+#
+# Measures what authentication costs per request, before and after the
+# token subsystem (tokens.py):
+#   * before: jwt.decode plus the user lookup, as token_required used to do,
+#     with the user cache warm and cold (a Mongo read per request)
+#   * after: TokenService.verify (verified-token cache and revocation bloom
+#     filter) plus the claims user of a claims_required route, with the
+#     verified-token cache warm and cold
+# and what it costs to get a new token: a bcrypt login against a refresh.
+#
+#   python -m benchmarks.auth_overhead [--iterations 20000] [--logins 5]
+#
+# Runs in-process against mongomock, so the cold user lookups are much
+# cheaper than a round-trip to a real server.
+
+import argparse
+import logging
+import os
+import statistics
+import time
+
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-enough-bytes")
+os.environ.setdefault("HASH_WORKERS", "0")
+
+
+def per_call(fn, iterations):
+    began = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - began) / iterations
+
+
+def median_call(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        began = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - began)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--logins", type=int, default=5)
+    args = parser.parse_args()
+    # Every bcrypt login is a slow request
+    logging.getLogger("metrics").setLevel(logging.ERROR)
+
+    import jwt
+    from bson import ObjectId
+    import app as app_module
+    import tokens
+
+    client = app_module.app.test_client()
+    email = f"bench-{time.time_ns()}@example.com"
+    client.post("/api/register", json={"name": "Bench", "email": email, "password": "secret"})
+    login = client.post("/api/login", json={"email": email, "password": "secret"}).get_json()
+    token = login["token"]
+    secret = app_module.app.config['SECRET_KEY']
+    user_cache = app_module.user_cache
+    users = app_module.users_collection
+
+    def before():
+        data = jwt.decode(token, secret, algorithms=["HS256"])
+        return user_cache.get_or_load(ObjectId(data['user_id']), lambda user_id: users.find_one({'_id': user_id}))
+
+    def before_cold():
+        user_cache.invalidate(ObjectId(jwt.decode(token, secret, algorithms=["HS256"])['user_id']))
+        return before()
+
+    service = app_module.token_service
+
+    def after():
+        return tokens.claims_user(service.verify(token))
+
+    cold_service = tokens.TokenService(app_module.db, secret, cache_size=0)
+
+    def after_cold():
+        return tokens.claims_user(cold_service.verify(token))
+
+    cases = [
+        ("before: decode + user cache hit", before),
+        ("before: decode + user lookup", before_cold),
+        ("after: verified token + claims", after),
+        ("after: decode + claims", after_cold),
+    ]
+    for _, fn in cases:
+        per_call(fn, 1000)  # warm-up
+    baseline = None
+    print(f"Authentication per request ({args.iterations} iterations)")
+    for name, fn in cases:
+        cost = per_call(fn, args.iterations)
+        baseline = baseline or cost
+        print(f"  {name:<34} {cost * 1e6:8.1f} us  ({cost / baseline:5.2f}x)")
+
+    rounds = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+    refresh_token = login["refresh_token"]
+
+    def do_login():
+        client.post("/api/login", json={"email": email, "password": "secret"})
+
+    def do_refresh():
+        nonlocal refresh_token
+        refresh_token = client.post("/api/token/refresh", json={"refresh_token": refresh_token}).get_json()["refresh_token"]
+
+    login_cost = median_call(do_login, args.logins)
+    refresh_cost = median_call(do_refresh, max(args.logins, 50))
+    print(f"New token, median of the requests (bcrypt cost {rounds})")
+    print(f"  {'POST /api/login':<34} {login_cost * 1e3:8.1f} ms")
+    print(f"  {'POST /api/token/refresh':<34} {refresh_cost * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# backend/benchmarks/instrumentation.py
+#
+# Measures what the metrics layer (metrics.py) costs per request: the same
+# /api/summary request with instrumentation off, with timing only
+# (METRICS_SAMPLE_RATE=0) and fully traced (rate 1), plus the per-command
+# cost of the CommandListener, which mongomock never calls. Reports the
+# overhead as a share of the request's own latency.
+#
+#   python -m benchmarks.instrumentation [--requests 3000] [--commands-per-request 4]
+#
+# Runs in-process against mongomock, so the requests are much faster than
+# with a real server and the percentages are an upper bound.
+
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-enough-bytes")
+os.environ.setdefault("HASH_WORKERS", "0")
+
+MODES = [("off", False, 0.0), ("timing only", True, 0.0), ("traced", True, 1.0)]
+
+
+def time_requests(client, headers, path, requests):
+    samples = []
+    for _ in range(requests):
+        began = time.perf_counter()
+        client.get(path, headers=headers)
+        samples.append(time.perf_counter() - began)
+    return samples
+
+
+def time_modes(metrics, client, headers, path, requests, rounds=20):
+    """Median latency per mode, alternating the modes to even out drift."""
+    samples = {name: [] for name, _, _ in MODES}
+    for _ in range(rounds):
+        for name, enabled, rate in MODES:
+            metrics.enabled, metrics.sample_rate = enabled, rate
+            samples[name] += time_requests(client, headers, path, max(requests // rounds, 1))
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def time_command_events(metrics, events):
+    """Seconds per started+succeeded pair inside a traced request."""
+    command = {"find": "daily_totals", "filter": {"user_id": 1, "date": {"$gte": "2024-01-01"}}}
+    started = SimpleNamespace(request_id=1, command_name="find", command=command)
+    succeeded = SimpleNamespace(request_id=1, command_name="find", duration_micros=800)
+    listener = metrics.command_listener
+    metrics.enabled, metrics.sample_rate = True, 1.0
+    began = time.perf_counter()
+    for _ in range(events // metrics.MAX_TRACED_COMMANDS):
+        metrics.start_request()
+        for _ in range(metrics.MAX_TRACED_COMMANDS):
+            listener.started(started)
+            listener.succeeded(succeeded)
+    return (time.perf_counter() - began) / events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--commands-per-request", type=int, default=4)
+    args = parser.parse_args()
+
+    import app as app_module
+    import metrics
+
+    client = app_module.app.test_client()
+    email = f"bench-{time.time_ns()}@example.com"
+    client.post("/api/register", json={"name": "Bench", "email": email, "password": "secret"})
+    token = client.post("/api/login", json={"email": email, "password": "secret"}).get_json()["token"]
+    headers = {"x-access-token": token}
+    path = f"/api/summary/{datetime.now():%Y-%m-%d}"
+    time_requests(client, headers, path, 200)  # warm-up
+
+    medians = time_modes(metrics, client, headers, path, args.requests)
+    per_command = time_command_events(metrics, 100_000)
+
+    baseline = medians["off"]
+    print(f"{args.requests} x GET /api/summary/<date>, median latency")
+    for name, _, _ in MODES:
+        extra = medians[name] - baseline
+        print(f"  {name:<12} {medians[name] * 1e6:8.1f} us   {extra * 1e6:+6.1f} us  ({extra / baseline:+.2%})")
+    listener_cost = per_command * args.commands_per_request
+    print(f"CommandListener: {per_command * 1e6:.2f} us per command, "
+          f"{listener_cost / baseline:.2%} of a request with {args.commands_per_request} commands")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# backend/benchmarks/json_encoding.py
+#
+# Compares the old parse_json round-trip (json_util.dumps -> json.loads ->
+# jsonify) with the single-pass BSONJSONProvider on synthetic daily_logs
+# documents.
+#
+#   python -m benchmarks.json_encoding [--sizes 1000 10000 100000] [--repeat 5]
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId, json_util
+from flask import Flask
+
+import json_provider
+from json_provider import BSONJSONProvider
+
+
+def make_logs(n, seed=42):
+    rng = random.Random(seed)
+    user_id = ObjectId()
+    start = datetime(2024, 1, 1)
+    logs = []
+    for i in range(n):
+        servings = rng.choice([0.5, 1, 1.5, 2])
+        logs.append({
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "food_id": ObjectId(),
+            "name": rng.choice(["Apple", "Brown Rice", "Grilled Chicken Breast", "Almonds"]),
+            "servings": servings,
+            "date": (start + timedelta(days=i // 6)).strftime('%Y-%m-%d'),
+            "created_at": start + timedelta(minutes=i),
+            "total_calories": rng.uniform(30, 400) * servings,
+            "total_macros": {
+                "protein": rng.uniform(0, 30),
+                "carbs": rng.uniform(0, 50),
+                "fat": rng.uniform(0, 15),
+            },
+        })
+    return logs
+
+
+def legacy_encode(app, logs):
+    # What the routes used to do: parse_json() followed by jsonify()
+    with app.app_context():
+        return app.json.response(json.loads(json_util.dumps(logs))).get_data()
+
+
+def provider_encode(app, logs):
+    with app.app_context():
+        return app.json.response(logs).get_data()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    legacy_app = Flask("legacy")
+    provider_app = Flask("provider")
+    provider_app.json = BSONJSONProvider(provider_app)
+
+    backend = "orjson" if json_provider.orjson is not None else "stdlib json"
+    print(f"BSONJSONProvider backend: {backend}")
+    print(f"{'docs':>8} {'parse_json (ms)':>16} {'provider (ms)':>14} {'speedup':>8}")
+    for size in args.sizes:
+        logs = make_logs(size)
+        # Both paths must produce the same document tree
+        assert json.loads(legacy_encode(legacy_app, logs[:50])) == json.loads(provider_encode(provider_app, logs[:50]))
+        legacy = best_of(lambda: legacy_encode(legacy_app, logs), args.repeat)
+        provider = best_of(lambda: provider_encode(provider_app, logs), args.repeat)
+        print(f"{size:>8} {legacy * 1000:>16.1f} {provider * 1000:>14.1f} {legacy / provider:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
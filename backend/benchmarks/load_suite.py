@@ -0,0 +1,350 @@
+# backend/benchmarks/load_suite.py
+#
+# Reproducible load test of the whole API. Seeds N users x M days of
+# synthetic logs (db.seed_synthetic), then runs concurrent simulated users
+# through a weighted mix of workloads for a fixed time:
+#   dashboard  today's summary, progress check, calorie chart and streaks,
+#              revalidated with If-None-Match like the frontend's polling
+#   calendar   month calendars and week summaries of past months
+#   logging    food search, batch and single food logs, the odd delete
+#   login      a password login (bcrypt)
+# and writes throughput and p50/p95/p99 latency per endpoint to JSON.
+# `--compare` diffs a run against an earlier JSON file (e.g. from the
+# previous commit) and exits with 1 when an endpoint regressed by more than
+# --threshold.
+#
+#   python -m benchmarks.load_suite [--users 50] [--days 90] [--clients 8] [--seconds 30]
+#                                   [--mix dashboard=50,calendar=25,logging=20,login=5]
+#                                   [--output results.json] [--compare baseline.json]
+#
+# Runs the Flask app in-process (one test client per simulated user thread)
+# on MONGO_URI, default mongomock, in the DB_NAME database (default
+# `bitecount_benchmark`, which is dropped and re-seeded unless --no-seed).
+# --base-url drives a running server over HTTP instead; it must use the same
+# MONGO_URI and DB_NAME so the seeded users exist.
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-enough-bytes")
+os.environ.setdefault("DB_NAME", "bitecount_benchmark")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "dashboard=50,calendar=25,logging=20,login=5"
+SEARCH_TERMS = ["ap", "chick", "rice", "alm", "broc"]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# --- Transports ---
+class InProcess:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self._client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, response.headers, response.get_data()
+
+
+class Http:
+    def __init__(self, base_url):
+        self._base_url = base_url.rstrip("/")
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(self._base_url + path, data=data, method=method, headers={
+            "Content-Type": "application/json", **(headers or {})
+        })
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+
+# --- Recording ---
+class Recorder:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, endpoint, status, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def summary(self, duration):
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            statuses = self.statuses[endpoint]
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": sum(count for status, count in statuses.items() if status >= 500),
+                "statuses": {str(status): count for status, count in sorted(statuses.items())},
+                "throughput_rps": round(len(samples) / duration, 2),
+                "mean_ms": round(statistics.mean(samples) * 1000, 3),
+                "p50_ms": round(percentile(samples, 50) * 1000, 3),
+                "p95_ms": round(percentile(samples, 95) * 1000, 3),
+                "p99_ms": round(percentile(samples, 99) * 1000, 3),
+            }
+        everything = [s for samples in self.latencies.values() for s in samples]
+        total = {
+            "requests": len(everything),
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "throughput_rps": round(len(everything) / duration, 2),
+            "p50_ms": round(percentile(everything, 50) * 1000, 3),
+            "p95_ms": round(percentile(everything, 95) * 1000, 3),
+            "p99_ms": round(percentile(everything, 99) * 1000, 3),
+        }
+        return endpoints, total
+
+
+class Session:
+    """One simulated user: a token, its cached ETags and its recent log ids."""
+
+    def __init__(self, transport, recorder, email, password, rng):
+        self.transport = transport
+        self.recorder = recorder
+        self.email = email
+        self.password = password
+        self.rng = rng
+        self.token = None
+        self.etags = {}
+        self.food_ids = []
+        self.log_ids = []
+
+    def call(self, endpoint, method, path, body=None, conditional=False):
+        headers = {"x-access-token": self.token} if self.token else {}
+        if conditional and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+        began = time.perf_counter()
+        status, response_headers, data = self.transport.request(method, path, body, headers)
+        self.recorder.record(endpoint, status, time.perf_counter() - began)
+        if conditional and response_headers.get("ETag"):
+            self.etags[path] = response_headers["ETag"]
+        return status, data
+
+    def login(self):
+        status, data = self.call("POST /api/login", "POST", "/api/login",
+                                 {"email": self.email, "password": self.password})
+        if status == 200:
+            self.token = json.loads(data)["token"]
+        return status
+
+
+# --- Workloads ---
+def dashboard(session, today, days):
+    session.call("GET /api/summary/<date>", "GET", f"/api/summary/{today:%Y-%m-%d}", conditional=True)
+    session.call("GET /api/progress/check", "GET", "/api/progress/check")
+    session.call("GET /api/progress/calories", "GET", "/api/progress/calories", conditional=True)
+    session.call("GET /api/streaks", "GET", "/api/streaks", conditional=True)
+
+
+def calendar(session, today, days):
+    day = today - timedelta(days=session.rng.randrange(days))
+    session.call("GET /api/month-summary/<year>/<month>", "GET",
+                 f"/api/month-summary/{day.year}/{day.month}", conditional=True)
+    week_start = day - timedelta(days=day.weekday())
+    session.call("GET /api/summary?from&to", "GET",
+                 f"/api/summary?from={week_start:%Y-%m-%d}&to={week_start + timedelta(days=6):%Y-%m-%d}",
+                 conditional=True)
+
+
+def logging_(session, today, days):
+    rng = session.rng
+    status, data = session.call("GET /api/foods?q", "GET", f"/api/foods?q={rng.choice(SEARCH_TERMS)}&limit=10")
+    if status == 200:
+        session.food_ids = [food["_id"]["$oid"] for food in json.loads(data)] or session.food_ids
+    if not session.food_ids:
+        return
+    if rng.random() < 0.3:
+        session.call("POST /api/log/food", "POST", "/api/log/food",
+                     {"food_id": rng.choice(session.food_ids), "servings": 1, "date": f"{today:%Y-%m-%d}"})
+        return
+    entries = [{"food_id": rng.choice(session.food_ids), "servings": rng.choice([0.5, 1, 1.5]),
+                "date": f"{today:%Y-%m-%d}"} for _ in range(rng.randint(1, 4))]
+    status, data = session.call("POST /api/log/food/batch", "POST", "/api/log/food/batch", {"entries": entries})
+    if status == 201:
+        session.log_ids += [result["id"] for result in json.loads(data)["results"] if result["status"] == 201]
+    if session.log_ids and rng.random() < 0.2:
+        log_id = session.log_ids.pop(rng.randrange(len(session.log_ids)))
+        session.call("DELETE /api/log/food/<id>", "DELETE", f"/api/log/food/{log_id}")
+
+
+def login(session, today, days):
+    session.login()
+
+
+WORKLOADS = {"dashboard": dashboard, "calendar": calendar, "logging": logging_, "login": login}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in WORKLOADS:
+            raise argparse.ArgumentTypeError(f"unknown workload {name!r} (choose from {', '.join(WORKLOADS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def run_client(session, mix, stop, days, think):
+    names, weights = list(mix), list(mix.values())
+    while not stop.is_set():
+        WORKLOADS[session.rng.choices(names, weights)[0]](session, datetime.now().date(), days)
+        if think:
+            time.sleep(session.rng.expovariate(1 / think))
+
+
+# --- Reporting ---
+def git_revision():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                         stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL)
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(endpoints, total):
+    print(f"{'endpoint':<40} {'reqs':>7} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, stats in list(endpoints.items()) + [("TOTAL", total)]:
+        print(f"{endpoint:<40} {stats['requests']:>7} {stats['errors']:>4} {stats['throughput_rps']:>8.1f} "
+              f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+
+
+def compare(baseline, result, threshold):
+    """Prints the change per endpoint; returns the endpoints that regressed."""
+    regressions = []
+    print(f"\nvs {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}), threshold {threshold:.0%}")
+    print(f"{'endpoint':<40} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}")
+    rows = list(result["endpoints"].items()) + [("TOTAL", result["total"])]
+    for endpoint, stats in rows:
+        old = baseline["total"] if endpoint == "TOTAL" else baseline["endpoints"].get(endpoint)
+        if not old:
+            print(f"{endpoint:<40} (new)")
+            continue
+        change = {key: (stats[key] - old[key]) / old[key] if old[key] else 0.0
+                  for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")}
+        print(f"{endpoint:<40} {change['p50_ms']:>+9.1%} {change['p95_ms']:>+9.1%} "
+              f"{change['p99_ms']:>+9.1%} {change['throughput_rps']:>+9.1%}")
+        if endpoint != "TOTAL" and (change["p95_ms"] > threshold or change["throughput_rps"] < -threshold):
+            regressions.append(endpoint)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--per-day", type=int, default=6)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3, help="seconds run before recording starts")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between workloads per client")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the data already in DB_NAME")
+    parser.add_argument("--base-url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--output", default="load_suite.json")
+    parser.add_argument("--compare", help="an earlier --output file to diff against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold (default 0.10)")
+    args = parser.parse_args()
+    # The app's slow-request log would drown the report on mongomock
+    logging.getLogger("metrics").setLevel(logging.ERROR)
+
+    import db
+    if args.base_url:
+        transport_for = lambda: Http(args.base_url)
+        database = db.get_client()[db.DB_NAME]
+    else:
+        import app as app_module
+        transport_for = lambda: InProcess(app_module.app)
+        database = app_module.db
+    if not args.no_seed:
+        began = time.perf_counter()
+        mongomock = os.environ["MONGO_URI"].startswith("mongomock://")
+        counts = db.seed_synthetic(database, args.users, args.days, args.per_day, args.seed,
+                                   workers=0 if mongomock else (os.cpu_count() or 1), uri=os.environ["MONGO_URI"])
+        print(f"Seeded {db.DB_NAME} in {time.perf_counter() - began:.1f}s: "
+              + ", ".join(f"{count} {name}" for name, count in counts.items()))
+
+    recorder = Recorder()
+    sessions = [
+        Session(transport_for(), recorder, db.synthetic_email(index % args.users), db.SYNTHETIC_PASSWORD,
+                random.Random(args.seed + index))
+        for index in range(args.clients)
+    ]
+    for session in sessions:
+        if session.login() != 200:
+            sys.exit(f"Could not log in as {session.email}; seed the database or drop --no-seed")
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=run_client, args=(session, args.mix, stop, args.days, args.think_ms / 1000))
+               for session in sessions]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    recorder.enabled = True
+    began = time.perf_counter()
+    time.sleep(args.seconds)
+    recorder.enabled = False
+    duration = time.perf_counter() - began
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    endpoints, total = recorder.summary(duration)
+    result = {
+        "meta": {
+            "commit": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "mongo": "mongomock" if os.environ["MONGO_URI"].startswith("mongomock://") else "mongod",
+            "log_storage": db.LOG_STORAGE,
+            "target": args.base_url or "in-process",
+            "users": args.users, "days": args.days, "per_day": args.per_day,
+            "clients": args.clients, "seconds": args.seconds, "mix": args.mix, "seed": args.seed,
+        },
+        "endpoints": endpoints,
+        "total": total,
+    }
+    print_table(endpoints, total)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), result, args.threshold)
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
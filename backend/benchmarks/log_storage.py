@@ -0,0 +1,146 @@
+# backend/benchmarks/log_storage.py
+#
+# Compares the `documents` and `buckets` food log layouts (see log_store.py):
+# collection and index size for the same synthetic logs, and the latency of
+# the summary reads that go through the LogStore (one day, one week).
+#
+#   python -m benchmarks.log_storage [--users 50] [--days 90] [--per-day 6] [--reads 500]
+#
+# Uses MONGO_URI when set (sizes then come from collStats) and mongomock
+# otherwise (sizes are the summed BSON document sizes, without indexes).
+# Writes to a separate `bitecount_benchmark` database.
+
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson import ObjectId
+
+import log_store
+import rollups
+import summary
+from db import get_client
+from food_cache import FoodCache
+from indexes import ensure_indexes
+
+DB_NAME = "bitecount_benchmark"
+FOODS = [
+    ("Apple", 95, 0.5, 25, 0.3),
+    ("Brown Rice", 216, 5, 45, 1.8),
+    ("Grilled Chicken Breast", 165, 31, 0, 3.6),
+    ("Almonds", 164, 6, 6.1, 14.2),
+    ("Greek Yogurt", 100, 10, 3.6, 0.4),
+]
+
+
+def make_entries(food_ids, users, days, per_day, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    seq = 0
+    for user_id in users:
+        for day in range(days):
+            date_str = (start + timedelta(days=day)).strftime('%Y-%m-%d')
+            for _ in range(per_day):
+                index = rng.randrange(len(FOODS))
+                name, calories, protein, carbs, fat = FOODS[index]
+                servings = rng.choice([0.5, 1, 1.5, 2])
+                seq += 1
+                yield {
+                    "user_id": user_id,
+                    "food_id": food_ids[index],
+                    "name": name,
+                    "servings": servings,
+                    "date": date_str,
+                    "total_calories": calories * servings,
+                    "total_macros": {"protein": protein * servings, "carbs": carbs * servings, "fat": fat * servings},
+                    "_seq": seq,
+                }
+
+
+def storage_size(db, store):
+    try:
+        stats = db.command("collStats", store.collection_name)
+        return {"documents": stats["count"], "data_bytes": stats["size"],
+                "storage_bytes": stats.get("storageSize"), "index_bytes": stats.get("totalIndexSize")}
+    except Exception:
+        docs = list(store.collection.find())
+        return {"documents": len(docs), "data_bytes": sum(len(bson.encode(doc)) for doc in docs),
+                "storage_bytes": None, "index_bytes": None}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def time_reads(store, users, days, reads, span, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    samples = []
+    for _ in range(reads):
+        first = start + timedelta(days=rng.randrange(days - span + 1))
+        dates = [(first + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(span)]
+        user = {"_id": rng.choice(users), "profile": {}}
+        began = time.perf_counter()
+        summary.get_range(store, user, dates)
+        samples.append(time.perf_counter() - began)
+    return statistics.median(samples) * 1000, percentile(samples, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--per-day", type=int, default=6)
+    parser.add_argument("--reads", type=int, default=500)
+    args = parser.parse_args()
+
+    client = get_client(os.getenv("MONGO_URI") or "mongomock://localhost")
+    client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+    ensure_indexes(db)
+    food_ids = db.foods.insert_many([
+        {"name": name, "calories": calories, "macros": {"protein": protein, "carbs": carbs, "fat": fat}}
+        for name, calories, protein, carbs, fat in FOODS
+    ]).inserted_ids
+    users = [ObjectId() for _ in range(args.users)]
+    total = args.users * args.days * args.per_day
+    print(f"{args.users} users x {args.days} days x {args.per_day} entries = {total} food logs")
+
+    results = {}
+    for layout in log_store.LAYOUTS:
+        store = log_store.create(db, layout, FoodCache(db.foods))
+        batch = []
+        for entry in make_entries(food_ids, users, args.days, args.per_day):
+            batch.append(entry)
+            if len(batch) == 1000:
+                store.insert(batch)
+                batch = []
+        if batch:
+            store.insert(batch)
+        rollups.rebuild_daily_totals(db, store)
+
+        size = storage_size(db, store)
+        day_p50, day_p99 = time_reads(store, users, args.days, args.reads, 1)
+        week_p50, week_p99 = time_reads(store, users, args.days, args.reads, 7)
+        results[layout] = size
+        print(f"\n{layout} ({store.collection_name})")
+        print(f"  documents      {size['documents']:>12}")
+        print(f"  data bytes     {size['data_bytes']:>12}  ({size['data_bytes'] / total:.0f} per entry)")
+        if size['storage_bytes'] is not None:
+            print(f"  storage bytes  {size['storage_bytes']:>12}")
+            print(f"  index bytes    {size['index_bytes']:>12}")
+        print(f"  summary day    p50 {day_p50:7.2f} ms   p99 {day_p99:7.2f} ms")
+        print(f"  summary week   p50 {week_p50:7.2f} ms   p99 {week_p99:7.2f} ms")
+
+    ratio = results['documents']['data_bytes'] / results['buckets']['data_bytes']
+    print(f"\nbuckets store {ratio:.1f}x less data than documents")
+    client.drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# backend/benchmarks/login_burst.py
+#
+# Measures /api/summary latency while a burst of concurrent logins runs,
+# with bcrypt inline on the request threads vs. in the bounded hashing pool.
+# Runs in-process against mongomock; request threads stand in for gunicorn
+# gthread worker threads.
+#
+#   python -m benchmarks.login_burst [--login-threads 32] [--summary-threads 4] [--seconds 10]
+
+import argparse
+import os
+import statistics
+import threading
+import time
+from datetime import datetime
+
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-enough-bytes")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(app_module, hasher, args):
+    client = app_module.app.test_client()
+    app_module.hasher = hasher
+    email = f"bench-{time.time_ns()}@example.com"
+    client.post("/api/register", json={"name": "Bench", "email": email, "password": "secret"})
+    token = client.post("/api/login", json={"email": email, "password": "secret"}).get_json()["token"]
+    headers = {"x-access-token": token}
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    stop = threading.Event()
+    latencies = []
+    login_status = {}
+    lock = threading.Lock()
+
+    def poll_summary():
+        c = app_module.app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            c.get(f"/api/summary/{today}", headers=headers)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    def login_storm():
+        c = app_module.app.test_client()
+        while not stop.is_set():
+            status = c.post("/api/login", json={"email": email, "password": "secret"}).status_code
+            with lock:
+                login_status[status] = login_status.get(status, 0) + 1
+
+    threads = [threading.Thread(target=poll_summary) for _ in range(args.summary_threads)]
+    threads += [threading.Thread(target=login_storm) for _ in range(args.login_threads)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        "summary_requests": len(latencies),
+        "summary_p50_ms": statistics.median(latencies) * 1000 if latencies else float("nan"),
+        "summary_p99_ms": percentile(latencies, 99) * 1000,
+        "logins": login_status,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--login-threads", type=int, default=32)
+    parser.add_argument("--summary-threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    import app as app_module
+    from hashing import PasswordHasher
+
+    modes = {
+        # Unbounded: every request thread hashes on its own
+        "inline": PasswordHasher(rounds=args.rounds, workers=0, max_pending=10 ** 6),
+        "pool": PasswordHasher(rounds=args.rounds),
+    }
+    print(f"{args.login_threads} login threads, {args.summary_threads} summary pollers, "
+          f"{args.seconds:.0f}s per mode, bcrypt cost {args.rounds}, {os.cpu_count()} CPUs")
+    for name, hasher in modes.items():
+        result = run(app_module, hasher, args)
+        hasher.shutdown()
+        print(f"{name:>7}: summary p50 {result['summary_p50_ms']:.1f} ms, "
+              f"p99 {result['summary_p99_ms']:.1f} ms over {result['summary_requests']} requests; "
+              f"logins by status {result['logins']}")
+
+
+if __name__ == "__main__":
+    main()
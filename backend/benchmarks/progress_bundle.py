@@ -0,0 +1,110 @@
+# backend/benchmarks/progress_bundle.py
+#
+# Compares loading the progress page with GET /api/progress/bundle against
+# the three calls it replaces (/progress/weight, /progress/calories and
+# /progress/check), made one after the other and in parallel the way
+# Progress.jsx used to.
+#
+#   python -m benchmarks.progress_bundle [--requests 500] [--days 365] [--base-url URL]
+#
+# Without --base-url it runs in-process against mongomock, which has no
+# network round-trips, serializes the parallel reads and copies every
+# document an aggregation stage touches, so it shows the bundle at its
+# worst. Point --base-url at a server on a real MongoDB to see the saved
+# round-trips and authentications.
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-enough-bytes")
+os.environ.setdefault("HASH_WORKERS", "0")
+
+from benchmarks.load_suite import Http, InProcess, percentile
+
+THREE_CALLS = ("/api/progress/weight", "/api/progress/calories", "/api/progress/check")
+BUNDLE = "/api/progress/bundle"
+
+
+def seed(transport, headers, days):
+    """Logs a weigh-in and two foods on most of the last `days` days."""
+    _, _, body = transport.request("POST", "/api/foods", {
+        "name": "Bench oats", "serving_size": "1 cup", "weight": 80, "calories": 300,
+        "macros": {"protein": 10, "carbs": 54, "fat": 5},
+    })
+    food_id = json.loads(body)["id"]
+    today = date.today()
+    for offset in range(days):
+        if offset % 5 == 4:
+            continue
+        day = (today - timedelta(days=offset)).isoformat()
+        transport.request("POST", "/api/log/weight", {"weight": 80 - offset / 100, "date": day}, headers)
+        transport.request("POST", "/api/log/food/batch", [
+            {"food_id": food_id, "servings": 1 + offset % 3, "date": day},
+            {"food_id": food_id, "servings": 2, "date": day},
+        ], headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--base-url", help="drive a running server instead of the in-process app")
+    args = parser.parse_args()
+    logging.getLogger("metrics").setLevel(logging.ERROR)
+
+    if args.base_url:
+        new_transport = lambda: Http(args.base_url)
+    else:
+        import app as app_module
+        new_transport = lambda: InProcess(app_module.app)
+
+    transport = new_transport()
+    email = f"bench-{time.time_ns()}@example.com"
+    transport.request("POST", "/api/register", {"name": "Bench", "email": email, "password": "secret"})
+    _, _, body = transport.request("POST", "/api/login", {"email": email, "password": "secret"})
+    headers = {"x-access-token": json.loads(body)["token"]}
+    seed(transport, headers, args.days)
+
+    transports = [new_transport() for _ in THREE_CALLS]
+    pool = ThreadPoolExecutor(max_workers=len(THREE_CALLS))
+
+    def sequential():
+        for path in THREE_CALLS:
+            transport.request("GET", path, headers=headers)
+
+    def parallel():
+        list(pool.map(lambda pair: pair[0].request("GET", pair[1], headers=headers), zip(transports, THREE_CALLS)))
+
+    def bundle():
+        transport.request("GET", BUNDLE, headers=headers)
+
+    modes = [("3 calls, sequential", sequential), ("3 calls, parallel", parallel), ("bundle", bundle)]
+    samples = {name: [] for name, _ in modes}
+    rounds = 10
+    for _ in range(rounds):
+        # Alternating the modes evens out drift
+        for name, fn in modes:
+            for _ in range(max(args.requests // rounds, 1)):
+                began = time.perf_counter()
+                fn()
+                samples[name].append(time.perf_counter() - began)
+
+    _, _, body = transport.request("GET", BUNDLE, headers=headers)
+    print(f"Progress page, {args.days} days of data, {args.requests} loads per mode")
+    baseline = statistics.median(samples[modes[0][0]])
+    for name, _ in modes:
+        median = statistics.median(samples[name])
+        print(f"  {name:<22} median {median * 1e3:7.2f} ms   p95 {percentile(samples[name], 95) * 1e3:7.2f} ms"
+              f"  ({median / baseline:4.2f}x)")
+    print(f"  bundle sections (ms): {json.loads(body)['timings']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# backend/benchmarks/serving_modes.py
+#
+# Load-tests the sync (Flask/gthread) and async (Quart/Motor/uvicorn) serving
+# modes. Starts `gunicorn -c gunicorn.conf.py` once per mode with the same
+# worker count, drives it with concurrent HTTP clients for a fixed time and
+# reports requests/sec and p50/p99 latency per route.
+#
+#   python -m benchmarks.serving_modes [--workers 2] [--clients 32] [--seconds 15]
+#
+# Point MONGO_URI at a real server for meaningful numbers. With the default
+# mongomock:// every worker has its own in-memory database, so only
+# --workers 1 works there, and there is no network round-trip to overlap.
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, pct):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def call(base_url, method, path, body=None, headers=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers={
+        "Content-Type": "application/json", **(headers or {})
+    })
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def start_server(mode, port, workers):
+    env = dict(os.environ, SERVER_MODE=mode, PORT=str(port), WEB_CONCURRENCY=str(workers))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/api/cache/stats", timeout=1)
+            return server, base_url
+        except OSError:
+            time.sleep(0.25)
+    server.kill()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+
+def seed_user(base_url):
+    email = f"bench-{time.time_ns()}@example.com"
+    call(base_url, "POST", "/api/register",
+         {"name": "Bench", "email": email, "password": "secret", "calorieGoal": 2000})
+    status, body = call(base_url, "POST", "/api/login", {"email": email, "password": "secret"})
+    headers = {"x-access-token": json.loads(body)["token"]}
+    status, body = call(base_url, "POST", "/api/foods", {
+        "name": "Bench Oats", "type": "solid", "serving_size": 40, "weight": 40,
+        "calories": 150, "macros": {"protein": 5, "carbs": 27, "fat": 3}
+    }, headers)
+    food_id = json.loads(body)["id"]
+    today = datetime.now().strftime("%Y-%m-%d")
+    for _ in range(5):
+        call(base_url, "POST", "/api/log/food", {"food_id": food_id, "servings": 1, "date": today}, headers)
+    call(base_url, "POST", "/api/log/weight", {"weight": 72.5, "date": today}, headers)
+    return headers, food_id, today
+
+
+def load(base_url, routes, headers, clients, seconds):
+    stop = threading.Event()
+    latencies = {name: [] for name, _, _, _ in routes}
+    errors = {name: 0 for name, _, _, _ in routes}
+    lock = threading.Lock()
+
+    def client(offset):
+        i = offset
+        while not stop.is_set():
+            name, method, path, body = routes[i % len(routes)]
+            i += 1
+            started = time.perf_counter()
+            status, _ = call(base_url, method, path, body, headers)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[name].append(elapsed)
+                if status >= 400:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--port", type=int, default=5101)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-enough-bytes")
+    os.environ.setdefault("BCRYPT_LOG_ROUNDS", "4")
+    os.environ.setdefault("HASH_WORKERS", "0")
+
+    print(f"workers={args.workers} clients={args.clients} seconds={args.seconds} "
+          f"mongo={os.environ['MONGO_URI'].split('@')[-1]}")
+    for port, mode in enumerate(args.modes.split(","), start=args.port):
+        server, base_url = start_server(mode, port, args.workers)
+        try:
+            headers, food_id, today = seed_user(base_url)
+            year, month = today.split("-")[:2]
+            routes = [
+                ("summary", "GET", f"/api/summary/{today}", None),
+                ("progress/weight", "GET", "/api/progress/weight", None),
+                ("progress/calories", "GET", "/api/progress/calories", None),
+                ("month-summary", "GET", f"/api/month-summary/{year}/{int(month)}", None),
+                ("log/activity", "POST", "/api/log/activity", {"calories_burned": 200, "date": today}),
+            ]
+            latencies, errors = load(base_url, routes, headers, args.clients, args.seconds)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+        total = sum(len(samples) for samples in latencies.values())
+        print(f"\n{mode}: {total / args.seconds:8.1f} req/s overall")
+        print(f"  {'route':<20}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, samples in latencies.items():
+            print(f"  {name:<20}{len(samples) / args.seconds:>10.1f}"
+                  f"{statistics.median(samples) * 1000 if samples else float('nan'):>10.1f}"
+                  f"{percentile(samples, 99) * 1000:>10.1f}{errors[name]:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# backend/benchmarks/serving_parity.py
+#
+# Checks that the sync (Flask) and async (Quart/Motor) apps answer the routes
+# they share the same way: two fresh users send the same script of requests,
+# one to app.app and one to asgi.app, and the statuses, bodies (ids masked)
+# and response headers that matter to clients are compared request by
+# request. Runs in-process against mongomock unless MONGO_URI is set.
+#
+#   python -m benchmarks.serving_parity [-v]
+#
+# Exits with status 1 on any difference, so it can run as a check. Only the
+# `documents` log layout is served by Quart; with LOG_STORAGE=buckets the
+# food log routes go to Flask in both modes (see asgi.py).
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-enough-bytes")
+os.environ.setdefault("HASH_WORKERS", "0")
+os.environ.setdefault("BCRYPT_LOG_ROUNDS", "4")
+os.environ.setdefault("PREWARM", "0")
+
+ID_FIELDS = ("_id", "id", "user_id", "food_id")
+COMPARED_HEADERS = ("ETag", "Cache-Control", "X-Access-Token", "X-Next-Cursor", "Retry-After")
+
+
+def day(offset):
+    return (datetime.now() - timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+def script(food_id):
+    """(label, method, path, body) for each request; {log_id} is filled from an earlier response."""
+    today, yesterday = day(0), day(1)
+    month = datetime.now()
+    return [
+        ("log food", "POST", "/api/log/food", {"food_id": food_id, "servings": 1.5, "date": yesterday}),
+        ("log food, unknown", "POST", "/api/log/food", {"food_id": "0" * 24, "servings": 1}),
+        ("batch", "POST", "/api/log/food/batch", {"entries": [
+            {"food_id": food_id, "servings": 1, "date": today},
+            {"food_id": food_id, "servings": 2, "date": yesterday},
+            {"food_id": "0" * 24, "servings": 1},
+            {"servings": 1},
+        ]}),
+        ("batch, empty", "POST", "/api/log/food/batch", {"entries": []}),
+        ("batch, too large", "POST", "/api/log/food/batch", [{"food_id": food_id, "servings": 1}] * 101),
+        ("weight", "POST", "/api/log/weight", {"weight": 80.5, "date": yesterday}),
+        ("activity", "POST", "/api/log/activity", {"calories_burned": 250, "date": yesterday}),
+        ("summary", "GET", f"/api/summary/{yesterday}", None),
+        ("summary, empty day", "GET", f"/api/summary/{day(40)}", None),
+        ("summary range", "GET", f"/api/summary?from={yesterday}&to={today}", None),
+        ("summary range, reversed", "GET", f"/api/summary?from={today}&to={yesterday}", None),
+        ("calorie progress", "GET", "/api/progress/calories", None),
+        ("month summary", "GET", f"/api/month-summary/{month.year}/{month.month}", None),
+        ("progress check", "GET", "/api/progress/check", None),
+        ("streaks", "GET", "/api/streaks", None),
+        ("delete", "DELETE", "/api/log/food/{log_id}", None),
+        ("delete again", "DELETE", "/api/log/food/{log_id}", None),
+        ("delete, bad id", "DELETE", "/api/log/food/not-an-id", None),
+        ("summary after delete", "GET", f"/api/summary/{today}", None),
+        ("streaks after delete", "GET", "/api/streaks", None),
+        ("no token", "GET", "/api/streaks", None),
+    ]
+
+
+def masked(value):
+    if isinstance(value, dict):
+        return {k: "<id>" if k in ID_FIELDS and v is not None else masked(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [masked(v) for v in value]
+    return value
+
+
+def outcome(status, body, headers):
+    """What the client sees: status, body with ids masked, and which headers were sent."""
+    return status, masked(body), sorted(name for name in COMPARED_HEADERS if name in headers)
+
+
+def seed_user(client, label):
+    email = f"parity-{label}-{time.time_ns()}@example.com"
+    client.post("/api/register", json={"name": "Parity", "email": email, "password": "secret", "calorieGoal": 2000})
+    token = client.post("/api/login", json={"email": email, "password": "secret"}).get_json()["token"]
+    headers = {"x-access-token": token}
+    food_id = client.post("/api/foods", headers=headers, json={
+        "name": "Parity Oats", "type": "solid", "serving_size": 40, "weight": 40,
+        "calories": 150, "macros": {"protein": 5, "carbs": 27, "fat": 3}
+    }).get_json()["id"]
+    return headers, food_id
+
+
+def logged_id(body):
+    for result in (body or {}).get("results", []) if isinstance(body, dict) else []:
+        if result and result.get("id"):
+            return result["id"]
+    return None
+
+
+def request_args(method, path, body, headers, label, log_id):
+    path = path.replace("{log_id}", log_id or "0" * 24)
+    if label == "no token":
+        headers = {}
+    return method, path, body, headers
+
+
+def run_sync(client, headers, food_id):
+    outcomes, log_id = [], None
+    for label, *request in script(food_id):
+        method, path, body, request_headers = request_args(*request, headers, label, log_id)
+        response = client.open(path, method=method, json=body, headers=request_headers)
+        data = response.get_json(silent=True)
+        log_id = log_id or logged_id(data)
+        outcomes.append(outcome(response.status_code, data, response.headers))
+    return outcomes
+
+
+async def run_async(client, headers, food_id):
+    outcomes, log_id = [], None
+    for label, *request in script(food_id):
+        method, path, body, request_headers = request_args(*request, headers, label, log_id)
+        response = await client.open(path, method=method, json=body, headers=request_headers)
+        data = await response.get_json()
+        log_id = log_id or logged_id(data)
+        outcomes.append(outcome(response.status_code, data, response.headers))
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every request")
+    args = parser.parse_args()
+
+    import app as sync_app
+    import asgi
+
+    flask_client = sync_app.app.test_client()
+    flask_user = seed_user(flask_client, "sync")
+    async_user = seed_user(flask_client, "async")
+    flask_outcomes = run_sync(flask_client, *flask_user)
+    async_outcomes = asyncio.run(run_async(asgi.app.test_client(), *async_user))
+
+    labels = [label for label, *_ in script(flask_user[1])]
+    mismatches = 0
+    for label, flask_result, async_result in zip(labels, flask_outcomes, async_outcomes):
+        same = flask_result == async_result
+        mismatches += not same
+        if args.verbose or not same:
+            print(f"{'ok  ' if same else 'DIFF'} {label}: sync {flask_result[0]}, async {async_result[0]}")
+        if not same:
+            print(f"     sync:  {flask_result}")
+            print(f"     async: {async_result}")
+    print(f"{len(labels) - mismatches} of {len(labels)} requests answered the same "
+          f"(LOG_STORAGE={sync_app.logs.layout})")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
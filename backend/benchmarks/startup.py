@@ -0,0 +1,83 @@
+# backend/benchmarks/startup.py
+#
+# How long a worker takes to start, in fresh interpreters:
+#   * importing app (median of --runs), checked against IMPORT_BUDGET_MS,
+#     with the slowest imports as reported by python -X importtime
+#   * create_app and each app.prewarm step (the startup profile)
+#
+#   python -m benchmarks.startup [--runs 5] [--top 15] [--budget-ms 1000]
+#
+# Exits with status 1 when the median import is over budget, so it can run
+# as a check. Runs against mongomock unless MONGO_URI is set.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV = {
+    **os.environ,
+    "MONGO_URI": os.getenv("MONGO_URI", "mongomock://localhost"),
+    "SECRET_KEY": os.getenv("SECRET_KEY", "benchmark-secret-key-with-enough-bytes"),
+    "HASH_WORKERS": os.getenv("HASH_WORKERS", "0"),
+}
+
+PROFILE = """
+import json
+import time
+began = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+app.prewarm(background=False)
+print(json.dumps({'wall_import_ms': (imported - began) * 1000, **app.startup_profile}))
+"""
+
+
+def run_python(code, *flags):
+    result = subprocess.run([sys.executable, *flags, "-c", code], cwd=BACKEND, env=ENV,
+                            capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+
+def slowest_imports(stderr, top):
+    """(self ms, cumulative ms, module) of the `top` imports with the most self time."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us) / 1000, int(cumulative_us) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", 1000)))
+    args = parser.parse_args()
+
+    profiles = [json.loads(run_python(PROFILE)[0]) for _ in range(args.runs)]
+    import_ms = statistics.median(profile["import_ms"] for profile in profiles)
+    print(f"import app: median {import_ms:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"create_app: median {statistics.median(p['create_app_ms'] for p in profiles):.1f} ms")
+    print("prewarm steps (median ms):")
+    for step in profiles[0]["prewarm_ms"]:
+        print(f"  {step:<22} {statistics.median(p['prewarm_ms'][step] for p in profiles):8.1f}")
+
+    _, stderr = run_python("import app", "-X", "importtime")
+    print("slowest imports by self time (one run):")
+    for self_ms, cumulative_ms, name in slowest_imports(stderr, args.top):
+        print(f"  {self_ms:7.1f} ms self {cumulative_ms:8.1f} ms cumulative  {name}")
+
+    if import_ms > args.budget_ms:
+        print(f"OVER BUDGET by {import_ms - args.budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# backend/benchmarks/write_behind.py
+#
+# Bursty weight and activity edits, written through (as without
+# WRITE_BEHIND_MS) and through the write-behind queue (write_behind.py):
+# POST latency, and the Mongo writes each mode issued per edit. Every
+# user makes --edits edits to the same day, then reads their summary,
+# which flushes what is still queued.
+#
+#   python -m benchmarks.write_behind [--users 50] [--edits 10] [--window-ms 250]
+#
+# Runs in-process against mongomock. Writes are counted by wrapping the
+# mongomock collection methods, since mongomock emits no command events.
+
+import argparse
+import logging
+import os
+import statistics
+import time
+from collections import Counter
+
+import mongomock
+
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-enough-bytes")
+os.environ.setdefault("HASH_WORKERS", "0")
+os.environ.setdefault("BCRYPT_LOG_ROUNDS", "4")
+
+WRITE_METHODS = ('update_one', 'find_one_and_update', 'bulk_write', 'insert_one')
+writes = Counter()
+
+
+def count_writes():
+    for name in WRITE_METHODS:
+        method = getattr(mongomock.collection.Collection, name)
+
+        def counted(self, *args, _method=method, _name=name, **kwargs):
+            writes[_name] += 1
+            return _method(self, *args, **kwargs)
+        setattr(mongomock.collection.Collection, name, counted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--edits", type=int, default=10)
+    parser.add_argument("--window-ms", type=int, default=250)
+    args = parser.parse_args()
+    os.environ["WRITE_BEHIND_MS"] = str(args.window_ms)
+    logging.getLogger("metrics").setLevel(logging.ERROR)
+
+    import app as app_module
+    client = app_module.app.test_client()
+    queue = app_module.write_queue
+    users = []
+    for i in range(args.users):
+        email = f"bench-{time.time_ns()}-{i}@example.com"
+        client.post("/api/register", json={"name": "Bench", "email": email, "password": "secret"})
+        token = client.post("/api/login", json={"email": email, "password": "secret"}).get_json()["token"]
+        users.append({"x-access-token": token})
+    count_writes()
+
+    print(f"{args.users} users x {args.edits} edits to one day, then a summary read ({args.window_ms} ms window)")
+    for name, write_queue in (("write-through", None), ("write-behind", queue)):
+        app_module.write_queue = write_queue
+        writes.clear()
+        samples = []
+        for headers in users:
+            for edit in range(args.edits):
+                for path, body in (("/api/log/weight", {"weight": 80 + edit / 10, "date": "2026-01-15"}),
+                                   ("/api/log/activity", {"calories_burned": 100 + edit, "date": "2026-01-15"})):
+                    began = time.perf_counter()
+                    client.post(path, json=body, headers=headers)
+                    samples.append(time.perf_counter() - began)
+        for headers in users:
+            client.get("/api/summary/2026-01-15", headers=headers)
+        total = sum(writes.values())
+        print(f"  {name:<14} POST median {statistics.median(samples) * 1e3:6.2f} ms   "
+              f"{total / len(samples):5.2f} Mongo writes per edit  {dict(writes)}")
+    print(f"  queue stats: {queue.cache_stats()}")
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,198 +1,718 @@
 import os
-from pymongo import MongoClient
+import argparse
+import itertools
+import multiprocessing
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import pymongo
+from pymongo import MongoClient, UpdateOne, WriteConcern
+from pymongo.errors import ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError, WaitQueueTimeoutError
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from bson import ObjectId
+from rollups import rebuild_daily_totals
+import adherence
+import food_cache
+import log_store
+import sync
+from hashing import PasswordHasher
+from indexes import ensure_indexes
 
 # Load environment variables from .env file
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = "calorie_tracker_db"
+DB_NAME = os.getenv("DB_NAME", "calorie_tracker_db")
+LOG_STORAGE = os.getenv("LOG_STORAGE", "documents")
+MIGRATION_BATCH_SIZE = 1000
+SEED_BATCH_SIZE = 1000
 
-def setup_database():
+SEED_FOODS = [
+    {
+        "name": "Apple",
+        "type": "Fruit",
+        "serving_size": "1 medium (182g)",
+        "calories": 95,
+        "macros": {"protein": 0.5, "carbs": 25, "fat": 0.3}
+    },
+    {
+        "name": "Grilled Chicken Breast",
+        "type": "Meat",
+        "serving_size": "100g",
+        "calories": 165,
+        "macros": {"protein": 31, "carbs": 0, "fat": 3.6}
+    },
+    {
+        "name": "Brown Rice",
+        "type": "Grain",
+        "serving_size": "1 cup cooked (195g)",
+        "calories": 215,
+        "macros": {"protein": 5, "carbs": 45, "fat": 1.8}
+    },
+    {
+        "name": "Almonds",
+        "type": "Nuts",
+        "serving_size": "1 ounce (28g)",
+        "calories": 164,
+        "macros": {"protein": 6, "carbs": 6.1, "fat": 14.2}
+    },
+    {
+        "name": "Broccoli",
+        "type": "Vegetable",
+        "serving_size": "1 cup chopped (91g)",
+        "calories": 31,
+        "macros": {"protein": 2.5, "carbs": 6, "fat": 0.3}
+    }
+]
+
+
+_mock_client = None
+
+
+def _get_mock_client():
+    # One in-memory server per process, shared by the sync and async clients
+    global _mock_client
+    if _mock_client is None:
+        import mongomock
+        _mock_client = mongomock.MongoClient()
+    return _mock_client
+
+
+def get_client(uri=None, event_listeners=(), **options):
+    """
+    Returns a client for `uri` (defaults to MONGO_URI). A `mongomock://` URI
+    returns an in-memory mongomock client for offline checks and benchmarks
+    (which emits no command or pool events and ignores `options`).
+    """
+    uri = uri or MONGO_URI
+    if uri and uri.startswith("mongomock://"):
+        return _get_mock_client()
+    return MongoClient(uri, event_listeners=list(event_listeners), **options)
+
+
+def get_async_client(uri=None, event_listeners=(), **options):
+    """Motor counterpart of get_client, used by the async serving mode."""
+    uri = uri or MONGO_URI
+    if uri and uri.startswith("mongomock://"):
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient(mock_mongo_client=_get_mock_client())
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(uri, event_listeners=list(event_listeners), **options)
+
+
+# --- API connections ---
+# The API reaches MongoDB through a `Connections` object rather than a
+# module-level client. Its client is created on first use and dropped in a
+# forked child, so a gunicorn master that imported the app never hands its
+# sockets and monitor threads to the workers: each worker connects on its
+# first query. The databases it returns are handles that resolve the current
+# client on every access.
+#
+# Pool and timeout settings come from the environment (POOL_SETTINGS). Two
+# workloads get their own options:
+#   * analytics reads (`analytics_database`): read-only calendar, calorie
+#     series and trend queries go to secondaries (ANALYTICS_READ_PREFERENCE,
+#     at most ANALYTICS_MAX_STALENESS seconds behind), and their route runs
+#     inside `analytics_timeout()`, which gives every operation in it a
+#     maxTimeMS from one ANALYTICS_MAX_TIME_MS budget. Their ETags read
+#     sync_counters from the same server, so a lagging secondary only
+#     delays a change, it never attaches an old response to a new ETag.
+#   * writes: source data is written with MONGO_WRITE_CONCERN (default
+#     majority) and a MONGO_WTIMEOUT_MS bound, while the rollups in
+#     DERIVED_COLLECTIONS use w=1 since they can be recomputed from it
+#     (`python db.py rebuild-totals` after a failover rollback).
+# TIMEOUT_ERRORS are what an exhausted budget, a full pool or an unreachable
+# server raise; the apps answer them with 503 and Retry-After.
+
+# pymongo option: (environment variable, default, type); None = driver default
+POOL_SETTINGS = {
+    'maxPoolSize': ('MONGO_MAX_POOL_SIZE', None, int),
+    'minPoolSize': ('MONGO_MIN_POOL_SIZE', None, int),
+    'maxIdleTimeMS': ('MONGO_MAX_IDLE_TIME_MS', None, int),
+    # How long a request waits for a free connection before failing
+    'waitQueueTimeoutMS': ('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000, int),
+    'serverSelectionTimeoutMS': ('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000, int),
+    'connectTimeoutMS': ('MONGO_CONNECT_TIMEOUT_MS', 5000, int),
+    'w': ('MONGO_WRITE_CONCERN', 'majority', lambda value: int(value) if value.isdigit() else value),
+    'wTimeoutMS': ('MONGO_WTIMEOUT_MS', 5000, int),
+}
+ANALYTICS_READ_PREFERENCE = os.getenv("ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+ANALYTICS_MAX_STALENESS = int(os.getenv("ANALYTICS_MAX_STALENESS", 90))
+ANALYTICS_MAX_TIME_MS = int(os.getenv("ANALYTICS_MAX_TIME_MS", 2000))
+DERIVED_COLLECTIONS = ('daily_totals', 'adherence', 'adherence_streaks')
+DERIVED_WRITE_CONCERN = WriteConcern(w=1)
+TIMEOUT_ERRORS = (ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError, WaitQueueTimeoutError)
+
+
+def pool_options():
+    """The POOL_SETTINGS that are set (or have a default), as client options."""
+    options = {}
+    for option, (variable, default, cast) in POOL_SETTINGS.items():
+        value = os.getenv(variable)
+        if value is not None:
+            options[option] = cast(value)
+        elif default is not None:
+            options[option] = default
+    return options
+
+
+def analytics_read_preference():
+    mode = read_pref_mode_from_name(ANALYTICS_READ_PREFERENCE)
+    if ANALYTICS_READ_PREFERENCE == 'primary':
+        return make_read_preference(mode, None)
+    return make_read_preference(mode, None, max_staleness=ANALYTICS_MAX_STALENESS)
+
+
+def analytics_timeout():
+    """Context manager giving the operations inside it one ANALYTICS_MAX_TIME_MS budget."""
+    return pymongo.timeout(ANALYTICS_MAX_TIME_MS / 1000)
+
+
+_connections = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for connections in list(_connections):
+        connections._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Connections:
+    """The per-process client of the API (see above)."""
+
+    def __init__(self, uri=None, event_listeners=(), **options):
+        self.uri = uri or MONGO_URI
+        self._event_listeners = list(event_listeners)
+        self.options = {**pool_options(), **options}
+        self._client = None
+        self._lock = threading.Lock()
+        _connections.add(self)
+
+    def _connect(self):
+        return get_client(self.uri, self._event_listeners, **self.options)
+
+    @property
+    def client(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._connect()
+                client = self._client
+        return client
+
+    def _after_fork(self):
+        # The parent's client stays with the parent; connect again on first use
+        self._client = None
+        self._lock = threading.Lock()
+
+    def warm(self, connections=1):
+        """
+        Connects now and opens up to `connections` pooled connections (one
+        per concurrent ping) instead of on the first requests.
+        """
+        client = self.client
+        with ThreadPoolExecutor(max_workers=max(connections, 1)) as pool:
+            list(pool.map(lambda _: client.admin.command('ping'), range(max(connections, 1))))
+
+    def database(self, name=DB_NAME):
+        return ProcessLocalDatabase(self, name)
+
+    def analytics_database(self, name=DB_NAME):
+        return ProcessLocalDatabase(self, name, read_preference=analytics_read_preference())
+
+
+class AsyncConnections(Connections):
+    """Connections on a Motor client, for the async serving mode."""
+
+    def _connect(self):
+        return get_async_client(self.uri, self._event_listeners, **self.options)
+
+
+class ProcessLocalDatabase:
+    """
+    A Database handle bound to a Connections rather than a client. Its
+    collections are ProcessLocalCollections; Database methods (command,
+    list_collection_names, ...) go to the current client's database.
+    """
+
+    def __init__(self, connections, name, read_preference=None):
+        self._connections = connections
+        self.name = name
+        self._read_preference = read_preference
+        # (client, database) for the client the database was made from
+        self._resolved = (None, None)
+        self._collections = {}
+
+    def current(self):
+        client = self._connections.client
+        resolved_client, database = self._resolved
+        if resolved_client is not client:
+            database = client.get_database(self.name, read_preference=self._read_preference)
+            self._resolved = (client, database)
+        return database
+
+    def __getitem__(self, name):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = ProcessLocalCollection(self, name)
+        return collection
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        database = self.current()
+        if hasattr(type(database), name):
+            return getattr(database, name)
+        return self[name]
+
+
+class ProcessLocalCollection:
+    """A collection of a ProcessLocalDatabase, with its workload's write concern."""
+
+    def __init__(self, database, name):
+        self._database = database
+        self.name = name
+        self._write_concern = DERIVED_WRITE_CONCERN if name in DERIVED_COLLECTIONS else None
+        self._resolved = (None, None)
+
+    def current(self):
+        database = self._database.current()
+        resolved_database, collection = self._resolved
+        if resolved_database is not database:
+            collection = database.get_collection(self.name, write_concern=self._write_concern)
+            self._resolved = (database, collection)
+        return collection
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+# --- Synthetic data generator ---
+# `python db.py seed` drops the app's collections and generates users, foods
+# and their food/weight/activity logs, with the rollups (daily_totals,
+# adherence) computed alongside instead of re-aggregated afterwards. Users
+# are generated in chunks of USERS_PER_CHUNK across a process pool; each
+# chunk has its own random stream derived from --seed, so the data is the
+# same for any --workers (apart from _ids). Documents go out in unordered
+# insert_many batches of SEED_BATCH_SIZE, and the indexes are built once
+# everything is in.
+SYNTHETIC_COLLECTIONS = (
+    'users', 'foods', 'daily_logs', 'daily_log_buckets', 'weight_logs', 'activity_logs',
+    'daily_totals', 'adherence', 'adherence_streaks', 'sync_counters', 'sync_tombstones',
+)
+SYNTHETIC_PASSWORD = "benchmark"
+USERS_PER_CHUNK = 100
+CALORIE_GOALS = (1600, 1800, 2000, 2200, 2500, 2800)
+# (name, type, serving, calories, protein, carbs, fat) per serving
+BASE_FOODS = [
+    ("Oatmeal", "Grain", "1 cup cooked", 158, 6, 27, 3.2),
+    ("Whole Wheat Bread", "Grain", "1 slice", 81, 4, 14, 1.1),
+    ("White Rice", "Grain", "1 cup cooked", 205, 4.3, 45, 0.4),
+    ("Pasta", "Grain", "1 cup cooked", 221, 8, 43, 1.3),
+    ("Banana", "Fruit", "1 medium", 105, 1.3, 27, 0.4),
+    ("Orange", "Fruit", "1 medium", 62, 1.2, 15, 0.2),
+    ("Blueberries", "Fruit", "1 cup", 84, 1.1, 21, 0.5),
+    ("Salmon Fillet", "Fish", "100g", 208, 20, 0, 13),
+    ("Tuna", "Fish", "100g", 132, 28, 0, 1.3),
+    ("Beef Steak", "Meat", "100g", 271, 25, 0, 19),
+    ("Turkey Breast", "Meat", "100g", 135, 30, 0, 1),
+    ("Egg", "Dairy & Eggs", "1 large", 72, 6.3, 0.4, 4.8),
+    ("Milk", "Dairy & Eggs", "1 cup", 122, 8, 12, 4.8),
+    ("Cheddar Cheese", "Dairy & Eggs", "1 ounce (28g)", 113, 7, 0.4, 9.3),
+    ("Greek Yogurt", "Dairy & Eggs", "170g", 100, 17, 6, 0.7),
+    ("Peanut Butter", "Nuts", "2 tbsp", 188, 8, 6, 16),
+    ("Walnuts", "Nuts", "1 ounce (28g)", 185, 4.3, 3.9, 18.5),
+    ("Avocado", "Fruit", "100g", 160, 2, 9, 15),
+    ("Spinach", "Vegetable", "1 cup", 7, 0.9, 1.1, 0.1),
+    ("Sweet Potato", "Vegetable", "1 medium", 103, 2.3, 24, 0.2),
+    ("Carrots", "Vegetable", "1 cup chopped", 52, 1.2, 12, 0.3),
+    ("Lentils", "Legume", "1 cup cooked", 230, 18, 40, 0.8),
+    ("Black Beans", "Legume", "1 cup cooked", 227, 15, 41, 0.9),
+    ("Tofu", "Legume", "100g", 144, 17, 3, 9),
+    ("Olive Oil", "Fat", "1 tbsp", 119, 0, 0, 13.5),
+    ("Dark Chocolate", "Snack", "1 ounce (28g)", 170, 2.2, 13, 12),
+    ("Potato Chips", "Snack", "1 ounce (28g)", 152, 2, 15, 10),
+    ("Pizza", "Meal", "1 slice", 285, 12, 36, 10),
+    ("Hamburger", "Meal", "1 burger", 354, 20, 29, 17),
+    ("Caesar Salad", "Meal", "1 bowl", 190, 7, 8, 15),
+]
+FOOD_VARIANTS = ["", "Organic ", "Homemade ", "Low-fat ", "Fresh ", "Frozen ", "Restaurant ", "Store-brand "]
+
+
+def synthetic_email(index):
+    return f"user{index}@bench.bitecount"
+
+
+def synthetic_foods(count, rng):
+    """SEED_FOODS, then variants of BASE_FOODS with jittered nutrition, `count` in all."""
+    foods = [dict(food) for food in SEED_FOODS[:count]]
+    while len(foods) < count:
+        n = len(foods) - len(SEED_FOODS)
+        name, food_type, serving, calories, protein, carbs, fat = BASE_FOODS[n % len(BASE_FOODS)]
+        round_number = n // len(BASE_FOODS)
+        prefix = FOOD_VARIANTS[round_number % len(FOOD_VARIANTS)]
+        suffix = f" ({round_number // len(FOOD_VARIANTS) + 1})" if round_number >= len(FOOD_VARIANTS) else ""
+        scale = 1 if not round_number else rng.uniform(0.8, 1.25)
+        foods.append({
+            "name": f"{prefix}{name}{suffix}",
+            "type": food_type,
+            "serving_size": serving,
+            "calories": round(calories * scale),
+            "macros": {"protein": round(protein * scale, 1), "carbs": round(carbs * scale, 1),
+                       "fat": round(fat * scale, 1)},
+        })
+    return foods
+
+
+def _flush(collection, docs):
+    if docs:
+        collection.insert_many(docs, ordered=False)
+        docs.clear()
+
+
+def _seed_users(db, task):
+    """Generates and inserts one chunk of users with all their data; returns counts."""
+    rng = random.Random(f"{task['seed']}:{task['chunk']}")
+    foods = task['foods']
+    # Popular foods get logged far more often (Zipf-like)
+    popularity = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(foods))))
+    logs = log_store.create(db, task['layout'])
+    end = datetime.strptime(task['end'], '%Y-%m-%d')
+    dates = [(end - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(task['days'] - 1, -1, -1)]
+    counts = dict.fromkeys(('users', 'food_logs', 'weight_logs', 'activity_logs'), 0)
+    entries, weights, activities, totals, months, streaks, counters = [], [], [], [], [], [], []
+
+    users = []
+    for index in range(task['first_user'], task['first_user'] + task['users']):
+        users.append({
+            '_id': ObjectId(),
+            'name': f"User {index}",
+            'email': synthetic_email(index),
+            'password_hash': task['password_hash'],
+            'current_weight': round(rng.uniform(55, 110), 1),
+            'macro_goals': {'protein': float(rng.choice([100, 120, 150])), 'carbs': 250.0, 'fat': 70.0},
+            'profile': {
+                'height_cm': rng.randint(150, 200),
+                'weight_kg': 0,
+                'target_weight_kg': 0,
+                'daily_calorie_goal': float(rng.choice(CALORIE_GOALS)),
+            },
+        })
+    db.users.insert_many(users, ordered=False)
+
+    for user in users:
+        user_id = user['_id']
+        goal = user['profile']['daily_calorie_goal']
+        weight = user['current_weight']
+        seq = 0
+        month_calories = {}
+        for date_str in dates:
+            # Days land around the goal, some over it; a few are skipped
+            if rng.random() < 0.05:
+                continue
+            day_target = goal * rng.uniform(0.8, 1.2)
+            day = {'user_id': user_id, 'date': date_str, 'total_calories': 0, 'protein': 0,
+                   'carbs': 0, 'fat': 0, 'entry_count': 0}
+            for food in rng.choices(foods, cum_weights=popularity, k=task['per_day']):
+                servings = max(0.5, round(day_target / task['per_day'] / max(food['calories'], 1) * 2) / 2)
+                servings = min(servings, 4)
+                macros = {macro: value * servings for macro, value in food['macros'].items()}
+                seq += 1
+                entries.append({
+                    'user_id': user_id,
+                    'food_id': food['_id'],
+                    'name': food['name'],
+                    'servings': servings,
+                    'date': date_str,
+                    'total_calories': food['calories'] * servings,
+                    'total_macros': macros,
+                    '_seq': seq,
+                })
+                day['total_calories'] += food['calories'] * servings
+                for macro, value in macros.items():
+                    day[macro] += value
+                day['entry_count'] += 1
+            if rng.random() < 0.7:
+                weight += rng.gauss(-0.02, 0.3)
+                seq += 1
+                weights.append({'user_id': user_id, 'date': date_str, 'weight': round(weight, 2), '_seq': seq})
+                counts['weight_logs'] += 1
+            if rng.random() < 0.3:
+                seq += 1
+                burned = rng.randint(150, 700)
+                activities.append({'user_id': user_id, 'date': date_str, 'calories_burned': burned, '_seq': seq})
+                counts['activity_logs'] += 1
+                day['calories_burned'] = burned
+            totals.append(day)
+            month_calories.setdefault(date_str[:7], {})[date_str[8:10]] = day['total_calories']
+
+            if len(entries) >= SEED_BATCH_SIZE:
+                counts['food_logs'] += len(logs.insert(entries))
+                entries = []
+            for collection, docs in ((db.weight_logs, weights), (db.activity_logs, activities),
+                                     (db.daily_totals, totals)):
+                if len(docs) >= SEED_BATCH_SIZE:
+                    _flush(collection, docs)
+
+        user_months = []
+        for month, calories in sorted(month_calories.items()):
+            logged, success = adherence.bitmaps(calories, goal)
+            user_months.append({'user_id': user_id, 'month': month, 'calories': calories,
+                                'logged': logged, 'success': success, 'goal': goal, 'rev': 0})
+        months += user_months
+        streaks.append(dict(adherence.compute_streaks(user_months), _id=user_id))
+        counters.append({'_id': user_id, 'seq': seq})
+        counts['users'] += 1
+
+    if entries:
+        counts['food_logs'] += len(logs.insert(entries))
+    for collection, docs in ((db.weight_logs, weights), (db.activity_logs, activities),
+                             (db.daily_totals, totals), (db.adherence, months),
+                             (db.adherence_streaks, streaks), (db.sync_counters, counters)):
+        _flush(collection, docs)
+    return counts
+
+
+def _seed_users_in_worker(uri, db_name, task):
+    # Each pool process opens its own client
+    return _seed_users(get_client(uri)[db_name], task)
+
+
+def seed_synthetic(db, users=50, days=90, per_day=6, seed=42, layout=LOG_STORAGE, rounds=4,
+                   foods=200, workers=0, uri=None, progress=None):
     """
-    Connects to MongoDB, drops existing collections for a clean slate,
-    and seeds the database with initial data for all necessary collections.
+    Drops the app's collections and generates `users` users with `per_day`
+    food logs, most days a weigh-in and some days an activity for the `days`
+    days up to today, `foods` foods, and the rollups. Every user's password
+    is SYNTHETIC_PASSWORD, hashed once with `rounds` bcrypt rounds (logins
+    with another BCRYPT_LOG_ROUNDS still work; they get upgraded).
+
+    `workers` > 0 generates the user chunks in that many processes, which
+    connect to `uri` (a real server; mongomock lives in this process only).
+    `progress(done_chunks, total_chunks, counts)` is called after each chunk.
+    Returns the counts.
     """
+    rng = random.Random(seed)
+    for name in SYNTHETIC_COLLECTIONS:
+        db[name].drop()
+
+    food_docs = [dict(food, _id=ObjectId()) for food in synthetic_foods(foods, rng)]
+    for start in range(0, len(food_docs), SEED_BATCH_SIZE):
+        db.foods.insert_many(food_docs[start:start + SEED_BATCH_SIZE], ordered=False)
+    shared = {
+        'seed': seed,
+        'layout': layout,
+        'days': days,
+        'per_day': per_day,
+        'end': datetime.now().strftime('%Y-%m-%d'),
+        'password_hash': PasswordHasher(rounds=rounds, workers=0).hash(SYNTHETIC_PASSWORD),
+        'foods': [{key: food[key] for key in ('_id', 'name', 'calories', 'macros')} for food in food_docs],
+    }
+    tasks = [
+        dict(shared, chunk=chunk, first_user=first, users=min(USERS_PER_CHUNK, users - first))
+        for chunk, first in enumerate(range(0, users, USERS_PER_CHUNK))
+    ]
+
+    counts = {'users': 0, 'foods': len(food_docs), 'food_logs': 0, 'weight_logs': 0, 'activity_logs': 0}
+    pool = None
+    if workers > 0:
+        if not uri or uri.startswith("mongomock://"):
+            raise ValueError("workers > 0 needs a MongoDB server URI; mongomock is per process")
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        results = (future.result() for future in as_completed(
+            [pool.submit(_seed_users_in_worker, uri, db.name, task) for task in tasks]))
+    else:
+        results = (_seed_users(db, task) for task in tasks)
     try:
-        client = MongoClient(MONGO_URI)
+        for done, chunk_counts in enumerate(results, 1):
+            for key, value in chunk_counts.items():
+                counts[key] += value
+            if progress:
+                progress(done, len(tasks), counts)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    ensure_indexes(db)
+    return counts
+
+
+def setup_database(users=10, days=30, per_day=5, foods=200, seed=42, workers=None):
+    """
+    Connects to MongoDB, drops existing collections for a clean slate, and
+    generates a synthetic dataset (see seed_synthetic), printing progress.
+    """
+    try:
+        client = get_client()
         db = client[DB_NAME]
         print("Successfully connected to MongoDB.")
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
         return
 
-     # --- 1. Clean Up Existing Collections ---
-    print("Dropping existing collections for a fresh start...")
-    db.foods.drop()
-    db.daily_logs.drop()
-    db.weight_logs.drop()
-    db.activity_logs.drop() # <-- ADD THIS LINE
-    print("Dropped collections: foods, daily_logs, weight_logs, activity_logs.")
-    print("-" * 20)
-
-
-    # --- 2. The `foods` Collection ---
-    # This collection is the master list of all available food items.
-    # It's used for searching in the "Log Food" page.
-    print("Seeding the 'foods' collection...")
-    foods_collection = db.foods
-    
-    initial_foods = [
-        {
-            "_id": ObjectId(),
-            "name": "Apple",
-            "type": "Fruit",
-            "serving_size": "1 medium (182g)",
-            "calories": 95,
-            "macros": {"protein": 0.5, "carbs": 25, "fat": 0.3}
-        },
-        {
-            "_id": ObjectId(),
-            "name": "Grilled Chicken Breast",
-            "type": "Meat",
-            "serving_size": "100g",
-            "calories": 165,
-            "macros": {"protein": 31, "carbs": 0, "fat": 3.6}
-        },
-        {
-            "_id": ObjectId(),
-            "name": "Brown Rice",
-            "type": "Grain",
-            "serving_size": "1 cup cooked (195g)",
-            "calories": 215,
-            "macros": {"protein": 5, "carbs": 45, "fat": 1.8}
-        },
-        {
-            "_id": ObjectId(),
-            "name": "Almonds",
-            "type": "Nuts",
-            "serving_size": "1 ounce (28g)",
-            "calories": 164,
-            "macros": {"protein": 6, "carbs": 6.1, "fat": 14.2}
-        },
-        {
-            "_id": ObjectId(),
-            "name": "Broccoli",
-            "type": "Vegetable",
-            "serving_size": "1 cup chopped (91g)",
-            "calories": 31,
-            "macros": {"protein": 2.5, "carbs": 6, "fat": 0.3}
-        }
-    ]
-    foods_collection.insert_many(initial_foods)
-    print(f"Inserted {len(initial_foods)} documents into 'foods'.")
-    print("-" * 20)
-
-
-    # --- 3. The `daily_logs` Collection ---
-    # This collection stores every instance of a food being logged on a specific date.
-    # It powers the Dashboard summary and the calorie progress chart.
-    print("Seeding the 'daily_logs' collection with sample data for the past 5 days...")
-    daily_logs_collection = db.daily_logs
-    
-    sample_daily_logs = []
-    # Let's create some data for the last 5 days to make the charts look good
-    for i in range(5):
-        log_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-        
-        # Log chicken and rice for each of the last 5 days
-        chicken = initial_foods[1]
-        rice = initial_foods[2]
-        
-        # Log 1.5 servings of chicken
-        servings_chicken = 1.5
-        sample_daily_logs.append({
-            "food_id": chicken['_id'],
-            "name": chicken['name'],
-            "servings": servings_chicken,
-            "date": log_date,
-            "total_calories": chicken['calories'] * servings_chicken,
-            "total_macros": {
-                "protein": chicken['macros']['protein'] * servings_chicken,
-                "carbs": chicken['macros']['carbs'] * servings_chicken,
-                "fat": chicken['macros']['fat'] * servings_chicken
-            }
-        })
-        
-        # Log 1 serving of rice
-        servings_rice = 1
-        sample_daily_logs.append({
-            "food_id": rice['_id'],
-            "name": rice['name'],
-            "servings": servings_rice,
-            "date": log_date,
-            "total_calories": rice['calories'] * servings_rice,
-            "total_macros": {
-                "protein": rice['macros']['protein'] * servings_rice,
-                "carbs": rice['macros']['carbs'] * servings_rice,
-                "fat": rice['macros']['fat'] * servings_rice
-            }
-        })
-    
-    # Add an apple for today's log as well
-    today_date = datetime.now().strftime('%Y-%m-%d')
-    apple = initial_foods[0]
-    servings_apple = 1
-    sample_daily_logs.append({
-            "food_id": apple['_id'],
-            "name": apple['name'],
-            "servings": servings_apple,
-            "date": today_date,
-            "total_calories": apple['calories'] * servings_apple,
-            "total_macros": {
-                "protein": apple['macros']['protein'] * servings_apple,
-                "carbs": apple['macros']['carbs'] * servings_apple,
-                "fat": apple['macros']['fat'] * servings_apple
-            }
-        })
+    mongomock = not MONGO_URI or MONGO_URI.startswith("mongomock://")
+    if workers is None:
+        workers = 0 if mongomock else (os.cpu_count() or 1)
+    print(f"Generating {users} users x {days} days x {per_day} food logs and {foods} foods "
+          f"into '{DB_NAME}' ({LOG_STORAGE} layout, {workers or 'no'} worker processes)...")
+    started = time.perf_counter()
 
-    daily_logs_collection.insert_many(sample_daily_logs)
-    print(f"Inserted {len(sample_daily_logs)} documents into 'daily_logs'.")
-    print("-" * 20)
-
-
-    # --- 4. The `weight_logs` Collection ---
-    # This collection stores weight entries over time.
-    # It is used to render the weight progress chart.
-    print("Seeding the 'weight_logs' collection with sample data...")
-    weight_logs_collection = db.weight_logs
-    
-    sample_weight_logs = []
-    base_weight = 75.0
-    for i in range(7): # Data for the last week
-        log_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-        # Simulate small weight fluctuations
-        current_weight = base_weight - (i * 0.15) + ((-1)**i * 0.1) 
-        sample_weight_logs.append({
-            "date": log_date,
-            "weight": round(current_weight, 2)
-        })
+    def progress(done, total, counts):
+        elapsed = time.perf_counter() - started
+        print(f"  chunk {done}/{total}: {counts['users']} users, {counts['food_logs']} food logs "
+              f"({counts['food_logs'] / elapsed:,.0f} logs/s)")
 
-    # Data is inserted in reverse chronological order, but the API will sort it.
-    weight_logs_collection.insert_many(sample_weight_logs)
-    print(f"Inserted {len(sample_weight_logs)} documents into 'weight_logs'.")
-    print("-" * 20)
-
-    # --- 5. The `activity_logs` Collection ---
-    # This collection stores calories burned through activity on a specific date.
-    print("Seeding the 'activity_logs' collection with sample data...")
-    activity_logs_collection = db.activity_logs
-    
-    sample_activity_logs = [
-        {"date": (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'), "calories_burned": 350},
-        {"date": (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d'), "calories_burned": 410},
-    ]
-    activity_logs_collection.insert_many(sample_activity_logs)
-    print(f"Inserted {len(sample_activity_logs)} documents into 'activity_logs'.")
-    print("-" * 20)
-    
-    print("\nDatabase setup and seeding complete!")
+    counts = seed_synthetic(db, users, days, per_day, seed, foods=foods, workers=workers,
+                            uri=None if mongomock else MONGO_URI, progress=progress)
+    print(", ".join(f"{count} {name}" for name, count in counts.items()))
+    print(f"Every user's password is '{SYNTHETIC_PASSWORD}' (emails: {synthetic_email(0)} ...)")
+    print(f"\nDatabase setup and seeding complete in {time.perf_counter() - started:.1f}s!")
 
 
+def rebuild_totals():
+    """
+    Backfills (or repairs) the `daily_totals` rollup collection from the raw
+    daily_logs and activity_logs, then the `adherence` calendars and streaks
+    from daily_totals, and the most logged foods the workers preload (see
+    food_cache.py). Safe to re-run at any time.
+    """
+    try:
+        client = get_client()
+        db = client[DB_NAME]
+        print("Successfully connected to MongoDB.")
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+        return
+
+    print("Rebuilding the 'daily_totals' collection...")
+    logs = log_store.create(db, LOG_STORAGE)
+    count = rebuild_daily_totals(db, logs)
+    print(f"Wrote {count} documents into 'daily_totals'.")
+    print("Rebuilding the 'adherence' calendars and streaks...")
+    count = adherence.rebuild(db)
+    print(f"Wrote {count} documents into 'adherence'.")
+    food_ids = logs.most_logged_foods(food_cache.POPULAR_FOODS_LIMIT)
+    food_cache.store_popular_foods(db, food_ids)
+    print(f"Stored the {len(food_ids)} most logged foods in 'popular_foods'.")
+    # The rebuilt collections carry their indexes over; this covers any others
+    ensure_indexes(db)
+
+
+def migrate_logs(target_layout, drop_source=False):
+    """
+    Copies every food log entry into the `target_layout` storage (see
+    log_store.py), keeping _ids and sync sequence numbers. daily_totals is
+    layout-independent and needs no rebuild. Entries without a user_id (the
+    demo seed data) are not copied.
+    """
+    try:
+        client = get_client()
+        db = client[DB_NAME]
+        print("Successfully connected to MongoDB.")
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+        return
+
+    source_layout = next(layout for layout in log_store.LAYOUTS if layout != target_layout)
+    source = log_store.create(db, source_layout)
+    target = log_store.create(db, target_layout)
+    if target.collection.estimated_document_count():
+        print(f"'{target.collection_name}' is not empty; drop it first to re-run the migration.")
+        return
 
+    print(f"Copying food logs from '{source.collection_name}' to '{target.collection_name}'...")
+    copied = 0
+    batch = []
+    for entry in source.all_entries():
+        batch.append(entry)
+        if len(batch) == MIGRATION_BATCH_SIZE:
+            target.insert(batch)
+            copied += len(batch)
+            batch = []
+    if batch:
+        target.insert(batch)
+        copied += len(batch)
+    ensure_indexes(db)
+    print(f"Copied {copied} entries into {target.collection.estimated_document_count()} "
+          f"'{target.collection_name}' documents.")
+
+    if drop_source:
+        source.collection.drop()
+        print(f"Dropped '{source.collection_name}'.")
+    print(f"Set LOG_STORAGE={target_layout} and restart the API to use it.")
+
+
+def _sequence(db, collection):
+    """Stamps the documents of `collection` that have no sync sequence number; returns how many."""
+    unsequenced = {'user_id': {'$exists': True}, '_seq': {'$in': [None, 0]}}
+    per_user = {}
+    for doc in collection.find(unsequenced, {'user_id': 1}):
+        per_user.setdefault(doc['user_id'], []).append(doc['_id'])
+    for user_id, ids in per_user.items():
+        for start in range(0, len(ids), MIGRATION_BATCH_SIZE):
+            batch = ids[start:start + MIGRATION_BATCH_SIZE]
+            first_seq = sync.reserve(db, user_id, len(batch))
+            # A document written meanwhile already has its own number
+            collection.bulk_write([
+                UpdateOne({'_id': doc_id, '_seq': {'$in': [None, 0]}}, {'$set': {'_seq': first_seq + offset}})
+                for offset, doc_id in enumerate(batch)
+            ], ordered=False)
+    return sum(len(ids) for ids in per_user.values())
+
+
+def sequence_logs():
+    """
+    Gives the synced logs written before the change feed existed a sync
+    sequence number (see sync.py): /api/sync snapshots page by _seq, so
+    documents without one would be left out. Run once after upgrading; safe
+    to re-run at any time. Bucketed food logs get one number per bucket.
+    """
+    try:
+        client = get_client()
+        db = client[DB_NAME]
+        print("Successfully connected to MongoDB.")
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+        return
+
+    for collection in (db.weight_logs, db.activity_logs, log_store.create(db, LOG_STORAGE).collection):
+        print(f"Stamped {_sequence(db, collection)} documents in '{collection.name}'.")
 
 
 if __name__ == "__main__":
-    setup_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="BiteCount database tools")
+    parser.add_argument(
+        "command", nargs="?", default="seed", choices=["seed", "rebuild-totals", "migrate-logs", "sequence-logs"],
+        help="seed: drop all collections and generate synthetic data (default); "
+             "rebuild-totals: backfill the daily_totals rollup and adherence calendars from existing logs; "
+             "migrate-logs: copy food logs into another storage layout; "
+             "sequence-logs: give logs from before offline sync a sync sequence number"
+    )
+    parser.add_argument("--users", type=int, default=10, help="seed: number of users")
+    parser.add_argument("--days", type=int, default=30, help="seed: days of history per user")
+    parser.add_argument("--per-day", type=int, default=5, help="seed: food logs per user per day")
+    parser.add_argument("--foods", type=int, default=200, help="seed: number of foods")
+    parser.add_argument("--seed", type=int, default=42, help="seed: random seed")
+    parser.add_argument("--workers", type=int,
+                        help="seed: generator processes (default: one per CPU; none with mongomock)")
+    parser.add_argument("--to", choices=log_store.LAYOUTS, default="buckets",
+                        help="migrate-logs: the layout to copy into (default: buckets)")
+    parser.add_argument("--drop-source", action="store_true",
+                        help="migrate-logs: drop the old collection after copying")
+    args = parser.parse_args()
+
+    if args.command == "rebuild-totals":
+        rebuild_totals()
+    elif args.command == "migrate-logs":
+        migrate_logs(args.to, args.drop_source)
+    elif args.command == "sequence-logs":
+        sequence_logs()
+    else:
+        setup_database(args.users, args.days, args.per_day, args.foods, args.seed, args.workers)
@@ -0,0 +1,48 @@
+# backend/driver.py
+
+import asyncio
+import inspect
+
+# --- Code shared by the PyMongo and Motor halves ---
+# The Flask app (app.py) talks to Mongo through PyMongo and the async mode
+# (asgi.py) through Motor, but the database logic behind their routes is
+# written once, as coroutines that pass the value of every database call
+# through `result` and turn every cursor into a list with `to_list`. Under
+# Motor those await the call; under PyMongo the call has already returned
+# its value, nothing ever suspends, and `run` finishes the coroutine in one
+# step on the calling thread. Anything else a coroutine needs that differs
+# per half (loading a user, flushing the write-behind queue) is a callable
+# whose return value also goes through `result`.
+
+
+async def result(value):
+    """The value of a database call: awaited under Motor, as is under PyMongo."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+async def to_list(cursor):
+    """Every document of a PyMongo or Motor cursor."""
+    if hasattr(cursor, 'to_list'):
+        return await result(cursor.to_list(None))
+    return list(cursor)
+
+
+async def sequential(*awaitables):
+    """asyncio.gather for `run`: awaits one after the other."""
+    return [await awaitable for awaitable in awaitables]
+
+
+async def concurrent(*awaitables):
+    return await asyncio.gather(*awaitables)
+
+
+def run(coroutine):
+    """Runs a coroutine that only awaits PyMongo values, and returns its result."""
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    coroutine.close()
+    raise RuntimeError("run() needs a coroutine that does not suspend; use it with PyMongo only")
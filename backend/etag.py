@@ -0,0 +1,76 @@
+# backend/etag.py
+
+import hashlib
+from datetime import datetime
+from functools import wraps
+from flask import make_response, request
+
+import driver
+
+# --- Conditional GET for per-user read endpoints ---
+# Each user has a version number per resource (daily_logs, weight_logs,
+# activity_logs, users), kept in the `versions` field of their sync_counters
+# document. Every write bumps the versions it changes with `bump`, after the
+# write has landed; sync.reserve only hands out the sequence numbers. A response's ETag hashes the
+# request path with the versions it depends on. A matching If-None-Match is
+# answered with 304 after one _id lookup, without running the route.
+# Routes served from access token claims (see tokens.py) also hash the
+# `users` version the claims were issued at, since the response depends on it.
+
+CACHE_CONTROL = 'private, no-cache'
+
+stats = {'not_modified': 0, 'full_responses': 0}
+
+
+async def bump_async(db, user_id, *resources):
+    await driver.result(db.sync_counters.update_one(
+        {'_id': user_id},
+        {'$inc': {f'versions.{resource}': 1 for resource in resources}},
+        upsert=True
+    ))
+
+
+def bump(db, user_id, *resources):
+    driver.run(bump_async(db, user_id, *resources))
+
+
+def etag_for(user_id, full_path, versions, resources, vary_by_day=False, claims_version=None):
+    """Hashes a request path with the user's versions of `resources`."""
+    parts = [str(user_id), full_path]
+    parts += [f"{resource}={versions.get(resource, 0)}" for resource in resources]
+    if claims_version is not None:
+        parts.append(f"claims={claims_version}")
+    if vary_by_day:
+        # Windows relative to "today" change at midnight even without writes
+        parts.append(datetime.now().strftime('%Y-%m-%d'))
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _compute_etag(db, user, resources, vary_by_day):
+    counter = db.sync_counters.find_one({'_id': user['_id']}, {'versions': 1}) or {}
+    return etag_for(user['_id'], request.full_path, counter.get('versions', {}), resources, vary_by_day,
+                    user.get('claims_version'))
+
+
+def conditional(db, *resources, vary_by_day=False):
+    """
+    Decorates a token_required route (first argument: current_user) with a
+    strong ETag over `resources`, answering If-None-Match hits with 304.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            etag = _compute_etag(db, current_user, resources, vary_by_day)
+            if request.if_none_match.contains(etag):
+                stats['not_modified'] += 1
+                response = make_response('', 304)
+            else:
+                stats['full_responses'] += 1
+                response = make_response(f(current_user, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = CACHE_CONTROL
+            return response
+        return decorated
+    return decorator
@@ -0,0 +1,163 @@
+# backend/food_cache.py
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import driver
+
+logger = logging.getLogger(__name__)
+
+# --- Food catalog read-through cache ---
+# Every food log write needs the food's name, calories and macros, and those
+# don't change after add_food. This keeps the most recently used foods as
+# compact FoodRecords in an LRU bounded to `maxsize` entries, loading misses
+# from the foods collection. `warm` preloads the foods logged most often,
+# from the `popular_foods` list that `python db.py rebuild-totals` stores:
+# one small document read at startup rather than an aggregation over every
+# log entry.
+# A route that edits or deletes a food must call `invalidate` (and, with
+# several workers, accept that others keep their copy until it is evicted).
+
+RECORD_FIELDS = {'name': 1, 'calories': 1, 'macros': 1}
+_LOAD_CHUNK = 500
+POPULAR_FOODS_ID = 'most_logged'
+POPULAR_FOODS_LIMIT = 5000
+
+
+def store_popular_foods(db, food_ids):
+    """Saves the ids of the most logged foods, most logged first."""
+    db.popular_foods.replace_one(
+        {'_id': POPULAR_FOODS_ID},
+        {'food_ids': list(food_ids), 'updated_at': datetime.utcnow()},
+        upsert=True
+    )
+
+
+def popular_foods(db, limit):
+    """Up to `limit` of the ids saved by store_popular_foods (none before the first rebuild)."""
+    doc = db.popular_foods.find_one({'_id': POPULAR_FOODS_ID}, {'food_ids': 1})
+    return (doc or {}).get('food_ids', [])[:limit]
+
+
+class FoodRecord:
+    __slots__ = ('_id', 'name', 'calories', 'protein', 'carbs', 'fat')
+
+    def __init__(self, _id, name, calories, protein, carbs, fat):
+        self._id = _id
+        self.name = name
+        self.calories = calories
+        self.protein = protein
+        self.carbs = carbs
+        self.fat = fat
+
+    @classmethod
+    def from_doc(cls, doc):
+        macros = doc.get('macros') or {}
+        return cls(doc['_id'], doc.get('name'), doc.get('calories') or 0,
+                   macros.get('protein') or 0, macros.get('carbs') or 0, macros.get('fat') or 0)
+
+
+class FoodCache:
+    def __init__(self, collection, maxsize=5000):
+        self._collection = collection
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.warmed = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def lookup(self, food_id):
+        """Returns the cached record, or None on a miss (without loading it)."""
+        with self._lock:
+            record = self._records.get(food_id)
+            if record is None:
+                self.misses += 1
+                return None
+            self._records.move_to_end(food_id)
+            self.hits += 1
+            return record
+
+    def put(self, doc):
+        """Caches a foods document and returns its FoodRecord."""
+        record = FoodRecord.from_doc(doc)
+        with self._lock:
+            self._records[record._id] = record
+            self._records.move_to_end(record._id)
+            while len(self._records) > self._maxsize:
+                self._records.popitem(last=False)
+                self.evictions += 1
+        return record
+
+    def get(self, food_id):
+        """Returns the FoodRecord for `food_id`, or None if there is no such food."""
+        record = self.lookup(food_id)
+        if record is None:
+            doc = self._collection.find_one({'_id': food_id}, RECORD_FIELDS)
+            if doc is not None:
+                record = self.put(doc)
+        return record
+
+    async def get_many_async(self, food_ids, collection=None):
+        """
+        Returns {food_id: FoodRecord}, loading every miss with one $in query
+        on `collection` (default the cache's own; the Motor one in asgi.py).
+        """
+        records = {}
+        missing = []
+        for food_id in food_ids:
+            record = self.lookup(food_id)
+            if record is None:
+                missing.append(food_id)
+            else:
+                records[food_id] = record
+        if missing:
+            collection = collection if collection is not None else self._collection
+            for doc in await driver.to_list(collection.find({'_id': {'$in': missing}}, RECORD_FIELDS)):
+                records[doc['_id']] = self.put(doc)
+        return records
+
+    def get_many(self, food_ids):
+        return driver.run(self.get_many_async(food_ids))
+
+    def invalidate(self, food_id):
+        with self._lock:
+            self.invalidations += 1
+            self._records.pop(food_id, None)
+
+    def warm(self, most_logged_foods, limit=None):
+        """
+        Loads the `limit` (default: maxsize) most frequently logged foods, as
+        returned by `most_logged_foods(limit)` (e.g. popular_foods). Meant to
+        run once per worker in a background thread at startup.
+        """
+        limit = min(limit or self._maxsize, self._maxsize)
+        try:
+            food_ids = most_logged_foods(limit)
+            for start in range(0, len(food_ids), _LOAD_CHUNK):
+                chunk = food_ids[start:start + _LOAD_CHUNK]
+                for doc in self._collection.find({'_id': {'$in': chunk}}, RECORD_FIELDS):
+                    self.put(doc)
+                    self.warmed += 1
+        except Exception as e:
+            logger.warning("Food cache warm-up failed: %s", e)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'warmed': self.warmed,
+            'size': len(self._records),
+            'maxsize': self._maxsize,
+        }
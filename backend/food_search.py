@@ -0,0 +1,205 @@
+# backend/food_search.py
+
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+# --- In-memory food search ---
+# The whole `foods` catalog is mirrored in process memory with two indexes:
+#   * trigram -> set of food ids, to find substring matches for queries of
+#     three or more characters without scanning every name
+#   * a sorted list of (word, food id), to find word prefixes with bisect
+# Results are ranked: name prefix > word start > plain substring.
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+RANK_PREFIX = 0
+RANK_WORD_START = 1
+RANK_SUBSTRING = 2
+
+# One- and two-character queries match a large share of the catalog, so their
+# top results are memoized until the catalog changes.
+SHORT_QUERY_CACHE_SIZE = 50
+# Results returned by `search` unless the caller asks for more (or None: all)
+DEFAULT_LIMIT = 50
+
+
+def _normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _rank(name, query):
+    if name.startswith(query):
+        return RANK_PREFIX
+    idx = name.find(query)
+    while idx != -1:
+        if not name[idx - 1].isalnum():
+            return RANK_WORD_START
+        idx = name.find(query, idx + 1)
+    return RANK_SUBSTRING
+
+
+class FoodSearchIndex:
+    """
+    Ranked typeahead search over the foods collection. The catalog is loaded
+    lazily on the first search; foods inserted by this process are added with
+    `add`, and foods inserted by other workers are picked up by an incremental
+    `_id > last seen` refresh every `refresh_interval` seconds.
+    """
+
+    def __init__(self, collection, refresh_interval=30):
+        self._collection = collection
+        self._refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._docs = {}
+        self._names = {}
+        self._trigrams = defaultdict(set)
+        self._words = []
+        self._max_id = None
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._short_cache = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- Maintenance ---
+    def _index(self, doc, words):
+        self._short_cache.clear()
+        key = doc['_id']
+        if key in self._docs:
+            self._unindex(key)
+        name = _normalize(doc.get('name', ''))
+        self._docs[key] = doc
+        self._names[key] = name
+        for tri in _trigrams(name):
+            self._trigrams[tri].add(key)
+        for word in set(_WORD_RE.findall(name)):
+            words.append((word, key))
+        if self._max_id is None or key > self._max_id:
+            self._max_id = key
+
+    def _unindex(self, key):
+        self._short_cache.clear()
+        name = self._names.pop(key)
+        del self._docs[key]
+        for tri in _trigrams(name):
+            postings = self._trigrams.get(tri)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._trigrams[tri]
+        for word in set(_WORD_RE.findall(name)):
+            idx = bisect_left(self._words, (word, key))
+            if idx < len(self._words) and self._words[idx] == (word, key):
+                del self._words[idx]
+
+    def load(self):
+        """(Re)builds the index from the whole collection."""
+        with self._lock:
+            self._docs, self._names = {}, {}
+            self._trigrams = defaultdict(set)
+            self._max_id = None
+            words = []
+            for doc in self._collection.find().sort('_id', 1):
+                self._index(doc, words)
+            words.sort()
+            self._words = words
+            self._loaded = True
+            self._last_refresh = time.monotonic()
+
+    def refresh(self):
+        """Adds foods inserted since the last load/refresh (e.g. by other workers)."""
+        with self._lock:
+            max_id = self._max_id
+        query = {'_id': {'$gt': max_id}} if max_id is not None else {}
+        new_docs = list(self._collection.find(query).sort('_id', 1))
+        with self._lock:
+            for doc in new_docs:
+                # `add` may have indexed it (possibly a newer edit) meanwhile
+                if doc['_id'] not in self._docs:
+                    self._add_locked(doc)
+            self._last_refresh = time.monotonic()
+
+    def _add_locked(self, doc):
+        words = []
+        self._index(doc, words)
+        for entry in words:
+            insort(self._words, entry)
+
+    def add(self, doc):
+        """Indexes a newly inserted (or edited) food document."""
+        if not self._loaded:
+            return  # Picked up by the initial load
+        with self._lock:
+            self._add_locked(doc)
+
+    def remove(self, food_id):
+        with self._lock:
+            if food_id in self._docs:
+                self._unindex(food_id)
+
+    def _ensure_fresh(self):
+        if not self._loaded:
+            self.load()
+        elif time.monotonic() - self._last_refresh > self._refresh_interval:
+            self.refresh()
+
+    # --- Search ---
+    def _word_prefix_matches(self, query):
+        matches = set()
+        idx = bisect_left(self._words, (query,))
+        while idx < len(self._words) and self._words[idx][0].startswith(query):
+            matches.add(self._words[idx][1])
+            idx += 1
+        return matches
+
+    def _candidates(self, query, limit):
+        if len(query) >= 3:
+            postings = sorted((self._trigrams.get(tri, ()) for tri in _trigrams(query)), key=len)
+            if not postings or not postings[0]:
+                return []
+            keys = set(postings[0]).intersection(*postings[1:])
+            return [key for key in keys if query in self._names[key]]
+
+        # Too short for trigrams: word prefixes first, then a scan for plain
+        # substrings only when the prefixes don't fill the page.
+        keys = self._word_prefix_matches(query)
+        if limit is None or len(keys) < limit:
+            keys.update(key for key, name in self._names.items() if query in name)
+        return keys
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Returns up to `limit` food documents matching `query`, best matches first."""
+        self._ensure_fresh()
+        query = _normalize(query)
+        with self._lock:
+            if not query:
+                docs = iter(self._docs.values())
+                return list(docs) if limit is None else [doc for _, doc in zip(range(limit), docs)]
+
+            def sort_key(key):
+                name = self._names[key]
+                return (_rank(name, query), len(name), name)
+
+            if len(query) < 3 and limit is not None and limit <= SHORT_QUERY_CACHE_SIZE:
+                ranked = self._short_cache.get(query)
+                if ranked is None:
+                    keys = self._candidates(query, SHORT_QUERY_CACHE_SIZE)
+                    ranked = heapq.nsmallest(SHORT_QUERY_CACHE_SIZE, keys, key=sort_key)
+                    self._short_cache[query] = ranked
+                return [self._docs[key] for key in ranked[:limit]]
+
+            keys = self._candidates(query, limit)
+            if limit is None:
+                ranked = sorted(keys, key=sort_key)
+            else:
+                ranked = heapq.nsmallest(limit, keys, key=sort_key)
+            return [self._docs[key] for key in ranked]
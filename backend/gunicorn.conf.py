@@ -0,0 +1,42 @@
+# backend/gunicorn.conf.py
+#
+# SERVER_MODE picks how the API is served:
+#   sync  (default) - the Flask app on threaded workers (gthread)
+#   async           - asgi:application on uvicorn workers; see asgi.py
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# Each worker imports the app itself (no preload), so nothing the app
+# creates is shared across a fork. Unless PREWARM=0, a worker runs the
+# app's startup steps (app.prewarm: Mongo pool, indexes, bcrypt processes)
+# before it accepts requests, and logs its startup profile; the food caches
+# are loaded in the background after that.
+# PREWARM_TIMEOUT (app.py) keeps that under the worker `timeout`.
+
+import os
+
+SERVER_MODE = os.getenv("SERVER_MODE", "sync").lower()
+if SERVER_MODE not in ("sync", "async"):
+    raise ValueError(f"SERVER_MODE must be 'sync' or 'async', not {SERVER_MODE!r}")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+
+if SERVER_MODE == "async":
+    wsgi_app = "asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", 4))
+
+PREWARM = os.getenv("PREWARM", "1") != "0"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+
+
+def post_worker_init(worker):
+    # Runs in the worker after it loaded the app, before it serves
+    import app
+    if PREWARM:
+        app.prewarm()
+    worker.log.info("Worker %s ready: %s", worker.pid, app.startup_profile)
@@ -0,0 +1,290 @@
+# backend/handlers.py
+
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+import adherence
+import analytics
+import db as mongo
+import driver
+import etag
+import progress
+import rollups
+import summary
+import sync
+import tokens
+
+# --- Route logic shared by the Flask and Quart apps ---
+# The logging, summary and progress routes exist in both serving modes:
+# app.py (Flask on PyMongo) and asgi.py (Quart on Motor). Each route there
+# authenticates, reads the request and calls the handler here with its
+# Services; the handler does the work and returns (body, status, headers),
+# which the route jsonifies. Handlers are driver-agnostic coroutines (see
+# driver.py): app.py runs them with driver.run, asgi.py awaits them. Fix a
+# route here, not in one of the apps.
+
+MAX_BATCH_SIZE = 100
+DATE_FORMAT = '%Y-%m-%d'
+CALORIE_DAYS = 30
+
+
+class Services:
+    """
+    One serving mode's database handles and per-process services.
+    `load_user(user_id)` and `flush_user(user_id)` (default: the write-behind
+    queue's, on the calling thread) may return a value or an awaitable;
+    `gather(*awaitables)` runs independent writes, concurrently where the
+    driver allows it.
+    """
+
+    def __init__(self, db, analytics_db, logs, food_cache, user_cache, token_service, write_queue,
+                 load_user, flush_user=None, gather=driver.sequential):
+        self.db = db
+        self.analytics_db = analytics_db
+        self.logs = logs
+        self.food_cache = food_cache
+        self.user_cache = user_cache
+        self.token_service = token_service
+        self.write_queue = write_queue
+        self.load_user = load_user
+        self.flush_user = flush_user or (write_queue.flush_user if write_queue is not None else None)
+        self.gather = gather
+
+
+def _today():
+    return datetime.now().strftime(DATE_FORMAT)
+
+
+async def access_token(services, user):
+    """An access token with the user's current claims (see tokens.py)."""
+    counter = await driver.result(services.db.sync_counters.find_one({'_id': user['_id']}, {'versions': 1}))
+    return services.token_service.access_token(user, tokens.users_version(counter))
+
+
+async def _renewed_token(services, user_id):
+    user = await driver.result(services.load_user(user_id))
+    return {tokens.RENEWED_TOKEN_HEADER: await access_token(services, user)}
+
+
+# 2. Daily Logging
+def build_food_log(user_id, food, servings, log_date_str):
+    """Builds a daily_logs entry from a food_cache.FoodRecord."""
+    return {
+        "user_id": user_id,
+        "food_id": food._id,
+        "name": food.name,
+        "servings": servings,
+        "date": log_date_str,
+        "total_calories": food.calories * servings,
+        "total_macros": {
+            "protein": food.protein * servings,
+            "carbs": food.carbs * servings,
+            "fat": food.fat * servings
+        }
+    }
+
+
+async def _get_foods(services, food_ids):
+    return await services.food_cache.get_many_async(food_ids, services.db.foods)
+
+
+async def log_foods(services, user, entries):
+    """
+    Stores new food log entries with their sync sequence numbers, adds them
+    to the daily totals and the adherence calendar, and returns their ids.
+    """
+    db = services.db
+    first_seq = await sync.reserve_async(db, user['_id'], len(entries))
+    for offset, entry in enumerate(entries):
+        entry['_seq'] = first_seq + offset
+    inserted_ids = await driver.result(services.logs.insert(entries))
+    if len(entries) == 1:
+        days = [await rollups.apply_food_log_async(db, entries[0])]
+    else:
+        await rollups.apply_food_logs_async(db, entries)
+        days = await driver.to_list(db.daily_totals.find({
+            'user_id': user['_id'], 'date': {'$in': list({entry['date'] for entry in entries})}
+        }))
+    await adherence.record_days_async(db, user['_id'], analytics.calorie_goal(user), days)
+    await etag.bump_async(db, user['_id'], 'daily_logs')
+    return inserted_ids
+
+
+async def log_food_entry(services, current_user, data):
+    food_id = ObjectId(data['food_id'])
+    servings = float(data['servings'])
+    log_date_str = data.get('date', _today())
+
+    food_item = (await _get_foods(services, [food_id])).get(food_id)
+    if not food_item:
+        return {"error": "Food not found or does not belong to user"}, 404, {}
+    await log_foods(services, current_user, [build_food_log(current_user['_id'], food_item, servings, log_date_str)])
+    return {"message": "Food logged successfully"}, 201, {}
+
+
+async def log_food_batch(services, current_user, data):
+    """
+    Logs several food entries (a meal, or a queue replayed by an offline
+    client) in one request: foods come from the food cache (one $in lookup
+    for the misses), then one insert and one rollup bulk write. Accepts a
+    list of {food_id, servings, date}, or {"entries": [...]}, and reports a
+    result per item.
+    """
+    items = data.get('entries') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return {"error": "Expected a non-empty list of entries"}, 400, {}
+    if len(items) > MAX_BATCH_SIZE:
+        return {"error": f"At most {MAX_BATCH_SIZE} entries per batch"}, 400, {}
+
+    today_str = _today()
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, ObjectId(item['food_id']), float(item['servings']), item.get('date', today_str)))
+        except (KeyError, TypeError, ValueError, InvalidId):
+            results[index] = {"index": index, "status": 400, "error": "Invalid entry"}
+
+    foods = await _get_foods(services, list({food_id for _, food_id, _, _ in parsed}))
+
+    log_entries = []
+    positions = []
+    for index, food_id, servings, log_date_str in parsed:
+        food_item = foods.get(food_id)
+        if not food_item:
+            results[index] = {"index": index, "status": 404, "error": "Food not found"}
+            continue
+        log_entries.append(build_food_log(current_user['_id'], food_item, servings, log_date_str))
+        positions.append(index)
+
+    if log_entries:
+        inserted_ids = await log_foods(services, current_user, log_entries)
+        for index, log_id in zip(positions, inserted_ids):
+            results[index] = {"index": index, "status": 201, "id": str(log_id)}
+
+    logged = len(log_entries)
+    return {
+        "message": f"Logged {logged} of {len(items)} entries",
+        "logged": logged,
+        "results": results
+    }, 201 if logged else 400, {}
+
+
+async def delete_food_log(services, current_user, log_id):
+    """
+    Deletes the user's food log entry `log_id`. Another user's entry is
+    reported as not found, the same as a missing one.
+    """
+    try:
+        log_id = ObjectId(log_id)
+    except (InvalidId, TypeError):
+        return {"error": "Invalid log ID format"}, 400, {}
+
+    db = services.db
+    deleted_log = await driver.result(services.logs.delete(current_user['_id'], log_id))
+    if not deleted_log:
+        return {"error": "Log not found or you do not have permission"}, 404, {}
+    # Take it out of the day's totals, and tell syncing clients
+    day = await rollups.apply_food_log_async(db, deleted_log, sign=-1)
+    await adherence.record_days_async(db, current_user['_id'], analytics.calorie_goal(current_user), [day])
+    await sync.record_deletion_async(db, current_user['_id'], 'daily_logs', log_id)
+    return {"message": "Food log deleted successfully"}, 200, {}
+
+
+async def log_weight(services, current_user, data):
+    weight = float(data['weight'])
+    log_date_str = data.get('date', _today())
+    user_id = current_user['_id']
+    body = {"message": "Weight logged successfully"}
+
+    if services.write_queue is not None:
+        if services.write_queue.log_weight(user_id, log_date_str, weight):
+            # The renewed token already carries the queued weight
+            return body, 201, {
+                tokens.RENEWED_TOKEN_HEADER: await access_token(services, {**current_user, 'current_weight': weight})
+            }
+        # Queue full: write through, after the user's queued edits
+        await driver.result(services.flush_user(user_id))
+    db = services.db
+    seq = await sync.reserve_async(db, user_id)
+    await services.gather(
+        driver.result(db.weight_logs.update_one(
+            {"user_id": user_id, "date": log_date_str},
+            {"$set": {"user_id": user_id, "weight": weight, "date": log_date_str, "_seq": seq}},
+            upsert=True
+        )),
+        driver.result(db.users.update_one({"_id": user_id}, {"$set": {"current_weight": weight}})),
+    )
+    services.user_cache.invalidate(user_id)
+    await etag.bump_async(db, user_id, 'weight_logs', 'users')
+    return body, 201, await _renewed_token(services, user_id)
+
+
+async def log_activity(services, current_user, data):
+    calories_burned = float(data['calories_burned'])
+    log_date_str = data.get('date', _today())
+    user_id = current_user['_id']
+    body = {"message": "Activity logged successfully"}
+
+    if services.write_queue is not None:
+        if services.write_queue.log_activity(user_id, log_date_str, calories_burned):
+            return body, 201, {}
+        await driver.result(services.flush_user(user_id))
+    db = services.db
+    seq = await sync.reserve_async(db, user_id)
+    await services.gather(
+        driver.result(db.activity_logs.update_one(
+            {"user_id": user_id, "date": log_date_str},
+            {"$set": {"user_id": user_id, "calories_burned": calories_burned, "date": log_date_str, "_seq": seq}},
+            upsert=True
+        )),
+        rollups.set_calories_burned_async(db, user_id, log_date_str, calories_burned),
+    )
+    await etag.bump_async(db, user_id, 'activity_logs')
+    return body, 201, {}
+
+
+# 3. Progress and Summary
+async def daily_summary(services, current_user, date_str):
+    # One aggregation returns the day's totals, activity and food logs;
+    # goals and weight come from the access token's claims
+    return await summary.get_day_async(services.logs, current_user, date_str), 200, {}
+
+
+async def summary_range(services, current_user, args):
+    """
+    The daily summary of every day from `from` to `to` (inclusive, at most
+    summary.MAX_RANGE_DAYS), so the dashboard can prefetch a week in one call.
+    """
+    try:
+        dates = summary.parse_range(args.get('from'), args.get('to'))
+    except summary.SummaryRangeError as e:
+        return {"message": str(e)}, 400, {}
+    return await summary.get_range_async(services.logs, current_user, dates), 200, {}
+
+
+async def calorie_progress(services, current_user):
+    # Reads one pre-aggregated daily_totals document per day
+    since = (datetime.now() - timedelta(days=CALORIE_DAYS)).strftime(DATE_FORMAT)
+    with mongo.analytics_timeout():
+        days = await driver.to_list(rollups.get_range_totals(services.analytics_db, current_user['_id'], since))
+    return [{"_id": day['date'], "total_calories": day['total_calories']} for day in days], 200, {}
+
+
+async def month_summary(services, current_user, year, month):
+    # One materialized adherence document per month; see adherence.py
+    with mongo.analytics_timeout():
+        return await adherence.get_month_async(services.analytics_db, current_user, year, month), 200, {}
+
+
+async def progress_check(services, current_user):
+    # Average of the per-day totals, not of the individual log entries
+    avg_calories = await adherence.get_week_average_async(services.db, current_user['_id'])
+    return progress.check_response(avg_calories, analytics.calorie_goal(current_user)), 200, {}
+
+
+async def streaks(services, current_user):
+    """Current and longest run of consecutive days logged within the calorie goal."""
+    return await adherence.get_streaks_async(services.db, current_user['_id']), 200, {}
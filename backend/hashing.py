@@ -0,0 +1,170 @@
+# backend/hashing.py
+
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+# --- Password hashing service ---
+# bcrypt deliberately burns ~250 ms of CPU per call. Running it on the request
+# thread lets a login storm take every core from the other endpoints, so the
+# work goes to a small process pool: DEFAULT_WORKERS processes per gunicorn
+# worker (HASH_WORKERS overrides it), since every gunicorn worker starts its
+# own pool and one per core each would oversubscribe the machine. At most
+# `max_pending` hashes may be queued or running; past that, callers get
+# HashingBusy straight away (the API answers 429) instead of piling up
+# behind the storm.
+#
+# Hashes are the same $2b$ format Flask-Bcrypt produced, so existing
+# password_hash values keep verifying. `needs_rehash` flags hashes made with
+# another cost factor, so they can be upgraded on the next successful login.
+
+DEFAULT_WORKERS = min(2, os.cpu_count() or 1)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_to_bytes(password), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    pw_hash = _to_bytes(pw_hash)
+    return hmac.compare_digest(bcrypt.hashpw(_to_bytes(password), pw_hash), pw_hash)
+
+
+def hash_rounds(pw_hash):
+    """The cost factor encoded in a $2b$<rounds>$... hash, or None."""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    `workers=0` hashes inline on the calling thread (no pool), which is handy
+    for scripts and as a benchmark baseline. `observer`, if given, is called
+    on the caller's thread with the seconds each `hash`/`check` waited.
+    """
+
+    def __init__(self, rounds=12, workers=None, max_pending=None, timeout=30, observer=None):
+        self.rounds = rounds
+        self._observer = observer
+        self._workers = DEFAULT_WORKERS if workers is None else workers
+        self._max_pending = max_pending or max(self._workers, 1) * 4
+        self._timeout = timeout
+        self._slots = threading.BoundedSemaphore(self._max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    def _get_executor(self):
+        # Created lazily so each (forked) gunicorn worker owns its own pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy()
+        started = time.perf_counter()
+
+        def done(_):
+            # Runs on the pool's result thread, concurrently with callers
+            self._slots.release()
+            with self._lock:
+                self.completed += 1
+                self.seconds += time.perf_counter() - started
+
+        if self._workers == 0:
+            try:
+                result = fn(*args)
+            finally:
+                done(None)
+            return _Resolved(result)
+
+        future = self._get_executor().submit(fn, *args)
+        future.add_done_callback(done)
+        return future
+
+    def _wait(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return self._submit(fn, *args).result(self._timeout)
+        finally:
+            if self._observer is not None:
+                self._observer(time.perf_counter() - started)
+
+    def hash(self, password, rounds=None):
+        return self._wait(_hash, password, rounds or self.rounds)
+
+    def hash_async(self, password, rounds=None):
+        """Returns a Future for the hash; raises HashingBusy when saturated."""
+        return self._submit(_hash, password, rounds or self.rounds)
+
+    def check(self, pw_hash, password):
+        return self._wait(_check, pw_hash, password)
+
+    def warm(self):
+        """Starts the worker processes now rather than on the first hash."""
+        if self._workers == 0:
+            return
+        executor = self._get_executor()
+        # Trivial tasks, submitted together so each one needs a process
+        for future in [executor.submit(hash_rounds, '$2b$04$') for _ in range(self._workers)]:
+            future.result(self._timeout)
+
+    def needs_rehash(self, pw_hash):
+        return hash_rounds(pw_hash) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self._workers,
+                'max_pending': self._max_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'seconds': round(self.seconds, 3),
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class _Resolved:
+    """Future-like wrapper for results computed inline."""
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self, timeout=None):
+        return self._result
+
+    def exception(self, timeout=None):
+        return None
+
+    def add_done_callback(self, fn):
+        fn(self)
@@ -0,0 +1,372 @@
+# backend/history.py
+
+import csv
+import gzip
+import io
+import json
+import math
+import zlib
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
+
+import adherence
+import etag
+import rollups
+import sync
+from json_provider import dumps
+
+# --- Bulk export and import of a user's history ---
+# GET /api/export streams every daily_logs, weight_logs and activity_logs
+# entry of the user, one flat row per entry:
+#   {"collection": "daily_logs", "date", "food_id", "name", "servings",
+#    "total_calories", "protein", "carbs", "fat"}
+#   {"collection": "weight_logs", "date", "weight"}
+#   {"collection": "activity_logs", "date", "calories_burned"}
+# as NDJSON (one JSON object per line) or CSV (CSV_COLUMNS, blank where a
+# collection has no such field), optionally gzipped. Rows are read off the
+# cursors by date and encoded in CHUNK_SIZE pieces, so memory does not grow
+# with the history.
+#
+# POST /api/import takes the same rows (either format, gzipped or not, as
+# the request body or a `file` upload) and writes them in batches of
+# IMPORT_BATCH_SIZE: one insert_many per collection, with the sync sequence
+# numbers, daily totals and adherence updated per batch as the logging
+# routes do. Rows are deduplicated on (user_id, date):
+#   * weight_logs and activity_logs hold one entry per day, so a day the
+#     user already has, or that came earlier in the file, is skipped;
+#   * daily_logs holds several entries per day, so a day that already had
+#     food logs before the import is skipped whole, and every entry of a
+#     new day is imported.
+# Importing an export again therefore adds nothing, and a failed import can
+# be re-run: batches already written are skipped as duplicates.
+
+FORMATS = ('ndjson', 'csv')
+FIELDS = {
+    'daily_logs': ('date', 'food_id', 'name', 'servings', 'total_calories', 'protein', 'carbs', 'fat'),
+    'weight_logs': ('date', 'weight'),
+    'activity_logs': ('date', 'calories_burned'),
+}
+CSV_COLUMNS = ('collection', 'date', 'food_id', 'name', 'servings', 'total_calories', 'protein', 'carbs', 'fat',
+               'weight', 'calories_burned')
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+DATE_FORMAT = '%Y-%m-%d'
+EXPORT_BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+IMPORT_BATCH_SIZE = 1000
+MAX_NAME_LENGTH = 200
+MAX_REPORTED_ERRORS = 50
+DUPLICATE_KEY = 11000
+# What reading a malformed or truncated upload raises
+READ_ERRORS = (OSError, EOFError, zlib.error, UnicodeDecodeError, csv.Error)
+
+
+class HistoryError(ValueError):
+    pass
+
+
+def parse_format(value, default='ndjson'):
+    fmt = (value or default).lower()
+    if fmt not in FORMATS:
+        raise HistoryError(f"'format' must be one of {', '.join(FORMATS)}")
+    return fmt
+
+
+# --- Export ---
+def _row(collection_name, doc):
+    if collection_name == 'daily_logs':
+        macros = doc.get('total_macros') or {}
+        values = {**doc, **macros}
+    else:
+        values = doc
+    return {'collection': collection_name, **{field: values.get(field) for field in FIELDS[collection_name]}}
+
+
+def export_rows(db, logs, user_id):
+    """Yields the user's rows, collection by collection, each by date."""
+    for entry in logs.stream_for_user(user_id, EXPORT_BATCH_SIZE):
+        yield _row('daily_logs', entry)
+    for name in ('weight_logs', 'activity_logs'):
+        projection = {'_id': 0, **{field: 1 for field in FIELDS[name]}}
+        cursor = db[name].find({'user_id': user_id}, projection).sort('date', 1).batch_size(EXPORT_BATCH_SIZE)
+        for doc in cursor:
+            yield _row(name, doc)
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        if row.get('food_id') is not None:
+            row['food_id'] = str(row['food_id'])
+        yield dumps(row) + '\n'
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        # One row at a time: hand it over and reuse the buffer
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _chunks(lines, size=CHUNK_SIZE):
+    """Joins encoded lines into byte chunks of about `size` bytes."""
+    pending = []
+    length = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(pending)
+            pending = []
+            length = 0
+    if pending:
+        yield b''.join(pending)
+
+
+def _gzipped(chunks):
+    # wbits=31: a gzip member (header and trailer) rather than a bare zlib stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(db, logs, user_id, fmt='ndjson', compress=False):
+    """The export's response body, as an iterator of byte chunks."""
+    lines = _csv_lines if fmt == 'csv' else _ndjson_lines
+    chunks = _chunks(lines(export_rows(db, logs, user_id)))
+    return _gzipped(chunks) if compress else chunks
+
+
+def export_filename(fmt, compress, today=None):
+    today = today or datetime.now().strftime(DATE_FORMAT)
+    return f"history-{today}.{fmt}" + ('.gz' if compress else '')
+
+
+# --- Import ---
+def read_rows(stream, fmt='ndjson', compressed=False):
+    """
+    Yields (line number, row) from a binary stream, decoding as it goes.
+    A line that is not a JSON object yields (line number, None).
+    """
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if value not in ('', None)}
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def _date(row):
+    try:
+        return datetime.strptime(str(row['date']), DATE_FORMAT).strftime(DATE_FORMAT)
+    except (KeyError, ValueError):
+        raise HistoryError("'date' must be a YYYY-MM-DD date")
+
+
+def _number(row, field, required=True, positive=False):
+    value = row.get(field)
+    if value is None:
+        if required:
+            raise HistoryError(f"'{field}' is required")
+        return 0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise HistoryError(f"'{field}' must be a number")
+    if not math.isfinite(number) or number < 0 or (positive and number == 0):
+        raise HistoryError(f"'{field}' must be a {'positive' if positive else 'non-negative'} number")
+    return number
+
+
+def _food_id(row):
+    value = row.get('food_id')
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        # Extended JSON, as the API returns ids
+        value = value.get('$oid')
+    try:
+        if not isinstance(value, str):
+            raise TypeError(value)
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise HistoryError("'food_id' must be an ObjectId")
+
+
+def parse_row(row, user_id):
+    """(collection name, document to insert) for an export row; raises HistoryError."""
+    collection_name = row.get('collection')
+    if collection_name not in FIELDS:
+        raise HistoryError(f"'collection' must be one of {', '.join(FIELDS)}")
+    date_str = _date(row)
+    if collection_name == 'weight_logs':
+        return collection_name, {'user_id': user_id, 'weight': _number(row, 'weight', positive=True),
+                                 'date': date_str}
+    if collection_name == 'activity_logs':
+        return collection_name, {'user_id': user_id, 'calories_burned': _number(row, 'calories_burned'),
+                                 'date': date_str}
+    name = row.get('name')
+    if name is not None and (not isinstance(name, str) or len(name) > MAX_NAME_LENGTH):
+        raise HistoryError(f"'name' must be a string of at most {MAX_NAME_LENGTH} characters")
+    return collection_name, {
+        'user_id': user_id,
+        'food_id': _food_id(row),
+        'name': name,
+        'servings': _number(row, 'servings', positive=True),
+        'date': date_str,
+        'total_calories': _number(row, 'total_calories'),
+        'total_macros': {field: _number(row, field, required=False) for field in ('protein', 'carbs', 'fat')},
+    }
+
+
+class Importer:
+    """
+    Imports rows for one user: `add` each (line number, row), then `finish`
+    for the report. Food log entries are written through `logs`, a LogStore.
+    """
+
+    def __init__(self, db, logs, user, goal, batch_size=IMPORT_BATCH_SIZE):
+        self.db = db
+        self.logs = logs
+        self.user_id = user['_id']
+        self.goal = goal
+        self.batch_size = batch_size
+        self._batch = {name: [] for name in FIELDS}
+        self._pending = 0
+        # Days written by this import: (collection, date), and the food log
+        # days, which take more entries from later batches
+        self._seen = {name: set() for name in FIELDS}
+        self.imported = {name: 0 for name in FIELDS}
+        self.duplicates = {name: 0 for name in FIELDS}
+        self.invalid = 0
+        self.errors = []
+        self.latest_weight = None
+
+    def add(self, line_number, row):
+        try:
+            if row is None:
+                raise HistoryError("Not a JSON object")
+            collection_name, doc = parse_row(row, self.user_id)
+        except HistoryError as e:
+            self.invalid += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({'line': line_number, 'error': str(e)})
+            return
+        self._batch[collection_name].append(doc)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self._import_food_logs(self._batch['daily_logs'])
+        self._import_days('weight_logs', self._batch['weight_logs'])
+        self._import_days('activity_logs', self._batch['activity_logs'])
+        self._batch = {name: [] for name in FIELDS}
+        self._pending = 0
+
+    def _existing_days(self, collection, dates, query=None):
+        dates = list(dates)
+        if not dates:
+            return set()
+        docs = collection.find({'user_id': self.user_id, 'date': {'$in': dates}, **(query or {})}, {'date': 1})
+        return {doc['date'] for doc in docs}
+
+    def _import_food_logs(self, entries):
+        seen = self._seen['daily_logs']
+        # daily_totals has a document per day with food logs in either LogStore layout
+        skipped = self._existing_days(self.db.daily_totals, {entry['date'] for entry in entries} - seen,
+                                      {'entry_count': {'$gt': 0}})
+        new = [entry for entry in entries if entry['date'] not in skipped]
+        self.duplicates['daily_logs'] += len(entries) - len(new)
+        if not new:
+            return
+        first_seq = sync.reserve(self.db, self.user_id, len(new))
+        for offset, entry in enumerate(new):
+            entry['_seq'] = first_seq + offset
+        self.logs.insert(new)
+        rollups.apply_food_logs(self.db, new)
+        dates = {entry['date'] for entry in new}
+        seen.update(dates)
+        days = self.db.daily_totals.find({'user_id': self.user_id, 'date': {'$in': list(dates)}})
+        adherence.record_many_days(self.db, self.user_id, self.goal, days)
+        etag.bump(self.db, self.user_id, 'daily_logs')
+        self.imported['daily_logs'] += len(new)
+
+    def _import_days(self, collection_name, docs):
+        seen = self._seen[collection_name]
+        collection = self.db[collection_name]
+        skipped = self._existing_days(collection, {doc['date'] for doc in docs} - seen)
+        new = []
+        for doc in docs:
+            if doc['date'] in skipped or doc['date'] in seen:
+                self.duplicates[collection_name] += 1
+                continue
+            seen.add(doc['date'])
+            new.append(doc)
+        if not new:
+            return
+        first_seq = sync.reserve(self.db, self.user_id, len(new))
+        for offset, doc in enumerate(new):
+            doc['_seq'] = first_seq + offset
+        try:
+            collection.insert_many(new, ordered=False)
+            inserted = new
+        except BulkWriteError as e:
+            # A day written concurrently (the unique user_date index) is a duplicate
+            if any(error['code'] != DUPLICATE_KEY for error in e.details['writeErrors']):
+                raise
+            failed = {error['index'] for error in e.details['writeErrors']}
+            inserted = [doc for index, doc in enumerate(new) if index not in failed]
+            self.duplicates[collection_name] += len(failed)
+        self.imported[collection_name] += len(inserted)
+        if collection_name == 'activity_logs':
+            rollups.set_calories_burned_many(self.db, self.user_id,
+                                             {doc['date']: doc['calories_burned'] for doc in inserted})
+        elif inserted:
+            latest = max(inserted, key=lambda doc: doc['date'])
+            if self.latest_weight is None or latest['date'] > self.latest_weight['date']:
+                self.latest_weight = latest
+        etag.bump(self.db, self.user_id, collection_name)
+
+    def _update_current_weight(self):
+        """Makes an imported weigh-in the current weight if it is the user's latest."""
+        if self.latest_weight is None:
+            return False
+        newest = self.db.weight_logs.find_one({'user_id': self.user_id}, {'date': 1}, sort=[('date', -1)])
+        if newest is None or newest['date'] != self.latest_weight['date']:
+            return False
+        self.db.users.update_one({'_id': self.user_id}, {'$set': {'current_weight': self.latest_weight['weight']}})
+        etag.bump(self.db, self.user_id, 'users')
+        return True
+
+    def finish(self):
+        """Writes the last batch and returns the report."""
+        self.flush()
+        return {
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'current_weight_updated': self._update_current_weight(),
+        }
@@ -0,0 +1,225 @@
+# backend/indexes.py
+
+import itertools
+import logging
+import sys
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# --- Index declarations ---
+# Every query the API issues should be served by one of these. Keep this in
+# sync with QUERY_SHAPES below when adding a new route or filter.
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+    'daily_logs': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date'),
+        IndexModel([('user_id', ASCENDING), ('_seq', ASCENDING)], name='user_seq'),
+    ],
+    'weight_logs': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date_unique', unique=True),
+        IndexModel([('user_id', ASCENDING), ('_seq', ASCENDING)], name='user_seq'),
+    ],
+    'activity_logs': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date_unique', unique=True),
+        IndexModel([('user_id', ASCENDING), ('_seq', ASCENDING)], name='user_seq'),
+    ],
+    'daily_log_buckets': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date_unique', unique=True),
+        IndexModel([('user_id', ASCENDING), ('ids', ASCENDING)], name='user_ids'),
+        IndexModel([('user_id', ASCENDING), ('_seq', ASCENDING)], name='user_seq'),
+    ],
+    'sync_tombstones': [
+        IndexModel([('user_id', ASCENDING), ('seq', ASCENDING)], name='user_seq'),
+    ],
+    'daily_totals': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date_unique', unique=True),
+    ],
+    'adherence': [
+        IndexModel([('user_id', ASCENDING), ('month', ASCENDING)], name='user_month_unique', unique=True),
+    ],
+    # Expired tokens are removed by the TTL monitor
+    'refresh_tokens': [
+        IndexModel([('user_id', ASCENDING)], name='user'),
+        IndexModel([('family', ASCENDING)], name='family'),
+        IndexModel([('expires_at', ASCENDING)], name='expires_ttl', expireAfterSeconds=0),
+    ],
+    'revoked_tokens': [
+        IndexModel([('expires_at', ASCENDING)], name='expires_ttl', expireAfterSeconds=0),
+    ],
+    'foods': [
+        # Anchored, case-sensitive prefix regexes can walk this one
+        IndexModel([('name', ASCENDING)], name='name_prefix'),
+        IndexModel([('name', TEXT)], name='name_text'),
+    ],
+}
+
+# --- Query shapes issued by the routes ---
+# (description, collection, filter, sort). Values only need to be
+# representative; the planner picks an index from the shape.
+_SAMPLE_ID = ObjectId('000000000000000000000000')
+_SAMPLE_DATE = datetime(2024, 1, 1)
+QUERY_SHAPES = [
+    ('register/login: user by email', 'users', {'email': 'a@example.com'}, None),
+    ('token_required: user by id', 'users', {'_id': _SAMPLE_ID}, None),
+    ('token/refresh: revoke session', 'refresh_tokens', {'family': 'f'}, None),
+    ('change-password: revoke sessions', 'refresh_tokens', {'user_id': _SAMPLE_ID}, None),
+    ('token revocation list reload', 'revoked_tokens', {'expires_at': {'$gt': _SAMPLE_DATE}}, None),
+    ('summary: day logs ($lookup)', 'daily_logs', {'user_id': _SAMPLE_ID, 'date': '2024-01-01'}, None),
+    ('delete_food_log: log by id', 'daily_logs', {'_id': _SAMPLE_ID, 'user_id': _SAMPLE_ID}, None),
+    ('summary: day totals', 'daily_totals', {'user_id': _SAMPLE_ID, 'date': '2024-01-01'}, None),
+    ('summary: range totals', 'daily_totals',
+     {'user_id': _SAMPLE_ID, 'date': {'$gte': '2024-01-01', '$lte': '2024-01-07'}}, [('date', ASCENDING)]),
+    ('summary (buckets): day entries ($lookup)', 'daily_log_buckets',
+     {'user_id': _SAMPLE_ID, 'date': '2024-01-01'}, None),
+    ('delete_food_log (buckets): bucket by log id', 'daily_log_buckets',
+     {'user_id': _SAMPLE_ID, 'ids': _SAMPLE_ID}, None),
+    ('progress/calories: date range', 'daily_totals',
+     {'user_id': _SAMPLE_ID, 'date': {'$gte': '2024-01-01', '$lte': '2024-01-31'}, 'entry_count': {'$gt': 0}},
+     [('date', ASCENDING)]),
+    ('progress/bundle: adherence months ($facet)', 'adherence', {'user_id': _SAMPLE_ID, 'month': {'$gte': '2024-01'}}, None),
+    ('month/check: adherence month', 'adherence', {'user_id': _SAMPLE_ID, 'month': '2024-01'}, None),
+    ('check: adherence months', 'adherence', {'user_id': _SAMPLE_ID, 'month': {'$in': ['2023-12', '2024-01']}}, None),
+    ('streaks: refresh', 'adherence', {'user_id': _SAMPLE_ID}, [('month', ASCENDING)]),
+    ('progress/weight: history', 'weight_logs', {'user_id': _SAMPLE_ID}, [('date', ASCENDING)]),
+    ('analytics: weight range', 'weight_logs',
+     {'user_id': _SAMPLE_ID, 'date': {'$gte': '2020-01-01', '$lte': '2024-12-31'}}, None),
+    ('log/weight: upsert', 'weight_logs', {'user_id': _SAMPLE_ID, 'date': '2024-01-01'}, None),
+    ('log/activity: upsert', 'activity_logs', {'user_id': _SAMPLE_ID, 'date': '2024-01-01'}, None),
+    ('sync: changed logs', 'daily_logs', {'user_id': _SAMPLE_ID, '_seq': {'$gt': 1, '$lte': 9}}, [('_seq', ASCENDING)]),
+    ('sync: changed weights', 'weight_logs', {'user_id': _SAMPLE_ID, '_seq': {'$gt': 1, '$lte': 9}}, [('_seq', ASCENDING)]),
+    ('sync: changed activity', 'activity_logs', {'user_id': _SAMPLE_ID, '_seq': {'$gt': 1, '$lte': 9}}, [('_seq', ASCENDING)]),
+    ('sync (buckets): changed buckets', 'daily_log_buckets',
+     {'user_id': _SAMPLE_ID, '_seq': {'$gt': 1, '$lte': 9}}, [('_seq', ASCENDING)]),
+    ('sync: tombstones', 'sync_tombstones', {'user_id': _SAMPLE_ID, 'seq': {'$gt': 1, '$lte': 9}}, [('seq', ASCENDING)]),
+    ('export: food logs', 'daily_logs', {'user_id': _SAMPLE_ID}, [('date', ASCENDING)]),
+    ('export (buckets): food log buckets', 'daily_log_buckets', {'user_id': _SAMPLE_ID}, [('date', ASCENDING)]),
+    ('export: activity', 'activity_logs', {'user_id': _SAMPLE_ID}, [('date', ASCENDING)]),
+    ('import: days with food logs', 'daily_totals',
+     {'user_id': _SAMPLE_ID, 'date': {'$in': ['2024-01-01', '2024-01-02']}, 'entry_count': {'$gt': 0}}, None),
+    ('import: existing weigh-ins', 'weight_logs', {'user_id': _SAMPLE_ID, 'date': {'$in': ['2024-01-01']}}, None),
+    ('import: existing activity', 'activity_logs', {'user_id': _SAMPLE_ID, 'date': {'$in': ['2024-01-01']}}, None),
+    ('food search: incremental refresh', 'foods', {'_id': {'$gt': _SAMPLE_ID}}, [('_id', ASCENDING)]),
+]
+
+
+def ensure_indexes(db):
+    """
+    Creates every declared index. create_indexes is a no-op for indexes that
+    already exist, so this is cheap to run on every startup. A failure on one
+    collection (e.g. duplicate emails blocking the unique index) is logged and
+    does not prevent the others from being created.
+    """
+    for collection_name, models in INDEXES.items():
+        try:
+            db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            logger.warning("Could not create indexes on %s: %s", collection_name, e)
+
+
+def replace_collection(db, collection_name, documents, batch_size=1000):
+    """
+    Replaces the contents of a derived collection (rollups, calendars) with
+    `documents` and returns how many were written. They are written to a
+    staging collection that already has the declared indexes, which is then
+    renamed over the old one, so readers never see the collection empty or
+    unindexed, and concurrent upserts cannot create duplicates.
+    """
+    staging = db[f'{collection_name}_rebuild']
+    staging.drop()
+    if INDEXES.get(collection_name):
+        staging.create_indexes(INDEXES[collection_name])
+    documents = iter(documents)
+    count = 0
+    while True:
+        batch = list(itertools.islice(documents, batch_size))
+        if not batch:
+            break
+        staging.insert_many(batch, ordered=False)
+        count += len(batch)
+    if count == 0 and not INDEXES.get(collection_name):
+        # Nothing created the staging collection, and rename needs one
+        db[collection_name].delete_many({})
+        return 0
+    staging.rename(collection_name, dropTarget=True)
+    return count
+
+
+def _plan_stages(plan):
+    """Yields every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def _declared_index_for(collection_name, query_filter, sort):
+    """
+    Fallback for servers without a query planner (mongomock): the shape is
+    considered indexed when its equality fields form a prefix of a declared
+    index and the next key field is one of its range or sort fields.
+    """
+    equality = [f for f, v in query_filter.items() if not isinstance(v, dict)]
+    if '_id' in equality:
+        return {'_id': ASCENDING}
+    following = [f for f, v in query_filter.items() if isinstance(v, dict)]
+    following += [f for f, _ in (sort or [])]
+
+    keys = [{'_id': ASCENDING}] + [model.document['key'] for model in INDEXES.get(collection_name, [])]
+    for key in keys:
+        fields = [f for f, direction in key.items() if direction != TEXT]
+        n = len(equality)
+        if not fields or set(fields[:n]) != set(equality):
+            continue
+        if not following or (len(fields) > n and fields[n] in following):
+            return key
+    return None
+
+
+def verify_query_plans(db):
+    """
+    Explains every entry of QUERY_SHAPES and returns a list of
+    (description, problem) tuples for the shapes that fall back to a COLLSCAN.
+    An empty list means every route query is index-backed.
+    """
+    ensure_indexes(db)
+    failures = []
+    for description, collection_name, query_filter, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query_filter)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explain = cursor.explain()
+        except (AttributeError, NotImplementedError):
+            if _declared_index_for(collection_name, query_filter, sort) is None:
+                failures.append((description, 'no declared index matches the query shape'))
+            continue
+
+        stages = set(_plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {})))
+        if 'COLLSCAN' in stages:
+            failures.append((description, 'winning plan is a COLLSCAN'))
+    return failures
+
+
+if __name__ == '__main__':
+    # Usage: python indexes.py [--mongomock]
+    # Creates the indexes and fails (exit code 1) if any route query shape
+    # would fall back to a collection scan.
+    from db import DB_NAME, get_client
+
+    client = get_client('mongomock://localhost' if '--mongomock' in sys.argv else None)
+    failures = verify_query_plans(client[DB_NAME])
+    for description, problem in failures:
+        print(f"[COLLSCAN] {description}: {problem}")
+    if failures:
+        sys.exit(1)
+    print(f"All {len(QUERY_SHAPES)} query shapes are index-backed.")
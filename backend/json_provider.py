@@ -0,0 +1,66 @@
+# backend/json_provider.py
+
+import json
+from datetime import datetime
+from flask.json.provider import DefaultJSONProvider
+from bson import ObjectId, json_util
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+# --- Single-pass BSON-aware JSON encoding ---
+# Encodes ObjectId, datetime and the other BSON types directly, in the same
+# relaxed Extended JSON shape json_util produces ({"$oid": ...},
+# {"$date": ...}), so responses are byte-compatible with the old
+# `json.loads(json_util.dumps(...))` round-trip without building the
+# intermediate string and dict tree.
+
+
+def bson_default(o):
+    if isinstance(o, ObjectId):
+        return {'$oid': str(o)}
+    if isinstance(o, datetime):
+        return json_util.default(o)
+    try:
+        return json_util.default(o)
+    except TypeError:
+        return DefaultJSONProvider.default(o)
+
+
+if orjson is not None:
+    # Dates go through bson_default so they keep the {"$date": ...} shape
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """Encodes `obj` to a JSON string outside of a Flask app context."""
+        return orjson.dumps(obj, default=bson_default, option=_ORJSON_OPTIONS).decode('utf-8')
+else:
+    def dumps(obj):
+        """Encodes `obj` to a JSON string outside of a Flask app context."""
+        return json.dumps(obj, default=bson_default, separators=(',', ':'))
+
+
+class BSONJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider used by jsonify(); backed by orjson when installed."""
+
+    default = staticmethod(bson_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        option = _ORJSON_OPTIONS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=bson_default, option=option) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
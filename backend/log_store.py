@@ -0,0 +1,288 @@
+# backend/log_store.py
+
+from collections import defaultdict
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# --- Food log storage layouts ---
+# Routes, summaries and sync read and write food log entries through a
+# LogStore, and always see the same entry shape:
+#   {_id, user_id, food_id, name, servings, date, total_calories,
+#    total_macros: {protein, carbs, fat}, _seq}
+#
+# LOG_STORAGE=documents (default) keeps one `daily_logs` document per entry.
+# LOG_STORAGE=buckets keeps one `daily_log_buckets` document per user per
+# day, with the entries in parallel arrays:
+#   {user_id, date, ids: [...], food_id: [...], servings: [...],
+#    calories: [...], protein: [...], carbs: [...], fat: [...], seq: [...],
+#    _seq: <highest seq>, rev: <write counter>}
+# The user, date and field names are stored once per day instead of once per
+# entry, and food names are looked up in the food cache instead of being
+# copied into every entry. `python db.py migrate-logs` converts between them.
+
+LAYOUTS = ('documents', 'buckets')
+BUCKET_ARRAYS = ('ids', 'food_id', 'servings', 'calories', 'protein', 'carbs', 'fat', 'seq')
+DELETE_RETRIES = 10
+
+
+def _by_day_pipeline(totals):
+    return [
+        {'$match': {'user_id': {'$exists': True}}},
+        {'$group': dict({'_id': {'user_id': '$user_id', 'date': '$date'}}, **totals)},
+    ]
+
+
+class DocumentLogStore:
+    layout = 'documents'
+    collection_name = 'daily_logs'
+
+    def __init__(self, db, food_cache=None):
+        self.db = db
+        self.collection = db[self.collection_name]
+
+    def insert(self, entries):
+        """Stores new entries (which get their _id set) and returns their ids."""
+        if len(entries) == 1:
+            return [self.collection.insert_one(entries[0]).inserted_id]
+        return self.collection.insert_many(entries, ordered=False).inserted_ids
+
+    def delete(self, user_id, log_id):
+        """Removes the user's entry and returns it, or None if there is none."""
+        return self.collection.find_one_and_delete({'_id': log_id, 'user_id': user_id})
+
+    def find(self, user_id, start_date_str, end_date_str):
+        return list(self.collection.find(
+            {'user_id': user_id, 'date': {'$gte': start_date_str, '$lte': end_date_str}}
+        ).sort('_id', 1))
+
+    def lookup_stage(self, user_id):
+        """A $lookup joining a daily_totals document with that day's entries."""
+        return {'$lookup': {
+            'from': self.collection_name,
+            'let': {'date': '$date'},
+            # user_id is a constant, so the join is served by the user_date index
+            'pipeline': [
+                {'$match': {'user_id': user_id, '$expr': {'$eq': ['$date', '$$date']}}},
+                {'$sort': {'_id': 1}},
+            ],
+            'as': 'logged_foods',
+        }}
+
+    def expand(self, joined):
+        """Turns the documents joined by lookup_stage into entries."""
+        return joined
+
+    def changes(self, user_id, seq_range, limit):
+        """Yields (seq, entry) for entries stamped inside `seq_range`, by seq."""
+        cursor = self.collection.find({'user_id': user_id, '_seq': seq_range}).sort('_seq', 1).limit(limit)
+        for doc in cursor:
+            yield doc['_seq'], doc
+
+    def all_entries(self):
+        """Streams every entry of every user (for migrations)."""
+        return self.collection.find({'user_id': {'$exists': True}})
+
+    def stream_for_user(self, user_id, batch_size=500):
+        """Streams the user's entries by date, off the cursor (for exports)."""
+        return self.collection.find({'user_id': user_id}).sort('date', 1).batch_size(batch_size)
+
+    def most_logged_foods(self, limit):
+        top = self.collection.aggregate([
+            {'$group': {'_id': '$food_id', 'uses': {'$sum': 1}}},
+            {'$sort': {'uses': -1}},
+            {'$limit': limit},
+        ], allowDiskUse=True)
+        return [row['_id'] for row in top if row['_id'] is not None]
+
+    def totals_pipeline(self):
+        """Aggregation grouping every entry into per-(user_id, date) totals."""
+        return _by_day_pipeline({
+            'total_calories': {'$sum': {'$ifNull': ['$total_calories', 0]}},
+            'protein': {'$sum': {'$ifNull': ['$total_macros.protein', 0]}},
+            'carbs': {'$sum': {'$ifNull': ['$total_macros.carbs', 0]}},
+            'fat': {'$sum': {'$ifNull': ['$total_macros.fat', 0]}},
+            'entry_count': {'$sum': 1},
+        })
+
+
+class MotorDocumentLogStore(DocumentLogStore):
+    """The `documents` layout through Motor, for the async routes (see handlers.py)."""
+
+    async def insert(self, entries):
+        if len(entries) == 1:
+            return [(await self.collection.insert_one(entries[0])).inserted_id]
+        return (await self.collection.insert_many(entries, ordered=False)).inserted_ids
+
+    async def delete(self, user_id, log_id):
+        return await self.collection.find_one_and_delete({'_id': log_id, 'user_id': user_id})
+
+    async def find(self, user_id, start_date_str, end_date_str):
+        return await self.collection.find(
+            {'user_id': user_id, 'date': {'$gte': start_date_str, '$lte': end_date_str}}
+        ).sort('_id', 1).to_list(None)
+
+
+class BucketLogStore(DocumentLogStore):
+    layout = 'buckets'
+    collection_name = 'daily_log_buckets'
+
+    def __init__(self, db, food_cache=None):
+        super().__init__(db)
+        self._food_cache = food_cache
+
+    # --- Entries <-> bucket arrays ---
+    @staticmethod
+    def _columns(entry):
+        macros = entry.get('total_macros') or {}
+        return {
+            'ids': entry['_id'],
+            'food_id': entry.get('food_id'),
+            'servings': entry.get('servings'),
+            'calories': entry.get('total_calories') or 0,
+            'protein': macros.get('protein') or 0,
+            'carbs': macros.get('carbs') or 0,
+            'fat': macros.get('fat') or 0,
+            'seq': entry.get('_seq', 0),
+        }
+
+    def _names(self, buckets):
+        food_ids = {food_id for bucket in buckets for food_id in bucket.get('food_id', [])}
+        food_ids.discard(None)
+        if self._food_cache is not None:
+            return {food_id: record.name for food_id, record in self._food_cache.get_many(food_ids).items()}
+        foods = self.db.foods.find({'_id': {'$in': list(food_ids)}}, {'name': 1})
+        return {food['_id']: food.get('name') for food in foods}
+
+    @staticmethod
+    def _entry(bucket, i, names):
+        return {
+            '_id': bucket['ids'][i],
+            'user_id': bucket['user_id'],
+            'food_id': bucket['food_id'][i],
+            'name': names.get(bucket['food_id'][i]),
+            'servings': bucket['servings'][i],
+            'date': bucket['date'],
+            'total_calories': bucket['calories'][i],
+            'total_macros': {
+                'protein': bucket['protein'][i],
+                'carbs': bucket['carbs'][i],
+                'fat': bucket['fat'][i],
+            },
+            '_seq': bucket['seq'][i],
+        }
+
+    def _entries(self, buckets):
+        buckets = list(buckets)
+        names = self._names(buckets)
+        return [self._entry(bucket, i, names) for bucket in buckets for i in range(len(bucket.get('ids', [])))]
+
+    # --- LogStore interface ---
+    def insert(self, entries):
+        per_day = defaultdict(lambda: {field: [] for field in BUCKET_ARRAYS})
+        for entry in entries:
+            entry.setdefault('_id', ObjectId())
+            for field, value in self._columns(entry).items():
+                per_day[(entry['user_id'], entry['date'])][field].append(value)
+
+        self.collection.bulk_write([
+            UpdateOne(
+                {'user_id': user_id, 'date': date_str},
+                {
+                    '$push': {field: {'$each': values} for field, values in arrays.items()},
+                    '$max': {'_seq': max(arrays['seq'])},
+                    '$inc': {'rev': 1},
+                },
+                upsert=True
+            )
+            for (user_id, date_str), arrays in per_day.items()
+        ], ordered=False)
+        return [entry['_id'] for entry in entries]
+
+    def delete(self, user_id, log_id):
+        # Removing one position from every array needs a read-modify-write;
+        # `rev` makes it fail (and retry) if the bucket changed in between
+        for _ in range(DELETE_RETRIES):
+            bucket = self.collection.find_one({'user_id': user_id, 'ids': log_id})
+            if bucket is None:
+                return None
+            i = bucket['ids'].index(log_id)
+            result = self.collection.update_one(
+                {'_id': bucket['_id'], 'rev': bucket.get('rev')},
+                {
+                    '$set': {field: bucket[field][:i] + bucket[field][i + 1:] for field in BUCKET_ARRAYS},
+                    '$inc': {'rev': 1},
+                }
+            )
+            if result.modified_count:
+                return self._entry(bucket, i, self._names([bucket]))
+        raise RuntimeError(f"Could not delete log {log_id}: its bucket kept changing")
+
+    def find(self, user_id, start_date_str, end_date_str):
+        return self._entries(self.collection.find(
+            {'user_id': user_id, 'date': {'$gte': start_date_str, '$lte': end_date_str}}
+        ).sort('date', 1))
+
+    def lookup_stage(self, user_id):
+        stage = super().lookup_stage(user_id)
+        stage['$lookup']['from'] = self.collection_name
+        return stage
+
+    def expand(self, joined):
+        return self._entries(joined)
+
+    def changes(self, user_id, seq_range, limit):
+        """
+        Yields (seq, entry) for every entry of the buckets stamped inside
+        `seq_range`, by the bucket's _seq (its newest entry). A day's entries
+        are sent again whenever one is added to it, which keeps the buckets a
+        keyset: the cursor reads only as many buckets as the page takes.
+        """
+        buckets = self.collection.find({'user_id': user_id, '_seq': seq_range}).sort('_seq', 1)
+        for bucket in buckets.batch_size(limit):
+            for entry in self._entries([bucket]):
+                yield bucket['_seq'], entry
+
+    def _stream(self, buckets, batch_size):
+        # Food names are looked up once per batch of buckets
+        batch = []
+        for bucket in buckets:
+            batch.append(bucket)
+            if len(batch) == batch_size:
+                yield from self._entries(batch)
+                batch = []
+        yield from self._entries(batch)
+
+    def all_entries(self, batch_size=500):
+        return self._stream(self.collection.find(), batch_size)
+
+    def stream_for_user(self, user_id, batch_size=500):
+        buckets = self.collection.find({'user_id': user_id}).sort('date', 1).batch_size(batch_size)
+        return self._stream(buckets, batch_size)
+
+    def most_logged_foods(self, limit):
+        top = self.collection.aggregate([
+            {'$unwind': '$food_id'},
+            {'$group': {'_id': '$food_id', 'uses': {'$sum': 1}}},
+            {'$sort': {'uses': -1}},
+            {'$limit': limit},
+        ], allowDiskUse=True)
+        return [row['_id'] for row in top if row['_id'] is not None]
+
+    def totals_pipeline(self):
+        return _by_day_pipeline({
+            'total_calories': {'$sum': {'$sum': '$calories'}},
+            'protein': {'$sum': {'$sum': '$protein'}},
+            'carbs': {'$sum': {'$sum': '$carbs'}},
+            'fat': {'$sum': {'$sum': '$fat'}},
+            'entry_count': {'$sum': {'$size': '$ids'}},
+        })
+
+
+STORES = {'documents': DocumentLogStore, 'buckets': BucketLogStore}
+
+
+def create(db, layout='documents', food_cache=None):
+    try:
+        return STORES[layout](db, food_cache)
+    except KeyError:
+        raise ValueError(f"LOG_STORAGE must be one of {', '.join(LAYOUTS)}, not {layout!r}")
@@ -0,0 +1,401 @@
+# backend/metrics.py
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from pymongo import common, monitoring
+
+logger = logging.getLogger(__name__)
+
+# --- Request instrumentation ---
+# Every request is timed into a per-route latency histogram (cheap: two
+# perf_counter calls and one locked dict update). A METRICS_SAMPLE_RATE
+# fraction of requests are also traced: the PyMongo CommandListener below
+# attributes each Mongo command to the request running it, so a traced
+# request knows how many commands it issued, how long they took and how
+# long it waited on bcrypt. Requests slower than SLOW_REQUEST_MS are logged,
+# with the shapes of their commands when traced. Tracing costs a few
+# microseconds per command; the default rate of 0.1 keeps the total well
+# under 1% of request time (see benchmarks/instrumentation.py).
+#
+# GET /metrics renders everything in the Prometheus text format. Metrics are
+# per process: with several gunicorn workers, each scrape sees the worker
+# that answered it.
+
+SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", 0.1))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 500))
+PREFIX = 'bitecount'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COMMAND_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+BCRYPT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5)
+# Commands kept per traced request for the slow log
+MAX_TRACED_COMMANDS = 25
+
+# Switched off by benchmarks/instrumentation.py to measure the overhead
+enabled = True
+sample_rate = SAMPLE_RATE
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help_text
+        self.buckets = buckets
+        self.labelnames = labelnames
+        # labels -> [count per bucket (+Inf last), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series, key=lambda s: s[0]):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {round(total, 6)}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+ROUTE_LABELS = ('route', 'method', 'status')
+request_seconds = Histogram('request_duration_seconds', 'Request latency.', LATENCY_BUCKETS, ROUTE_LABELS)
+slow_requests = Counter('slow_requests_total', f'Requests slower than {SLOW_REQUEST_MS:g} ms.', ('route', 'method'))
+traced_requests = Counter('traced_requests_total', 'Requests sampled for Mongo and bcrypt tracing.', ('route',))
+request_commands = Histogram('request_mongo_commands', 'Mongo commands per traced request.',
+                             COUNT_BUCKETS, ('route',))
+request_mongo_seconds = Histogram('request_mongo_seconds', 'Time in Mongo commands per traced request.',
+                                  LATENCY_BUCKETS, ('route',))
+command_seconds = Histogram('mongo_command_duration_seconds', 'Sampled Mongo command latency.',
+                            COMMAND_BUCKETS, ('command',))
+command_failures = Counter('mongo_command_failures_total', 'Sampled Mongo commands that failed.', ('command',))
+bcrypt_seconds = Histogram('bcrypt_duration_seconds', 'Time waited on a password hash or check.', BCRYPT_BUCKETS)
+request_bcrypt_seconds = Histogram('request_bcrypt_seconds', 'Time waited on bcrypt per traced request.',
+                                   BCRYPT_BUCKETS, ('route',))
+pool_wait_seconds = Histogram('mongo_pool_wait_seconds', 'Time waited to check out a Mongo connection.',
+                              POOL_WAIT_BUCKETS)
+pool_checkout_failures = Counter('mongo_pool_checkout_failures_total',
+                                 'Mongo connection checkouts that failed.', ('reason',))
+METRICS = [request_seconds, slow_requests, traced_requests, request_commands, request_mongo_seconds,
+           command_seconds, command_failures, bcrypt_seconds, request_bcrypt_seconds,
+           pool_wait_seconds, pool_checkout_failures]
+
+
+# --- Per-request trace ---
+class Trace:
+    __slots__ = ('commands', 'command_count', 'mongo_seconds', 'bcrypt_seconds', 'started_commands')
+
+    def __init__(self):
+        self.commands = []
+        self.command_count = 0
+        self.mongo_seconds = 0.0
+        self.bcrypt_seconds = 0.0
+        # request_id -> command document, until the command completes
+        self.started_commands = {}
+
+
+_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+
+def start_request():
+    """Returns the request's start time; call at the very start of a request."""
+    if enabled and random.random() < sample_rate:
+        _trace.set(Trace())
+    else:
+        _trace.set(None)
+    return time.perf_counter()
+
+
+def finish_request(started, route, method, status):
+    trace = _trace.get()
+    _trace.set(None)
+    if not enabled:
+        return
+    seconds = time.perf_counter() - started
+    route = route or 'unmatched'
+    request_seconds.observe((route, method, str(status)), seconds)
+    if trace is not None:
+        traced_requests.inc((route,))
+        request_commands.observe((route,), trace.command_count)
+        request_mongo_seconds.observe((route,), trace.mongo_seconds)
+        if trace.bcrypt_seconds:
+            request_bcrypt_seconds.observe((route,), trace.bcrypt_seconds)
+    if seconds * 1000 >= SLOW_REQUEST_MS:
+        slow_requests.inc((route, method))
+        _log_slow(route, method, status, seconds, trace)
+
+
+def _log_slow(route, method, status, seconds, trace):
+    if trace is None:
+        logger.warning("Slow request %s %s -> %s: %.0f ms (not traced)", method, route, status, seconds * 1000)
+        return
+    shapes = [f"{elapsed * 1000:.1f} ms {command_shape(name, command)}"
+              for name, command, elapsed in sorted(trace.commands, key=lambda c: -c[2])]
+    logger.warning(
+        "Slow request %s %s -> %s: %.0f ms, %d Mongo commands (%.0f ms), bcrypt %.0f ms%s",
+        method, route, status, seconds * 1000, trace.command_count, trace.mongo_seconds * 1000,
+        trace.bcrypt_seconds * 1000, ''.join(f"\n  {shape}" for shape in shapes)
+    )
+
+
+def observe_bcrypt(seconds):
+    """PasswordHasher observer: time the calling thread waited on bcrypt."""
+    if not enabled:
+        return
+    bcrypt_seconds.observe((), seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.bcrypt_seconds += seconds
+
+
+# --- Mongo commands ---
+def _shape(value, depth=0):
+    """A filter or document with its values replaced by '?', for grouping queries."""
+    if depth > 4:
+        return '?'
+    if isinstance(value, dict):
+        return {key: _shape(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(value[0], depth + 1)] if value and isinstance(value[0], (dict, list)) else '?'
+    return '?'
+
+
+def command_shape(name, command):
+    """e.g. `find daily_totals {"user_id": "?", "date": {"$gte": "?"}}`."""
+    collection = command.get(name)
+    if name in ('find', 'count', 'distinct'):
+        detail = _shape(command.get('filter') or command.get('query') or {})
+    elif name == 'aggregate':
+        detail = [next(iter(stage), '?') for stage in command.get('pipeline', [])]
+    elif name in ('update', 'delete'):
+        statements = command.get('updates' if name == 'update' else 'deletes') or [{}]
+        detail = {'q': _shape(statements[0].get('q', {})), 'n': len(statements)}
+    elif name == 'findAndModify':
+        detail = _shape(command.get('query', {}))
+    elif name == 'insert':
+        detail = {'n': len(command.get('documents', []))}
+    else:
+        detail = None
+    text = f"{name} {collection}" if isinstance(collection, str) else name
+    return f"{text} {json.dumps(detail, default=str)}" if detail is not None else text
+
+
+class CommandListener(monitoring.CommandListener):
+    """Attributes Mongo commands to the traced request running them."""
+
+    def started(self, event):
+        trace = _trace.get()
+        if trace is not None and len(trace.commands) + len(trace.started_commands) < MAX_TRACED_COMMANDS:
+            trace.started_commands[event.request_id] = event.command
+
+    def _completed(self, event):
+        trace = _trace.get()
+        if trace is None:
+            # Outside a traced request (Motor's executor threads, background
+            # threads): only the per-command histogram, sampled
+            if not enabled or random.random() >= sample_rate:
+                return
+        seconds = event.duration_micros / 1e6
+        command_seconds.observe((event.command_name,), seconds)
+        if trace is None:
+            return
+        trace.command_count += 1
+        trace.mongo_seconds += seconds
+        command = trace.started_commands.pop(event.request_id, None)
+        if command is not None:
+            # Shapes are only worked out if the request turns out slow
+            trace.commands.append((event.command_name, command, seconds))
+
+    def succeeded(self, event):
+        self._completed(event)
+
+    def failed(self, event):
+        command_failures.inc((event.command_name,))
+        self._completed(event)
+
+
+command_listener = CommandListener()
+
+
+# --- Mongo connection pools ---
+class PoolListener(monitoring.ConnectionPoolListener):
+    """
+    Tracks the connection pools of the clients it is registered with (see
+    db.Connections): connections open and checked out against the pool
+    size, checkouts waiting, and how long each checkout waited. A pool is
+    saturated when `in_use` reaches `max_size`; requests then queue in
+    `waiting` until a connection is checked in or waitQueueTimeoutMS
+    passes. Every event is counted, not sampled: each costs a dict update.
+    """
+
+    def __init__(self):
+        # server address -> {'open', 'in_use', 'waiting', 'max_size'}
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _update(self, event, **changes):
+        key = event.address
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = {'open': 0, 'in_use': 0, 'waiting': 0, 'max_size': 0}
+            for name, change in changes.items():
+                pool[name] = max(0, pool[name] + change)
+
+    def pool_created(self, event):
+        self._update(event)
+        with self._lock:
+            # Only options that differ from the driver defaults are listed
+            self._pools[event.address]['max_size'] = event.options.get('maxPoolSize', common.MAX_POOL_SIZE)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(event.address, None)
+
+    def connection_created(self, event):
+        self._update(event, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event, open=-1)
+
+    def connection_check_out_started(self, event):
+        # Checkouts run on the thread that issues the operation (Motor's
+        # executor threads in async mode), so a thread-local times them
+        self._local.started = time.perf_counter()
+        self._update(event, waiting=1)
+
+    def _check_out_ended(self, event):
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        if started is not None and enabled:
+            pool_wait_seconds.observe((), time.perf_counter() - started)
+
+    def connection_checked_out(self, event):
+        self._check_out_ended(event)
+        self._update(event, waiting=-1, in_use=1)
+
+    def connection_check_out_failed(self, event):
+        self._check_out_ended(event)
+        pool_checkout_failures.inc((str(event.reason),))
+        self._update(event, waiting=-1)
+
+    def connection_checked_in(self, event):
+        self._update(event, in_use=-1)
+
+    def stats(self):
+        """Totals over this process's pools, for operational stats and gauges."""
+        with self._lock:
+            pools = [dict(pool) for pool in self._pools.values()]
+        totals = {name: sum(pool[name] for pool in pools) for name in ('open', 'in_use', 'waiting', 'max_size')}
+        # The busiest pool: the first to make requests wait
+        totals['saturation'] = max((pool['in_use'] / pool['max_size'] for pool in pools if pool['max_size']),
+                                   default=0.0)
+        totals['pools'] = len(pools)
+        return totals
+
+
+pool_listener = PoolListener()
+
+
+# --- Exposition ---
+def _gauges(stats, prefix):
+    for key, value in stats.items():
+        name = f'{prefix}_{key}'
+        if isinstance(value, dict):
+            yield from _gauges(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def render(stats=None):
+    """Prometheus text format for every metric, plus `stats` flattened into gauges."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, value in _gauges(stats or {}, PREFIX):
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def install(app):
+    """Adds the timing hooks to a Flask app."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = start_request()
+
+    @app.after_request
+    def _stop_timer(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule else None
+            finish_request(started, rule, request.method, response.status_code)
+        return response
@@ -0,0 +1,97 @@
+# backend/pagination.py
+
+from flask import Response, jsonify, request
+from json_provider import dumps
+
+# --- Keyset pagination, projection and streaming for list endpoints ---
+# `?limit=N&after=<cursor>` returns one bounded page sorted by the cursor field
+# and, when the page is full, the cursor of the next page in the X-Next-Cursor
+# header (the body stays a plain JSON array). Without `limit` the whole result
+# set is streamed, one document at a time, straight off the PyMongo cursor.
+# Ranked results (food search) have no cursor to stream by, so they return
+# DEFAULT_PAGE_SIZE results unless `limit` asks for more.
+# `?fields=a,b` restricts the returned fields to an allow-list.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def parse_limit(args=None):
+    limit = (args if args is not None else request.args).get('limit')
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError("'limit' must be an integer")
+    if limit < 1:
+        raise PaginationError("'limit' must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_projection(allowed_fields, required=(), args=None):
+    """
+    Builds a find() projection from `?fields=`, or None for all fields.
+    `required` fields (e.g. the pagination cursor field) are always included.
+    """
+    raw = (args if args is not None else request.args).get('fields')
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed_fields]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    return {f: 1 for f in list(fields) + list(required)}
+
+
+def project(doc, projection):
+    """Applies a find()-style projection to an in-memory document."""
+    if projection is None:
+        return doc
+    return {k: v for k, v in doc.items() if k == '_id' or k in projection}
+
+
+def encode(doc):
+    return dumps(doc)
+
+
+def iter_json_array(docs):
+    """Yields the JSON array encoding of `docs` one document at a time."""
+    yield '['
+    first = True
+    for doc in docs:
+        if first:
+            first = False
+            yield encode(doc)
+        else:
+            yield ',' + encode(doc)
+    yield ']\n'
+
+
+def stream_json_array(docs):
+    """Streams an iterable of documents as a JSON array without buffering it."""
+    return Response(iter_json_array(docs), mimetype='application/json')
+
+
+def paged_response(cursor, limit, cursor_field):
+    """
+    Returns a bounded page (limit set) or streams the full cursor (no limit).
+    The cursor must already be filtered past `after` and sorted on `cursor_field`.
+    """
+    if limit is None:
+        return stream_json_array(cursor)
+
+    page = list(cursor.limit(limit))
+    response = Response(''.join(iter_json_array(page)), mimetype='application/json')
+    if len(page) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(page[-1][cursor_field])
+    return response
+
+
+def error_response(error):
+    return jsonify({'message': str(error)}), 400
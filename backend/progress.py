@@ -0,0 +1,78 @@
+# backend/progress.py
+
+from datetime import date, timedelta
+
+# --- Progress page ---
+# GET /api/progress/bundle returns what the progress page used to fetch with
+# three calls (/progress/weight, /progress/calories and /progress/check) in
+# one response, after one authentication. Two reads run in parallel: the
+# weight history, and one $facet aggregation that yields both the calorie
+# series of the last CALORIE_DAYS and the CHECK_DAYS average of the progress
+# check. The aggregation reads the adherence month documents (see
+# adherence.py), which hold every logged day's calorie total, so it touches
+# two or three small documents instead of a month of daily_totals. Each
+# section's time is reported under `timings`, in milliseconds.
+
+DATE_FORMAT = '%Y-%m-%d'
+MONTH_FORMAT = '%Y-%m'
+CALORIE_DAYS = 30
+CHECK_DAYS = 7
+
+
+def weight_query(user_id):
+    """(filter, sort) of the weight history, as /api/progress/weight without a cursor."""
+    return {'user_id': user_id}, [('date', 1)]
+
+
+def calories_pipeline(user_id, today=None):
+    """
+    One aggregation over the adherence months for the calorie series (from
+    CALORIE_DAYS ago, as /progress/calories) and the logged-day average of
+    the last CHECK_DAYS (as /progress/check).
+    """
+    today = today or date.today()
+    series_start = today - timedelta(days=CALORIE_DAYS)
+    check_start = (today - timedelta(days=CHECK_DAYS)).strftime(DATE_FORMAT)
+    return [
+        # No upper bound: /progress/calories includes days logged in advance
+        {'$match': {'user_id': user_id, 'month': {'$gte': series_start.strftime(MONTH_FORMAT)}}},
+        {'$project': {'_id': 0, 'month': 1, 'days': {'$objectToArray': '$calories'}}},
+        {'$unwind': '$days'},
+        {'$project': {'date': {'$concat': ['$month', '-', '$days.k']}, 'total_calories': '$days.v'}},
+        {'$match': {'date': {'$gte': min(series_start.strftime(DATE_FORMAT), check_start)}}},
+        {'$facet': {
+            'calories': [
+                {'$match': {'date': {'$gte': series_start.strftime(DATE_FORMAT)}}},
+                {'$sort': {'date': 1}},
+                {'$project': {'_id': '$date', 'total_calories': 1}},
+            ],
+            'week': [
+                {'$match': {'date': {'$gte': check_start, '$lte': today.strftime(DATE_FORMAT)}}},
+                {'$group': {'_id': None, 'average': {'$avg': '$total_calories'}}},
+            ],
+        }},
+    ]
+
+
+def week_average(facets):
+    week = facets.get('week') or []
+    return week[0]['average'] if week else None
+
+
+def check_response(avg_calories, goal):
+    """The /api/progress/check response for a logged-day average (or None)."""
+    if avg_calories is None:
+        return {"on_track": "unknown", "message": "Not enough data to check your progress. Keep logging!"}
+    if avg_calories <= goal:
+        return {"on_track": True, "message": f"Great job! Your average intake of {int(avg_calories)} kcal is on track with your goal of {goal} kcal."}
+    return {"on_track": False, "message": f"Heads up! Your average intake of {int(avg_calories)} kcal is a bit above your goal of {goal} kcal."}
+
+
+def bundle(weights, facets, goal, timings):
+    """The /api/progress/bundle response; `timings` maps section names to seconds."""
+    return {
+        "weight": weights,
+        "calories": facets.get('calories', []),
+        "check": check_response(week_average(facets), goal),
+        "timings": {name: round(seconds * 1000, 2) for name, seconds in timings.items()},
+    }
@@ -0,0 +1,125 @@
+# backend/rollups.py
+
+from collections import defaultdict
+from pymongo import ReturnDocument, UpdateOne
+
+import driver
+from indexes import replace_collection
+
+# --- Per-user daily rollups ---
+# One `daily_totals` document per (user_id, date) holding the pre-aggregated
+# totals of that day's food logs plus the calories burned. The log-writing
+# routes keep it in sync with $inc, so the summary/progress endpoints read one
+# small document per day instead of re-aggregating every raw log entry.
+# The `_async` writes are shared with the Motor routes; see driver.py.
+
+
+def entry_increments(entry, sign=1):
+    macros = entry.get('total_macros') or {}
+    return {
+        'total_calories': sign * (entry.get('total_calories') or 0),
+        'protein': sign * (macros.get('protein') or 0),
+        'carbs': sign * (macros.get('carbs') or 0),
+        'fat': sign * (macros.get('fat') or 0),
+        'entry_count': sign,
+    }
+
+
+async def apply_food_log_async(db, entry, sign=1):
+    """
+    Adds (sign=1) or removes (sign=-1) a daily_logs entry from its day's rollup.
+    Returns the updated daily_totals document.
+    """
+    return await driver.result(db.daily_totals.find_one_and_update(
+        {'user_id': entry['user_id'], 'date': entry['date']},
+        {'$inc': entry_increments(entry, sign)},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    ))
+
+
+def apply_food_log(db, entry, sign=1):
+    return driver.run(apply_food_log_async(db, entry, sign))
+
+
+async def apply_food_logs_async(db, entries):
+    """Adds many new daily_logs entries with one bulk write (one update per day)."""
+    per_day = defaultdict(lambda: defaultdict(int))
+    for entry in entries:
+        day = per_day[(entry['user_id'], entry['date'])]
+        for field, value in entry_increments(entry).items():
+            day[field] += value
+
+    if per_day:
+        await driver.result(db.daily_totals.bulk_write([
+            UpdateOne({'user_id': user_id, 'date': date_str}, {'$inc': dict(increments)}, upsert=True)
+            for (user_id, date_str), increments in per_day.items()
+        ], ordered=False))
+
+
+def apply_food_logs(db, entries):
+    driver.run(apply_food_logs_async(db, entries))
+
+
+async def set_calories_burned_async(db, user_id, date_str, calories_burned):
+    return await driver.result(db.daily_totals.find_one_and_update(
+        {'user_id': user_id, 'date': date_str},
+        {'$set': {'calories_burned': calories_burned}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    ))
+
+
+def set_calories_burned(db, user_id, date_str, calories_burned):
+    return driver.run(set_calories_burned_async(db, user_id, date_str, calories_burned))
+
+
+def set_calories_burned_many(db, user_id, calories_by_date):
+    """set_calories_burned for many days with one bulk write."""
+    if calories_by_date:
+        db.daily_totals.bulk_write([
+            UpdateOne({'user_id': user_id, 'date': date_str}, {'$set': {'calories_burned': calories_burned}},
+                      upsert=True)
+            for date_str, calories_burned in calories_by_date.items()
+        ], ordered=False)
+
+
+def get_range_totals(db, user_id, start_date_str, end_date_str=None):
+    """Days inside the range that have at least one food log, sorted by date."""
+    date_filter = {'$gte': start_date_str}
+    if end_date_str:
+        date_filter['$lte'] = end_date_str
+    return db.daily_totals.find(
+        {'user_id': user_id, 'date': date_filter, 'entry_count': {'$gt': 0}},
+        {'_id': 0, 'date': 1, 'total_calories': 1}
+    ).sort('date', 1)
+
+
+def rebuild_daily_totals(db, logs):
+    """
+    Recomputes the whole daily_totals collection from the food log entries
+    (read through `logs`, a LogStore) and activity_logs. Used to backfill
+    existing data and to repair drift.
+    """
+    totals = {}
+    for row in logs.collection.aggregate(logs.totals_pipeline(), allowDiskUse=True):
+        key = (row['_id']['user_id'], row['_id']['date'])
+        totals[key] = {
+            'user_id': key[0],
+            'date': key[1],
+            'total_calories': row['total_calories'],
+            'protein': row['protein'],
+            'carbs': row['carbs'],
+            'fat': row['fat'],
+            'entry_count': row['entry_count'],
+        }
+
+    for activity in db.activity_logs.find({'user_id': {'$exists': True}}):
+        key = (activity['user_id'], activity['date'])
+        day = totals.setdefault(key, {
+            'user_id': key[0], 'date': key[1], 'total_calories': 0,
+            'protein': 0, 'carbs': 0, 'fat': 0, 'entry_count': 0,
+        })
+        day['calories_burned'] = activity.get('calories_burned', 0)
+
+    return replace_collection(db, 'daily_totals', totals.values())
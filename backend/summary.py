@@ -0,0 +1,121 @@
+# backend/summary.py
+
+from datetime import datetime, timedelta
+
+import driver
+
+# --- Daily summary engine ---
+# One aggregation over daily_totals returns every day of a range with its
+# rolled-up food totals and calories burned (see rollups.py) and, joined by
+# $lookup, that day's food logs: a single round-trip whether the client asks
+# for one day or prefetches a week. The join comes from the LogStore, so it
+# works with either storage layout (see log_store.py). Goals and weight come
+# from the access token's claims (see tokens.py), or the user document for
+# tokens issued without them. Both serving modes run the `_async` readers;
+# see driver.py.
+
+MAX_RANGE_DAYS = 31
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class SummaryRangeError(ValueError):
+    pass
+
+
+def parse_range(from_str, to_str):
+    """Validates `from`/`to` and returns every date string in between, inclusive."""
+    if not from_str or not to_str:
+        raise SummaryRangeError("'from' and 'to' are required")
+    try:
+        start = datetime.strptime(from_str, DATE_FORMAT)
+        end = datetime.strptime(to_str, DATE_FORMAT)
+    except ValueError:
+        raise SummaryRangeError("'from' and 'to' must be dates (YYYY-MM-DD)")
+    days = (end - start).days + 1
+    if days < 1:
+        raise SummaryRangeError("'from' must not be after 'to'")
+    if days > MAX_RANGE_DAYS:
+        raise SummaryRangeError(f"At most {MAX_RANGE_DAYS} days per request")
+    return [(start + timedelta(days=offset)).strftime(DATE_FORMAT) for offset in range(days)]
+
+
+def pipeline(user_id, start_date_str, end_date_str, lookup=None):
+    """daily_totals for the range, joined with `lookup` (LogStore.lookup_stage)."""
+    stages = [
+        {'$match': {'user_id': user_id, 'date': {'$gte': start_date_str, '$lte': end_date_str}}},
+        {'$sort': {'date': 1}},
+    ]
+    if lookup:
+        stages.append(lookup)
+    return stages
+
+
+def attach_logs(days, logs):
+    """Client-side $lookup, for servers without correlated lookups (mongomock)."""
+    by_date = {}
+    for log in logs:
+        by_date.setdefault(log['date'], []).append(log)
+    for day in days:
+        day['logged_foods'] = by_date.get(day['date'], [])
+    return days
+
+
+async def load_days_async(logs, user_id, start_date_str, end_date_str):
+    totals = logs.db.daily_totals
+    try:
+        days = await driver.to_list(totals.aggregate(
+            pipeline(user_id, start_date_str, end_date_str, logs.lookup_stage(user_id))))
+    except NotImplementedError:
+        days = await driver.to_list(totals.aggregate(pipeline(user_id, start_date_str, end_date_str)))
+        return attach_logs(days, await driver.result(logs.find(user_id, start_date_str, end_date_str)))
+    for day in days:
+        day['logged_foods'] = logs.expand(day['logged_foods'])
+    return days
+
+
+def build_day(date_str, day, user):
+    """The /api/summary/<date> response for one day (`day` may be None)."""
+    day = day or {}
+    return {
+        "date": date_str,
+        "total_calories": round(day.get('total_calories', 0), 2),
+        "calories_burned": round(day.get('calories_burned', 0), 2),
+        "logged_foods": day.get('logged_foods', []),
+        "macros_consumed": {
+            "protein": round(day.get('protein', 0), 2),
+            "carbs": round(day.get('carbs', 0), 2),
+            "fat": round(day.get('fat', 0), 2)
+        },
+        "user_profile": {
+            "current_weight": user.get("current_weight"),
+            "calorie_goal": user.get("profile").get("daily_calorie_goal"),
+            "macro_goals": user.get("macro_goals") # Can be None/null
+        }
+    }
+
+
+def build_range(dates, days, user):
+    """One summary per date in `dates`, including days with nothing logged."""
+    by_date = {day['date']: day for day in days}
+    return {
+        "from": dates[0],
+        "to": dates[-1],
+        "days": [build_day(date_str, by_date.get(date_str), user) for date_str in dates],
+    }
+
+
+async def get_day_async(logs, user, date_str):
+    days = await load_days_async(logs, user['_id'], date_str, date_str)
+    return build_day(date_str, days[0] if days else None, user)
+
+
+async def get_range_async(logs, user, dates):
+    return build_range(dates, await load_days_async(logs, user['_id'], dates[0], dates[-1]), user)
+
+
+def get_day(logs, user, date_str):
+    return driver.run(get_day_async(logs, user, date_str))
+
+
+def get_range(logs, user, dates):
+    return driver.run(get_range_async(logs, user, dates))
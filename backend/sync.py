@@ -0,0 +1,159 @@
+# backend/sync.py
+
+import heapq
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+
+import driver
+import etag
+
+# --- Offline-sync change feed ---
+# Every write to a synced collection takes the next number from a per-user,
+# monotonically increasing sequence (`sync_counters`) and stamps it on the
+# document as `_seq`. Deletes leave a tombstone carrying a sequence number.
+# GET /api/sync?since=<token> then returns everything stamped after the token.
+#
+# A sequence number is reserved just before its write lands, so a concurrent
+# sync could otherwise see seq N+1 before N exists and skip N for good. The
+# counter therefore remembers when its most recent numbers were reserved, and
+# a sync only hands out tokens below numbers reserved in the last
+# SETTLE_SECONDS. Clients may receive a change twice and must apply changes
+# idempotently by _id.
+#
+# A full snapshot (no token) is paged the same way: its pages are the changes
+# after sequence number 0, without the tombstones, and the client follows
+# `has_more` with incremental calls from the returned token. Logs written
+# before the change feed existed need `python db.py sequence-logs` once.
+
+SYNCED_COLLECTIONS = ('daily_logs', 'weight_logs', 'activity_logs')
+# Read directly; daily_logs entries are read through the LogStore
+_DOCUMENT_COLLECTIONS = ('weight_logs', 'activity_logs')
+SETTLE_SECONDS = 2
+RECENT_RESERVATIONS = 200
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+
+def reserve_update(count=1):
+    """
+    The counter update reserving `count` sequence numbers. The ETag versions
+    are bumped separately, once the write has landed (etag.bump): a version
+    bumped first could tag a read of the old data with the new ETag.
+    """
+    return {
+        '$inc': {'seq': count},
+        # One timestamp per reserved number; recent[-1] belongs to `seq`
+        '$push': {'recent': {'$each': [datetime.utcnow()] * count, '$slice': -RECENT_RESERVATIONS}},
+    }
+
+
+async def reserve_async(db, user_id, count=1):
+    """Reserves `count` consecutive sequence numbers and returns the first one."""
+    counter = await driver.result(db.sync_counters.find_one_and_update(
+        {'_id': user_id},
+        reserve_update(count),
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    ))
+    return counter['seq'] - count + 1
+
+
+def reserve(db, user_id, count=1):
+    return driver.run(reserve_async(db, user_id, count))
+
+
+async def record_deletion_async(db, user_id, collection_name, doc_id):
+    await driver.result(db.sync_tombstones.insert_one({
+        'user_id': user_id,
+        'collection': collection_name,
+        'doc_id': doc_id,
+        'seq': await reserve_async(db, user_id),
+        'deleted_at': datetime.utcnow(),
+    }))
+    await etag.bump_async(db, user_id, collection_name)
+
+
+def record_deletion(db, user_id, collection_name, doc_id):
+    driver.run(record_deletion_async(db, user_id, collection_name, doc_id))
+
+
+def settled_token(db, user_id):
+    """The highest sequence number below which every write has landed."""
+    counter = db.sync_counters.find_one({'_id': user_id})
+    if not counter:
+        return 0
+    seq = counter['seq']
+    recent = counter.get('recent', [])
+    cutoff = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+    first_seq = seq - len(recent) + 1
+    for offset, reserved_at in enumerate(recent):
+        if reserved_at > cutoff:
+            return first_seq + offset - 1
+    return seq
+
+
+def _changed_docs(collection, user_id, seq_range, limit):
+    cursor = collection.find({'user_id': user_id, '_seq': seq_range}).sort('_seq', 1).limit(limit)
+    for doc in cursor:
+        yield doc['_seq'], collection.name, 'change', doc
+
+
+def _changed_logs(logs, user_id, seq_range, limit):
+    for seq, entry in logs.changes(user_id, seq_range, limit):
+        yield seq, 'daily_logs', 'change', entry
+
+
+def _tombstones(db, user_id, seq_range, limit):
+    cursor = db.sync_tombstones.find({'user_id': user_id, 'seq': seq_range}).sort('seq', 1).limit(limit)
+    for tombstone in cursor:
+        yield tombstone['seq'], tombstone['collection'], 'delete', tombstone['doc_id']
+
+
+def changes_since(db, logs, user_id, since, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns the changes after token `since`; `since=0` starts a full
+    snapshot. Results are paged by sequence number: at most `limit` changes
+    (a page may finish a bucket's entries, see log_store.py), with `has_more`
+    telling the client to call again with the returned token. Food log
+    entries are read through `logs`, a LogStore.
+    """
+    full = since <= 0
+    since = max(since, 0)
+    token = settled_token(db, user_id)
+    # Never hand back a token older than the one the client already holds
+    token = max(token, since)
+
+    seq_range = {'$gt': since, '$lte': token}
+    streams = [
+        _changed_docs(db[name], user_id, seq_range, limit + 1) for name in _DOCUMENT_COLLECTIONS
+    ]
+    streams.append(_changed_logs(logs, user_id, seq_range, limit + 1))
+    if not full:
+        # A snapshot has nothing on the client to delete
+        streams.append(_tombstones(db, user_id, seq_range, limit + 1))
+
+    changes = {name: [] for name in SYNCED_COLLECTIONS}
+    deleted = {name: [] for name in SYNCED_COLLECTIONS}
+    merged = heapq.merge(*streams, key=lambda change: change[0])
+    last_seq = since
+    count = 0
+    has_more = False
+    for seq, name, kind, payload in merged:
+        # Changes sharing a seq (a bucket's entries) stay on one page
+        if count >= limit and seq != last_seq:
+            has_more = True
+            break
+        if kind == 'change':
+            changes[name].append(payload)
+        else:
+            deleted[name].append(str(payload))
+        last_seq = seq
+        count += 1
+
+    return {
+        'token': str(last_seq if has_more else token),
+        'full': full,
+        'has_more': has_more,
+        'changes': changes,
+        'deleted': deleted,
+    }
@@ -0,0 +1,317 @@
+# backend/tokens.py
+
+import hashlib
+import logging
+import math
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import jwt
+from bson import ObjectId
+from bson.errors import InvalidId
+
+logger = logging.getLogger(__name__)
+
+# --- Access and refresh tokens ---
+# /api/login returns a short-lived access token (ACCESS_TOKEN_TTL seconds)
+# and a long-lived, single-use refresh token. POST /api/token/refresh trades
+# the refresh token for a new pair without checking the password, so bcrypt
+# only runs at login.
+#
+# The access token is an HS256 JWT that carries the user fields the hot read
+# routes need (goals and current weight; see CLAIM_FIELDS), so those routes
+# (`claims_required`) skip the user lookup. The claims are at most
+# ACCESS_TOKEN_TTL old: the writes that change them send a renewed token in
+# the RENEWED_TOKEN_HEADER response header, and `uv` (the user's `users`
+# version, see etag.py) is part of the ETag so a renewed token never gets a
+# 304 for a response built from older claims.
+#
+# Verified tokens are kept in a small LRU, so a client reusing its token
+# pays the HMAC and JSON decoding once. Revoked access tokens (logout) are
+# stored in `revoked_tokens` until they expire, and every verification checks
+# an in-memory bloom filter of them, reloaded from the collection every
+# REVOCATION_SYNC_SECONDS by a background thread; only a filter hit costs a
+# Mongo lookup. A revocation on another worker therefore takes effect here
+# within REVOCATION_SYNC_SECONDS.
+#
+# Refresh tokens are random strings stored as SHA-256 digests in
+# `refresh_tokens`. Each refresh rotates the token within its family (one
+# login); presenting an already used token revokes the whole family, since
+# either the client or someone who stole the token is replaying it.
+
+ALGORITHM = 'HS256'
+ACCESS_TOKEN_TTL = 900
+REFRESH_TOKEN_DAYS = 30
+VERIFIED_CACHE_SIZE = 10000
+REVOCATION_SYNC_SECONDS = 30
+BLOOM_CAPACITY = 100000
+BLOOM_ERROR_RATE = 0.001
+RENEWED_TOKEN_HEADER = 'X-Access-Token'
+RENEWED_REFRESH_TOKEN_HEADER = 'X-Refresh-Token'
+# User document fields copied into the access token
+CLAIM_FIELDS = ('current_weight', 'macro_goals', 'profile.daily_calorie_goal', 'profile.daily_calories_goal')
+
+
+class TokenError(Exception):
+    pass
+
+
+class ExpiredToken(TokenError):
+    pass
+
+
+class InvalidToken(TokenError):
+    pass
+
+
+def users_version(counter):
+    """The `users` version in a sync_counters document (0 without one)."""
+    return ((counter or {}).get('versions') or {}).get('users', 0)
+
+
+def user_claims(user):
+    """The CLAIM_FIELDS of a user document, nested the same way."""
+    claims = {}
+    for field in CLAIM_FIELDS:
+        parent, _, name = field.rpartition('.')
+        source = (user.get(parent) or {}) if parent else user
+        target = claims.setdefault(parent, {}) if parent else claims
+        target[name] = source.get(name)
+    return claims
+
+
+def claims_user(claims):
+    """
+    The user document a `claims_required` route receives: the _id plus the
+    CLAIM_FIELDS, or None for a token without them (issued before claims).
+    """
+    fields = claims.get('usr')
+    if fields is None:
+        return None
+    return {'_id': user_id_of(claims), 'claims_version': claims.get('uv', 0), **fields}
+
+
+def user_id_of(claims):
+    try:
+        return ObjectId(claims['user_id'])
+    except (KeyError, TypeError, InvalidId):
+        raise InvalidToken("Token has no valid user id")
+
+
+def _digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+# --- Revocation list ---
+class BloomFilter:
+    """Fixed-size bloom filter over strings (double hashing on one blake2b digest)."""
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """Revoked access token ids: `revoked_tokens` behind a bloom filter."""
+
+    def __init__(self, collection, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self._collection = collection
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._filter = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+        # jti -> time revoked here, re-added to a filter built concurrently
+        self._recent = {}
+        self._sync_pid = None
+        self.stats = {'entries': 0, 'filter_hits': 0, 'confirmed': 0, 'reloads': 0}
+
+    def revoke(self, jti, expires_at):
+        self._collection.update_one({'_id': jti}, {'$setOnInsert': {'expires_at': expires_at}}, upsert=True)
+        with self._lock:
+            self._filter.add(jti)
+            self._recent[jti] = time.monotonic()
+
+    def might_contain(self, jti):
+        if jti not in self._filter:
+            return False
+        self.stats['filter_hits'] += 1
+        return True
+
+    def confirmed(self, revoked):
+        """Counts the outcome of the lookup after a filter hit."""
+        if revoked:
+            self.stats['confirmed'] += 1
+        return revoked
+
+    def is_revoked(self, jti):
+        if not self.might_contain(jti):
+            return False
+        return self.confirmed(self._collection.find_one({'_id': jti}, {'_id': 1}) is not None)
+
+    def reload(self):
+        """Rebuilds the filter from the unexpired entries (expired ones drop out)."""
+        started = time.monotonic()
+        bloom = BloomFilter(self._capacity, self._error_rate)
+        for doc in self._collection.find({'expires_at': {'$gt': datetime.utcnow()}}, {'_id': 1}):
+            bloom.add(doc['_id'])
+        with self._lock:
+            # Revocations written after the query started may be missing from it
+            self._recent = {jti: at for jti, at in self._recent.items() if at >= started}
+            for jti in self._recent:
+                bloom.add(jti)
+            self._filter = bloom
+        self.stats['entries'] = bloom.count
+        self.stats['reloads'] += 1
+
+    def start(self, interval=REVOCATION_SYNC_SECONDS):
+        """Starts the sync thread (once per process)."""
+        if self._sync_pid == os.getpid():
+            return
+        self._sync_pid = os.getpid()
+
+        def run():
+            while True:
+                try:
+                    self.reload()
+                except Exception:
+                    logger.exception("Could not reload the token revocation list")
+                time.sleep(interval)
+        threading.Thread(target=run, name='token-revocations', daemon=True).start()
+
+
+# --- Issuing and verifying ---
+class TokenService:
+    def __init__(self, db, secret_key, access_ttl=ACCESS_TOKEN_TTL, refresh_days=REFRESH_TOKEN_DAYS,
+                 cache_size=VERIFIED_CACHE_SIZE):
+        self._db = db
+        # Encoded once instead of on every encode/decode
+        self._key = secret_key.encode('utf-8')
+        self.access_ttl = access_ttl
+        self.refresh_ttl = timedelta(days=refresh_days)
+        self._cache_size = cache_size
+        self._verified = OrderedDict()
+        self._lock = threading.Lock()
+        self.revocations = RevocationList(db.revoked_tokens)
+        self.stats = {'verified_hits': 0, 'verified_misses': 0}
+
+    def access_token(self, user, version):
+        """A signed access token for `user`, whose `users` version is `version`."""
+        now = int(time.time())
+        return jwt.encode({
+            'user_id': str(user['_id']),
+            'type': 'access',
+            'jti': secrets.token_urlsafe(12),
+            'iat': now,
+            'exp': now + self.access_ttl,
+            'uv': version,
+            'usr': user_claims(user),
+        }, self._key, algorithm=ALGORITHM)
+
+    def decode(self, token):
+        """
+        The claims of a valid access token, without the revocation check.
+        Raises ExpiredToken or InvalidToken.
+        """
+        with self._lock:
+            claims = self._verified.get(token)
+            if claims is not None:
+                self._verified.move_to_end(token)
+        if claims is not None:
+            self.stats['verified_hits'] += 1
+            if claims['exp'] <= time.time():
+                raise ExpiredToken("Token has expired!")
+            return claims
+
+        self.stats['verified_misses'] += 1
+        try:
+            claims = jwt.decode(token, self._key, algorithms=[ALGORITHM], options={'require': ['exp']})
+        except jwt.ExpiredSignatureError:
+            raise ExpiredToken("Token has expired!")
+        except jwt.InvalidTokenError as e:
+            raise InvalidToken(str(e))
+        # Tokens from before refresh tokens have no type
+        if claims.get('type', 'access') != 'access':
+            raise InvalidToken("Not an access token")
+        with self._lock:
+            self._verified[token] = claims
+            while len(self._verified) > self._cache_size:
+                self._verified.popitem(last=False)
+        return claims
+
+    def verify(self, token):
+        claims = self.decode(token)
+        jti = claims.get('jti')
+        if jti is not None and self.revocations.is_revoked(jti):
+            raise InvalidToken("Token has been revoked")
+        return claims
+
+    def revoke_access(self, claims):
+        if claims.get('jti') is not None:
+            self.revocations.revoke(claims['jti'], datetime.utcfromtimestamp(claims['exp']))
+
+    # --- Refresh tokens ---
+    def refresh_token(self, user_id, family=None):
+        token = secrets.token_urlsafe(32)
+        self._db.refresh_tokens.insert_one({
+            '_id': _digest(token),
+            'user_id': user_id,
+            'family': family or secrets.token_hex(8),
+            'expires_at': datetime.utcnow() + self.refresh_ttl,
+            'used': False,
+        })
+        return token
+
+    def rotate(self, token):
+        """
+        Marks a refresh token used and returns (user_id, its replacement).
+        Raises InvalidToken for an unknown, expired or already used token.
+        """
+        digest = _digest(token)
+        doc = self._db.refresh_tokens.find_one_and_update(
+            {'_id': digest, 'used': False, 'expires_at': {'$gt': datetime.utcnow()}},
+            {'$set': {'used': True}}
+        )
+        if doc is None:
+            replayed = self._db.refresh_tokens.find_one({'_id': digest, 'used': True})
+            if replayed is not None:
+                logger.warning("Refresh token reused for user %s; revoking its session", replayed['user_id'])
+                self._db.refresh_tokens.delete_many({'family': replayed['family']})
+            raise InvalidToken("Refresh token is invalid or expired")
+        return doc['user_id'], self.refresh_token(doc['user_id'], doc['family'])
+
+    def revoke_refresh(self, token):
+        """Ends the session (family) a refresh token belongs to."""
+        doc = self._db.refresh_tokens.find_one({'_id': _digest(token)}, {'family': 1})
+        if doc is not None:
+            self._db.refresh_tokens.delete_many({'family': doc['family']})
+
+    def revoke_user(self, user_id):
+        """Ends every session of a user (their access tokens expire on their own)."""
+        self._db.refresh_tokens.delete_many({'user_id': user_id})
+
+    def cache_stats(self):
+        return {
+            **self.stats,
+            'verified_size': len(self._verified),
+            'revocations': dict(self.revocations.stats),
+        }
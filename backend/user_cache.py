@@ -0,0 +1,148 @@
+# backend/user_cache.py
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from bson import json_util
+
+logger = logging.getLogger(__name__)
+
+# --- Authenticated-user cache ---
+# token_required looks the user up on every protected request. This caches
+# the user document by user_id with a TTL and an LRU size bound. Routes that
+# change the user document must call `invalidate`.
+#
+# The default backend is local to the worker process, so another worker can
+# serve a stale copy for up to `ttl` seconds after an invalidation. Set
+# USER_CACHE_REDIS_URL to share one cache (and its invalidations) across all
+# gunicorn workers through a Redis-compatible server.
+
+
+class _LocalBackend:
+    name = 'local'
+
+    def __init__(self, maxsize, ttl):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self._ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def size(self):
+        return len(self._items)
+
+
+class _RedisBackend:
+    name = 'redis'
+    evictions = 0  # Redis evicts on its own (maxmemory policy)
+
+    def __init__(self, url, ttl, prefix='bitecount:user:'):
+        import redis  # Optional dependency, only needed for this backend
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = ttl
+        self._prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(self._prefix + key)
+        if raw is None:
+            return None
+        return json_util.loads(raw)
+
+    def set(self, key, value):
+        raw = json_util.dumps(value, json_options=json_util.CANONICAL_JSON_OPTIONS)
+        self._redis.set(self._prefix + key, raw, ex=self._ttl)
+
+    def delete(self, key):
+        self._redis.delete(self._prefix + key)
+
+    def size(self):
+        return None
+
+
+class UserCache:
+    def __init__(self, maxsize=10000, ttl=60, redis_url=None):
+        self._backend = _RedisBackend(redis_url, ttl) if redis_url else _LocalBackend(maxsize, ttl)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def get(self, user_id):
+        """Returns the cached user document, or None on a miss."""
+        try:
+            user = self._backend.get(str(user_id))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("User cache read failed: %s", e)
+            user = None
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user
+
+    def put(self, user_id, user):
+        try:
+            self._backend.set(str(user_id), user)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("User cache write failed: %s", e)
+
+    def get_or_load(self, user_id, loader):
+        """
+        Returns the cached user document for `user_id`, calling
+        `loader(user_id)` (a DB lookup) and caching its result on a miss.
+        Backend failures degrade to a plain DB lookup.
+        """
+        user = self.get(user_id)
+        if user is None:
+            user = loader(user_id)
+            if user is not None:
+                self.put(user_id, user)
+        return user
+
+    def invalidate(self, user_id):
+        self.invalidations += 1
+        try:
+            self._backend.delete(str(user_id))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("User cache invalidation failed: %s", e)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': self._backend.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+            'evictions': self._backend.evictions,
+            'errors': self.errors,
+            'size': self._backend.size(),
+        }
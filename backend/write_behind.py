@@ -0,0 +1,327 @@
+# backend/write_behind.py
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import UpdateOne
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, WTimeoutError
+
+import etag
+import sync
+
+logger = logging.getLogger(__name__)
+
+# --- Write-behind for weight and activity logs ---
+# POST /api/log/weight writes weight_logs and users.current_weight, and
+# POST /api/log/activity writes activity_logs and daily_totals.calories_burned,
+# each behind a sync_counters reservation: three or four round-trips per
+# edit, repeated while a user corrects a value. With WRITE_BEHIND_MS set,
+# those routes hand the edit to a WriteBehind queue instead and answer
+# straight away. Edits for the same (user, date) within the window coalesce
+# into the last value, and a background thread writes the due users with one
+# reservation per user and log, and one unordered bulk_write per collection.
+#
+# Guarantees:
+#   * read-your-writes: every other authenticated request of a user with
+#     pending edits writes them first (`flush_user`), so the user's reads,
+#     ETags and sync tokens see them. The pending edits live in the worker
+#     that accepted them; a request served by another worker sees them once
+#     they are written, at most the window (plus the write) later.
+#   * bounded: at most `max_pending` edits wait; past that the routes write
+#     through as before.
+#   * retries: a failed bulk_write is retried with backoff for connection,
+#     wtimeout and time-limit errors (the writes are idempotent $set
+#     upserts). If every attempt fails the edits go back in the queue, unless
+#     a newer value for the same date arrived meanwhile, and are tried again
+#     after REQUEUE_BACKOFF (doubling each round). A retried round reuses the
+#     batch's sync sequence numbers while they are unsettled (see sync.py).
+#     After `max_attempts` failed rounds the edits are dropped and counted
+#     as lost.
+#   * shutdown: `close` (registered with atexit, so a graceful gunicorn
+#     worker exit runs it) writes everything still queued. A worker killed
+#     outright loses at most one window of edits, which is why the queue is
+#     off by default.
+
+WINDOW_MS = 250
+MAX_PENDING = 10000
+MAX_ATTEMPTS = 4
+RETRY_BACKOFF = 0.1
+REQUEUE_BACKOFF = 1.0
+RETRYABLE_ERRORS = (ConnectionFailure, WTimeoutError, ExecutionTimeout)
+WEIGHT = 'weight_logs'
+ACTIVITY = 'activity_logs'
+# Key of the user's latest weight among their edits
+CURRENT_WEIGHT = ('users', 'current_weight')
+
+
+class WriteBehind:
+    """
+    `on_users_written`, if given, is called on the writing thread with the
+    ids of the users whose document was updated (to drop them from caches).
+    """
+
+    def __init__(self, db, window_ms=WINDOW_MS, max_pending=MAX_PENDING, max_attempts=MAX_ATTEMPTS,
+                 on_users_written=None):
+        self._db = db
+        self.window = window_ms / 1000
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._on_users_written = on_users_written
+        # user_id -> (time of the first pending edit, {(collection, date): value}),
+        # oldest first
+        self._pending = OrderedDict()
+        self._size = 0
+        # user_id -> Event set once the batch holding their edits is written
+        self._writing = {}
+        # user_id -> (failed rounds, time reserved, {(collection, date): seq})
+        # for the batch being written or waiting to be retried
+        self._retries = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.stats = {'accepted': 0, 'coalesced': 0, 'rejected': 0, 'flushes': 0, 'written': 0,
+                      'inline_flushes': 0, 'retries': 0, 'failures': 0, 'lost': 0}
+
+    # --- Queueing ---
+    def log_weight(self, user_id, date_str, weight):
+        """Queues a weigh-in (and the user's current weight); False if the queue is full."""
+        return self._offer(user_id, {(WEIGHT, date_str): weight, CURRENT_WEIGHT: weight})
+
+    def log_activity(self, user_id, date_str, calories_burned):
+        """Queues a day's calories burned; False if the queue is full."""
+        return self._offer(user_id, {(ACTIVITY, date_str): calories_burned})
+
+    def _offer(self, user_id, edits):
+        with self._cond:
+            if self._closed:
+                return False
+            if self._pid != os.getpid():
+                self._start()
+            first_at, pending = self._pending.get(user_id, (None, {}))
+            added = sum(1 for key in edits if key not in pending)
+            if self._size + added > self.max_pending:
+                self.stats['rejected'] += 1
+                return False
+            if first_at is None:
+                self._pending[user_id] = (time.monotonic(), pending)
+                if len(self._pending) == 1:
+                    self._cond.notify()
+            self.stats['coalesced'] += len(edits) - added
+            self.stats['accepted'] += 1
+            self._size += added
+            pending.update(edits)
+            return True
+
+    def has_pending(self, user_id):
+        # Unlocked: a stale answer only costs (or skips) an empty flush_user
+        return user_id in self._pending or user_id in self._writing
+
+    def pending_count(self):
+        return self._size
+
+    # --- Writing ---
+    def flush_user(self, user_id):
+        """Writes the user's pending edits now, after any write of them already under way."""
+        while self.has_pending(user_id):
+            with self._cond:
+                writing = self._writing.get(user_id)
+                if writing is None:
+                    batch = self._take([user_id])
+            if writing is not None:
+                writing.wait()
+                continue
+            if batch:
+                self.stats['inline_flushes'] += 1
+                self._write(batch, requeue_on_failure=True, raise_on_failure=True)
+
+    def _take(self, user_ids):
+        """Moves the users' pending edits into a batch being written (call locked)."""
+        batch = {}
+        for user_id in user_ids:
+            entry = self._pending.pop(user_id, None)
+            if entry is None:
+                continue
+            batch[user_id] = entry
+            self._size -= len(entry[1])
+            self._writing[user_id] = threading.Event()
+        return batch
+
+    def _due_users(self, now):
+        # Requeued users wait out their backoff, so first_at is not in order
+        return [
+            user_id for user_id, (first_at, _) in self._pending.items()
+            if (self._closed or now - first_at >= self.window) and user_id not in self._writing
+        ]
+
+    def _reserve(self, user_id, keys):
+        """
+        The sync sequence numbers of the user's edits `keys`. A retried batch
+        keeps the numbers of its first round while they are unsettled: once
+        a sync may have handed out a token past them, a write stamped with
+        them could be missed, so they are reserved again.
+        """
+        rounds, reserved_at, seqs = self._retries.get(user_id, (0, None, {}))
+        if (reserved_at is not None and time.monotonic() - reserved_at < sync.SETTLE_SECONDS
+                and all(key in seqs for key in keys)):
+            return seqs
+        reserved_at = time.monotonic()
+        first_seq = sync.reserve(self._db, user_id, count=len(keys))
+        seqs = {key: first_seq + offset for offset, key in enumerate(keys)}
+        self._retries[user_id] = (rounds, reserved_at, seqs)
+        return seqs
+
+    def _operations(self, batch):
+        """The bulk writes of a batch, per collection; reserves the sync sequence numbers."""
+        requests = {WEIGHT: [], 'users': [], ACTIVITY: [], 'daily_totals': []}
+        for user_id, (_, edits) in batch.items():
+            weights = sorted((date_str, value) for (name, date_str), value in edits.items() if name == WEIGHT)
+            activities = sorted((date_str, value) for (name, date_str), value in edits.items() if name == ACTIVITY)
+            if weights or activities:
+                seqs = self._reserve(user_id, [(WEIGHT, date_str) for date_str, _ in weights] +
+                                     [(ACTIVITY, date_str) for date_str, _ in activities])
+            for date_str, weight in weights:
+                requests[WEIGHT].append(UpdateOne(
+                    {"user_id": user_id, "date": date_str},
+                    {"$set": {"user_id": user_id, "weight": weight, "date": date_str,
+                              "_seq": seqs[(WEIGHT, date_str)]}},
+                    upsert=True
+                ))
+            if CURRENT_WEIGHT in edits:
+                requests['users'].append(UpdateOne(
+                    {"_id": user_id},
+                    {"$set": {"current_weight": edits[CURRENT_WEIGHT]}}
+                ))
+            for date_str, calories_burned in activities:
+                requests[ACTIVITY].append(UpdateOne(
+                    {"user_id": user_id, "date": date_str},
+                    {"$set": {"user_id": user_id, "calories_burned": calories_burned, "date": date_str,
+                              "_seq": seqs[(ACTIVITY, date_str)]}},
+                    upsert=True
+                ))
+                requests['daily_totals'].append(UpdateOne(
+                    {'user_id': user_id, 'date': date_str},
+                    {'$set': {'calories_burned': calories_burned}},
+                    upsert=True
+                ))
+        return [(name, ops) for name, ops in requests.items() if ops]
+
+    def _bulk_write(self, name, ops):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._db[name].bulk_write(ops, ordered=False)
+                return
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_attempts:
+                    raise
+                self.stats['retries'] += 1
+                logger.warning("Write-behind bulk_write to %s failed (%s); retrying", name, e)
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+
+    def _write(self, batch, requeue_on_failure, raise_on_failure=False):
+        try:
+            for name, ops in self._operations(batch):
+                self._bulk_write(name, ops)
+        except Exception:
+            self.stats['failures'] += 1
+            edits = sum(len(entry[1]) for entry in batch.values())
+            lost = self._requeue(batch) if requeue_on_failure else self._drop(batch)
+            if lost < edits:
+                logger.exception("Write-behind could not write %d edits; %d stay queued", edits, edits - lost)
+            if lost:
+                logger.exception("Write-behind could not write %d edits; they are lost", lost)
+                self.stats['lost'] += lost
+            if raise_on_failure:
+                raise
+        else:
+            self.stats['flushes'] += 1
+            self.stats['written'] += self._drop(batch)
+            # Only now that the writes landed may the users' ETags change
+            for user_id, (_, edits) in batch.items():
+                etag.bump(self._db, user_id, *sorted({name for name, _ in edits}))
+            users_written = [user_id for user_id, (_, edits) in batch.items() if CURRENT_WEIGHT in edits]
+            if users_written and self._on_users_written is not None:
+                self._on_users_written(users_written)
+        finally:
+            with self._cond:
+                for user_id in batch:
+                    self._writing.pop(user_id).set()
+                # close() may be waiting for an inline flush to finish
+                self._cond.notify_all()
+
+    def _drop(self, batch):
+        """Forgets the retry state of a batch that is done with; returns its edit count."""
+        with self._cond:
+            for user_id in batch:
+                self._retries.pop(user_id, None)
+        return sum(len(entry[1]) for entry in batch.values())
+
+    def _requeue(self, batch):
+        """Puts a failed batch back in the queue; returns how many edits were dropped instead."""
+        lost = 0
+        now = time.monotonic()
+        with self._cond:
+            for user_id, (_, edits) in batch.items():
+                rounds, reserved_at, seqs = self._retries.pop(user_id, (0, None, {}))
+                rounds += 1
+                if rounds >= self.max_attempts:
+                    lost += len(edits)
+                    continue
+                self._retries[user_id] = (rounds, reserved_at, seqs)
+                _, newer = self._pending.pop(user_id, (None, {}))
+                merged = {**edits, **newer}
+                self._size += len(merged) - len(newer)
+                # Due again after the backoff (and the window)
+                self._pending[user_id] = (now + REQUEUE_BACKOFF * 2 ** (rounds - 1), merged)
+        return lost
+
+    # --- Background thread ---
+    def _start(self):
+        # Started lazily so each (forked) gunicorn worker runs its own thread
+        self._pending.clear()
+        self._writing.clear()
+        self._retries.clear()
+        self._size = 0
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = self._due_users(now)
+                    if due or (self._closed and not self._pending and not self._writing):
+                        break
+                    if self._pending:
+                        first_at = min(first_at for first_at, _ in self._pending.values())
+                        self._cond.wait(max(first_at + self.window - now, 0.005))
+                    else:
+                        self._cond.wait()
+                if not due:
+                    return
+                batch = self._take(due)
+            # While shutting down there is no later round to retry in
+            self._write(batch, requeue_on_failure=not self._closed)
+
+    def close(self, timeout=30):
+        """Stops accepting edits and writes the queued ones."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error("Write-behind did not finish within %ss; %d edits not written", timeout, self._size)
+
+    def cache_stats(self):
+        return {**self.stats, 'pending': self._size, 'users_pending': len(self._pending)}
@@ -30,6 +30,7 @@ export const AuthProvider = ({ children }) => {
       // The response is already parsed JSON from our helper
       const data = await apiFetch("/login", "POST", { email, password });
       localStorage.setItem("token", data.token);
+      localStorage.setItem("refresh_token", data.refresh_token);
       setToken(data.token);
 
       const profileData = await apiFetch("/profile");
@@ -71,9 +72,15 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Revoke the session server-side; the local logout doesn't wait for it
+    const refreshToken = localStorage.getItem("refresh_token");
+    if (localStorage.getItem("token")) {
+      apiFetch("/logout", "POST", { refresh_token: refreshToken }).catch(() => {});
+    }
     setUser(null);
     setToken(null);
     localStorage.removeItem("token");
+    localStorage.removeItem("refresh_token");
     navigate("/");
   };
 
@@ -2,11 +2,42 @@
 
 const BASE_URL = import.meta.env.VITE_API_URL; // Your Flask backend URL
 
+// Access tokens are short-lived; one refresh is shared by concurrent requests
+let refreshing = null;
+
 /**
- * A helper function for making API requests with fetch.
- * It automatically adds the auth token and handles response parsing and errors.
+ * Trades the stored refresh token for a new access and refresh token.
+ * Resolves to false if there is none or the server rejects it.
  */
-async function apiFetch(endpoint, method = 'GET', body = null) {
+function refreshTokens() {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) {
+    return Promise.resolve(false);
+  }
+  if (!refreshing) {
+    refreshing = fetch(`${BASE_URL}/token/refresh`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ refresh_token: refreshToken }),
+    })
+      .then(async (response) => {
+        if (!response.ok) {
+          return false;
+        }
+        const data = await response.json();
+        localStorage.setItem('token', data.token);
+        localStorage.setItem('refresh_token', data.refresh_token);
+        return true;
+      })
+      .catch(() => false)
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+}
+
+function send(endpoint, method, body) {
   const headers = new Headers({
     'Content-Type': 'application/json',
   });
@@ -26,7 +57,29 @@ async function apiFetch(endpoint, method = 'GET', body = null) {
     options.body = JSON.stringify(body);
   }
 
-  const response = await fetch(`${BASE_URL}${endpoint}`, options);
+  return fetch(`${BASE_URL}${endpoint}`, options);
+}
+
+/**
+ * A helper function for making API requests with fetch.
+ * It automatically adds the auth token, refreshes it once when the server
+ * rejects it, and handles response parsing and errors.
+ */
+async function apiFetch(endpoint, method = 'GET', body = null) {
+  let response = await send(endpoint, method, body);
+  if (response.status === 401 && localStorage.getItem('token') && (await refreshTokens())) {
+    response = await send(endpoint, method, body);
+  }
+
+  // Writes that change the token's claims (goals, weight) send renewed tokens
+  const renewedToken = response.headers.get('X-Access-Token');
+  if (renewedToken) {
+    localStorage.setItem('token', renewedToken);
+  }
+  const renewedRefreshToken = response.headers.get('X-Refresh-Token');
+  if (renewedRefreshToken) {
+    localStorage.setItem('refresh_token', renewedRefreshToken);
+  }
 
   // If the response is not OK (status is not 2xx), parse the error and throw it.
   if (!response.ok) {
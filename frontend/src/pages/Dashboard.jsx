@@ -114,8 +114,9 @@ const Dashboard = () => {
           error: "Failed to save activity.",
         }
       );
-      // Refetch the summary to update the net calories display
-      fetchSummary(selectedDate);
+      // Only calories burned changed, so update the net calories display
+      // locally instead of refetching the summary
+      setSummary((current) => ({ ...current, calories_burned: calories }));
     } catch (err) {
       // The toast.promise will handle showing the error toast
       console.error("Failed to save activity:", err);
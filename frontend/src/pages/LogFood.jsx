@@ -165,9 +165,11 @@ import { toast } from "react-toastify";
 import apiFetch from "../apiService";
 import Loader from "../components/Loader";
 
+const SEARCH_LIMIT = 20;
+const SEARCH_DELAY_MS = 250;
+
 const LogFood = () => {
   const [query, setQuery] = useState("");
-  const [allFoods, setAllFoods] = useState([]);
   const [filteredResults, setFilteredResults] = useState([]);
   const [loading, setLoading] = useState(false);
   const navigate = useNavigate();
@@ -182,29 +184,31 @@ const LogFood = () => {
   const logDate =
     location.state?.date || new Date().toISOString().split("T")[0];
 
+  // Ask the server for the best matches of what has been typed so far,
+  // once typing pauses, instead of downloading the whole food database
   useEffect(() => {
-    const fetchAllFoods = async () => {
+    const search = query.trim();
+    if (search === "") {
+      setFilteredResults([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
       try {
-        const data = await apiFetch("/foods?q=");
-        setAllFoods(data);
+        const data = await apiFetch(
+          `/foods?q=${encodeURIComponent(search)}&limit=${SEARCH_LIMIT}`
+        );
+        if (!cancelled) setFilteredResults(data);
       } catch (error) {
-        console.error("Failed to fetch food list:", error);
-        toast.error("Could not load your food database.");
+        console.error("Failed to search foods:", error);
+        if (!cancelled) toast.error("Could not search your food database.");
       }
+    }, SEARCH_DELAY_MS);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
     };
-    fetchAllFoods();
-  }, []);
-
-  useEffect(() => {
-    if (query.trim() === "") {
-      setFilteredResults([]);
-      return;
-    }
-    const results = allFoods.filter((food) =>
-      food.name.toLowerCase().includes(query.toLowerCase())
-    );
-    setFilteredResults(results);
-  }, [query, allFoods]);
+  }, [query]);
 
   const handleOpenModal = (food) => {
     setSelectedFood(food);
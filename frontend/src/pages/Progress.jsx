@@ -37,12 +37,12 @@ const Progress = () => {
     const fetchProgressData = async () => {
       try {
         setLoading(true);
-        // Use Promise.all to run all requests in parallel for faster loading
-        const [weightRes, calorieRes, checkRes] = await Promise.all([
-          apiFetch("/progress/weight"),
-          apiFetch("/progress/calories"),
-          apiFetch("/progress/check"),
-        ]);
+        // One request returns the weight history, calorie series and progress check
+        const {
+          weight: weightRes,
+          calories: calorieRes,
+          check: checkRes,
+        } = await apiFetch("/progress/bundle");
 
         // Process weight data
         if (weightRes && weightRes.length > 0) {